@@ -5,7 +5,7 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy import text
 from typing import Optional, Dict, Any
-from app.db.database import get_engine
+from app.db.database import get_async_engine
 from app.core.security import verify_token
 
 # OAuth2 scheme for token extraction
@@ -47,8 +47,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict[str, Any
         )
     
     try:
-        engine = get_engine()
-        with engine.connect() as conn:
+        engine = get_async_engine()
+        async with engine.connect() as conn:
             if role == "patient":
                 # Handle patient
                 patient_id = payload.get("id")
@@ -59,7 +59,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict[str, Any
                     else:
                         patient_id = int(sub)
                 
-                result = conn.execute(
+                result = await conn.execute(
                     text("SELECT patient_id, first_name, last_name FROM patients WHERE patient_id = :pid"),
                     {"pid": patient_id}
                 )
@@ -80,7 +80,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict[str, Any
             else:
                 # Handle staff
                 # sub is staff_id
-                result = conn.execute(
+                result = await conn.execute(
                     text("""
                         SELECT staff_id, name, email, role 
                         FROM staff 
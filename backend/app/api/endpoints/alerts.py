@@ -4,8 +4,11 @@ Alerts endpoints - fetch alerts for patients
 from fastapi import APIRouter, HTTPException, Depends
 from sqlalchemy import text
 from typing import List, Dict, Any, Optional
-from app.db.database import get_engine
+from app.db.database import get_async_engine
 from app.api.dependencies import get_current_user
+from app.api.endpoints import websocket
+from app.db.alert_rules import alert_acknowledged
+from app.websocket.alert_poller import alert_event
 
 router = APIRouter(prefix="/api/alerts", tags=["alerts"])
 
@@ -39,10 +42,10 @@ async def get_patient_alerts(
                 detail="You do not have permission to access this patient's alerts"
             )
 
-        engine = get_engine()
-        with engine.connect() as conn:
+        engine = get_async_engine()
+        async with engine.connect() as conn:
             # First verify patient exists
-            patient_check = conn.execute(
+            patient_check = await conn.execute(
                 text("SELECT patient_id FROM patients WHERE patient_id = :pid"),
                 {"pid": patient_id}
             )
@@ -50,7 +53,7 @@ async def get_patient_alerts(
                 raise HTTPException(status_code=404, detail=f"Patient {patient_id} not found")
             
             # Get alerts for patient
-            result = conn.execute(
+            result = await conn.execute(
                 text("""
                     SELECT alert_id, patient_id, alert_type, message, threshold,
                            created_at, acknowledged_at
@@ -93,10 +96,10 @@ async def get_unacknowledged_alerts(
                 detail="You do not have permission to access this patient's alerts"
             )
 
-        engine = get_engine()
-        with engine.connect() as conn:
+        engine = get_async_engine()
+        async with engine.connect() as conn:
             # First verify patient exists
-            patient_check = conn.execute(
+            patient_check = await conn.execute(
                 text("SELECT patient_id FROM patients WHERE patient_id = :pid"),
                 {"pid": patient_id}
             )
@@ -104,7 +107,7 @@ async def get_unacknowledged_alerts(
                 raise HTTPException(status_code=404, detail=f"Patient {patient_id} not found")
             
             # Get unacknowledged alerts for patient
-            result = conn.execute(
+            result = await conn.execute(
                 text("""
                     SELECT alert_id, patient_id, alert_type, message, threshold,
                            created_at, acknowledged_at
@@ -142,10 +145,10 @@ async def get_all_unacknowledged_alerts(
         )
     
     try:
-        engine = get_engine()
-        with engine.connect() as conn:
+        engine = get_async_engine()
+        async with engine.connect() as conn:
             # Get simulation start time
-            start_time_result = conn.execute(
+            start_time_result = await conn.execute(
                 text("""
                     SELECT config_value
                     FROM simulation_config
@@ -188,7 +191,7 @@ async def get_all_unacknowledged_alerts(
             
             # Get all alerts (acknowledged and unacknowledged) since simulation start
             # Filter to only show alerts for patients assigned to this staff member
-            result = conn.execute(
+            result = await conn.execute(
                 text(f"""
                     SELECT a.alert_id, a.patient_id, a.alert_type, a.threshold, a.message, 
                            a.created_at, a.acknowledged_at,
@@ -236,10 +239,10 @@ async def acknowledge_alert(
         )
     
     try:
-        engine = get_engine()
-        with engine.begin() as conn:
+        engine = get_async_engine()
+        async with engine.begin() as conn:
             # Update the acknowledged_at timestamp
-            update_result = conn.execute(
+            update_result = await conn.execute(
                 text("""
                     UPDATE alerts
                     SET acknowledged_at = NOW(6)
@@ -252,7 +255,7 @@ async def acknowledge_alert(
                 raise HTTPException(status_code=404, detail=f"Alert {alert_id} not found or already acknowledged")
             
             # Fetch the updated alert record
-            select_result = conn.execute(
+            select_result = await conn.execute(
                 text("""
                     SELECT alert_id, patient_id, alert_type, threshold, message, 
                            created_at, acknowledged_at
@@ -266,7 +269,17 @@ async def acknowledge_alert(
             if not updated_alert:
                 raise HTTPException(status_code=404, detail=f"Alert {alert_id} not found after update")
             
-            return dict(updated_alert._mapping)
+            alert_dict = dict(updated_alert._mapping)
+
+        alert_acknowledged(alert_dict)
+
+        # Push the acknowledgement (after commit) so other staff screens update
+        manager = websocket.manager
+        if manager:
+            await manager.broadcast_to_patient(
+                alert_dict["patient_id"], alert_event("alert_acknowledged", alert_dict), staff_only=True
+            )
+        return alert_dict
     except HTTPException:
         raise
     except Exception as e:
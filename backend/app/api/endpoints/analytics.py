@@ -4,7 +4,7 @@ Analytics endpoints - stored procedure integration
 from fastapi import APIRouter, HTTPException
 from sqlalchemy import text
 from typing import List, Dict, Any
-from app.db.database import get_engine
+from app.db.database import get_async_engine
 
 router = APIRouter(prefix="/api/analytics", tags=["analytics"])
 
@@ -22,10 +22,10 @@ async def get_patient_summary(patient_id: int) -> Dict[str, Any]:
         Patient summary with current vitals and alert count
     """
     try:
-        engine = get_engine()
-        with engine.connect() as conn:
+        engine = get_async_engine()
+        async with engine.connect() as conn:
             # Call stored procedure
-            result = conn.execute(
+            result = await conn.execute(
                 text("CALL sp_get_patient_summary(:id)"),
                 {"id": patient_id}
             )
@@ -62,10 +62,10 @@ async def get_hourly_stats() -> List[Dict[str, Any]]:
         List of hourly aggregated vital signs statistics
     """
     try:
-        engine = get_engine()
-        with engine.connect() as conn:
+        engine = get_async_engine()
+        async with engine.connect() as conn:
             # Call stored procedure
-            result = conn.execute(
+            result = await conn.execute(
                 text("CALL sp_aggregate_hourly_stats()")
             )
             
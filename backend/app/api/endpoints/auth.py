@@ -3,9 +3,10 @@ Authentication endpoints - OAuth2 password flow
 """
 from fastapi import APIRouter, HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordRequestForm
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy import text
 from typing import Dict, Any
-from app.db.database import get_engine
+from app.db.database import get_async_engine
 from app.core.security import verify_password, create_access_token
 
 router = APIRouter(prefix="/api", tags=["authentication"])
@@ -26,10 +27,10 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()) -> Dict[str, A
         HTTPException: If credentials are invalid
     """
     try:
-        engine = get_engine()
-        with engine.connect() as conn:
+        engine = get_async_engine()
+        async with engine.connect() as conn:
             # Query staff table by email (username field in OAuth2)
-            result = conn.execute(
+            result = await conn.execute(
                 text("""
                     SELECT staff_id, name, email, password_hash, role 
                     FROM staff 
@@ -46,8 +47,8 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()) -> Dict[str, A
                     headers={"WWW-Authenticate": "Bearer"},
                 )
             
-            # Verify password
-            if not verify_password(form_data.password, user.password_hash):
+            # Verify password (bcrypt is CPU-bound, keep it off the event loop)
+            if not await run_in_threadpool(verify_password, form_data.password, user.password_hash):
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
                     detail="Incorrect email or password",
@@ -82,8 +83,8 @@ async def login_patient(form_data: OAuth2PasswordRequestForm = Depends()) -> Dic
     OAuth2 compatible token login for patients, get an access token for future requests
     """
     try:
-        engine = get_engine()
-        with engine.connect() as conn:
+        engine = get_async_engine()
+        async with engine.connect() as conn:
             # Find patient by ID (using username field as ID)
             # We expect username to be the patient_id for simplicity, or maybe email if we added it.
             # Let's assume username is patient_id for now as per requirement "dynamic url" often implies ID.
@@ -100,10 +101,10 @@ async def login_patient(form_data: OAuth2PasswordRequestForm = Depends()) -> Dic
                 
             patient_id = int(patient_id_str)
             
-            result = conn.execute(
+            result = (await conn.execute(
                 text("SELECT patient_id, password_hash FROM patients WHERE patient_id = :pid"),
                 {"pid": patient_id}
-            ).fetchone()
+            )).fetchone()
             
             if not result:
                 raise HTTPException(
@@ -113,7 +114,9 @@ async def login_patient(form_data: OAuth2PasswordRequestForm = Depends()) -> Dic
                 )
                 
             # Verify password
-            if not result.password_hash or not verify_password(form_data.password, result.password_hash):
+            if not result.password_hash or not await run_in_threadpool(
+                verify_password, form_data.password, result.password_hash
+            ):
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
                     detail="Incorrect patient ID or password",
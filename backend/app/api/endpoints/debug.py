@@ -0,0 +1,57 @@
+"""
+Debug endpoints - SQL statement statistics (admins only)
+"""
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import Dict, Any
+from app.db.query_stats import ORDER_KEYS, QUERY_STATS, SLOW_QUERY_MS, get_query_stats
+from app.api.dependencies import get_current_user
+
+router = APIRouter(prefix="/debug", tags=["debug"])
+
+
+def _require_admin(current_user: Dict[str, Any]):
+    """Raise 403 unless the user is an admin."""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+
+@router.get("/queries")
+async def get_queries(
+    limit: int = Query(20, ge=1, le=500),
+    order_by: str = Query("total", pattern="^(" + "|".join(ORDER_KEYS) + ")$"),
+    current_user: Dict[str, Any] = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Get the top SQL statements of this process by database time.
+
+    Args:
+        limit: Number of statements to return
+        order_by: total, max, mean, count, rows or errors
+
+    Returns:
+        Collection window, slow threshold and the top normalized statements
+        with count, total/mean/max time, rows, failed executions and the
+        last EXPLAIN plan
+    """
+    _require_admin(current_user)
+    stats = get_query_stats()
+    return {
+        "enabled": QUERY_STATS,
+        "since": stats.since,
+        "slow_query_ms": SLOW_QUERY_MS,
+        "statements": len(stats.entries),
+        "queries": stats.top(limit, order_by),
+    }
+
+
+@router.post("/queries/reset")
+async def reset_queries(current_user: Dict[str, Any] = Depends(get_current_user)) -> Dict[str, str]:
+    """
+    Clear the SQL statement statistics (e.g. before a load test).
+
+    Returns:
+        Confirmation message
+    """
+    _require_admin(current_user)
+    get_query_stats().reset()
+    return {"message": "Query statistics reset"}
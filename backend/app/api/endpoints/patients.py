@@ -6,7 +6,9 @@ from sqlalchemy import text
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel, Field
 from datetime import date
-from app.db.database import get_engine
+from app.db.database import get_async_engine
+from app.db.admissions import invalidate_admissions
+from app.db.summary_cache import get_patient_summary as get_cached_patient_summary, invalidate_patient_summary
 from app.api.dependencies import get_current_user
 from app.core.encryption import encrypt_medical_history
 from app.api.endpoints import websocket
@@ -37,12 +39,12 @@ async def list_patients(
         List of patient records
     """
     try:
-        engine = get_engine()
-        with engine.connect() as conn:
+        engine = get_async_engine()
+        async with engine.connect() as conn:
             # If patient, return only their own record
             if current_user.get("role") == "patient":
                 patient_id = current_user.get("id") or current_user.get("sub")
-                result = conn.execute(
+                result = await conn.execute(
                     text("""
                         SELECT patient_id, first_name, last_name, dob, gender, room_id, created_at 
                         FROM patients 
@@ -73,7 +75,7 @@ async def list_patients(
                 # Debug logging
                 print(f"DEBUG list_patients: role={current_user.get('role')}, staff_id={staff_id}, current_user={current_user}")
                 
-                result = conn.execute(
+                result = await conn.execute(
                     text("""
                         SELECT DISTINCT p.patient_id, p.first_name, p.last_name, p.dob, p.gender, p.room_id, p.created_at
                         FROM patients p
@@ -113,9 +115,9 @@ async def get_patient(patient_id: int) -> Dict[str, Any]:
         Patient record (without encrypted medical_history)
     """
     try:
-        engine = get_engine()
-        with engine.connect() as conn:
-            result = conn.execute(
+        engine = get_async_engine()
+        async with engine.connect() as conn:
+            result = await conn.execute(
                 text("""
                     SELECT patient_id, first_name, last_name, dob, gender, 
                            contact_info, room_id, created_at, updated_at 
@@ -166,10 +168,10 @@ async def get_patient_history(
                 detail="You do not have permission to access this patient's history"
             )
 
-        engine = get_engine()
-        with engine.connect() as conn:
+        engine = get_async_engine()
+        async with engine.connect() as conn:
             # First verify patient exists
-            patient_check = conn.execute(
+            patient_check = await conn.execute(
                 text("SELECT patient_id FROM patients WHERE patient_id = :pid"),
                 {"pid": patient_id}
             )
@@ -177,7 +179,7 @@ async def get_patient_history(
                 raise HTTPException(status_code=404, detail=f"Patient {patient_id} not found")
             
             # Get vital signs history
-            result = conn.execute(
+            result = await conn.execute(
                 text("""
                     SELECT vitals_id, patient_id, device_id, ts, heart_rate, spo2,
                            bp_systolic, bp_diastolic, temperature_c, respiration,
@@ -221,10 +223,10 @@ async def get_patient_device(
                 detail="You do not have permission to access this patient's device information"
             )
 
-        engine = get_engine()
-        with engine.connect() as conn:
+        engine = get_async_engine()
+        async with engine.connect() as conn:
             # First verify patient exists
-            patient_check = conn.execute(
+            patient_check = await conn.execute(
                 text("SELECT patient_id FROM patients WHERE patient_id = :pid"),
                 {"pid": patient_id}
             )
@@ -232,7 +234,7 @@ async def get_patient_device(
                 raise HTTPException(status_code=404, detail=f"Patient {patient_id} not found")
             
             # Get most recent device assignment with manufacturer from metadata
-            result = conn.execute(
+            result = await conn.execute(
                 text("""
                     SELECT 
                         d.device_type, 
@@ -285,10 +287,10 @@ async def create_patient(
         if patient_data.medical_history:
             encrypted_history = encrypt_medical_history(patient_data.medical_history)
         
-        engine = get_engine()
-        with engine.begin() as conn:  # Use begin() for transaction
+        engine = get_async_engine()
+        async with engine.begin() as conn:  # Use begin() for transaction
             # Insert patient
-            result = conn.execute(
+            result = await conn.execute(
                 text("""
                     INSERT INTO patients (
                         first_name, last_name, dob, gender, 
@@ -311,7 +313,7 @@ async def create_patient(
             
             # Get the inserted patient
             patient_id = result.lastrowid
-            patient_result = conn.execute(
+            patient_result = await conn.execute(
                 text("""
                     SELECT patient_id, first_name, last_name, dob, gender,
                            contact_info, created_at, updated_at
@@ -348,10 +350,10 @@ async def delete_patient(
         No content (204)
     """
     try:
-        engine = get_engine()
-        with engine.begin() as conn:  # Use begin() for transaction
+        engine = get_async_engine()
+        async with engine.begin() as conn:  # Use begin() for transaction
             # First verify patient exists
-            patient_check = conn.execute(
+            patient_check = await conn.execute(
                 text("SELECT patient_id FROM patients WHERE patient_id = :pid"),
                 {"pid": patient_id}
             )
@@ -359,12 +361,14 @@ async def delete_patient(
                 raise HTTPException(status_code=404, detail=f"Patient {patient_id} not found")
             
             # Delete patient (cascade will handle related records)
-            conn.execute(
+            await conn.execute(
                 text("DELETE FROM patients WHERE patient_id = :pid"),
                 {"pid": patient_id}
             )
-            
-            return None
+
+        invalidate_admissions()
+        invalidate_patient_summary(patient_id)
+        return None
     except HTTPException:
         raise
     except Exception as e:
@@ -377,7 +381,9 @@ async def get_patient_summary(
     current_user: Dict[str, Any] = Depends(get_current_user)
 ) -> Dict[str, Any]:
     """
-    Get patient summary from vw_patient_summary view.
+    Get patient summary (vw_patient_summary fields).
+    Served from the per-patient snapshot cache kept current by the vitals
+    and alert broadcasts; the view is only queried on a cold miss.
     Provides consolidated patient info including:
     - Demographics (name, gender, room)
     - Latest vital readings
@@ -401,39 +407,11 @@ async def get_patient_summary(
                 detail="You do not have permission to access this patient's summary"
             )
 
-        engine = get_engine()
-        with engine.connect() as conn:
-            # Get patient summary from view
-            result = conn.execute(
-                text("""
-                    SELECT 
-                        patient_id,
-                        full_name,
-                        gender,
-                        room_id,
-                        total_vital_readings,
-                        last_vital_ts,
-                        latest_heart_rate,
-                        latest_spo2,
-                        latest_bp_systolic,
-                        latest_bp_diastolic,
-                        latest_temperature_c,
-                        latest_respiration,
-                        alerts_last_24h,
-                        unresolved_alerts,
-                        admission_status,
-                        admitted_at
-                    FROM vw_patient_summary
-                    WHERE patient_id = :pid
-                """),
-                {"pid": patient_id}
-            )
-            summary = result.fetchone()
-            
-            if not summary:
-                raise HTTPException(status_code=404, detail=f"Patient {patient_id} not found")
-            
-            return dict(summary._mapping)
+        summary = await get_cached_patient_summary(patient_id)
+        if not summary:
+            raise HTTPException(status_code=404, detail=f"Patient {patient_id} not found")
+
+        return summary
     except HTTPException:
         raise
     except Exception as e:
@@ -469,10 +447,10 @@ async def get_patient_daily_stats(
             from datetime import date as date_type
             stats_date = date_type.today()
 
-        engine = get_engine()
-        with engine.connect() as conn:
+        engine = get_async_engine()
+        async with engine.connect() as conn:
             # First verify patient exists
-            patient_check = conn.execute(
+            patient_check = await conn.execute(
                 text("SELECT patient_id FROM patients WHERE patient_id = :pid"),
                 {"pid": patient_id}
             )
@@ -480,7 +458,7 @@ async def get_patient_daily_stats(
                 raise HTTPException(status_code=404, detail=f"Patient {patient_id} not found")
             
             # Call the stored procedure
-            result = conn.execute(
+            result = await conn.execute(
                 text("CALL aggregate_daily_stats(:pid, :stats_date)"),
                 {"pid": patient_id, "stats_date": stats_date}
             )
@@ -533,10 +511,10 @@ async def create_emergency_alert(
         Created alert record
     """
     try:
-        engine = get_engine()
-        with engine.begin() as conn:
+        engine = get_async_engine()
+        async with engine.begin() as conn:
             # Verify patient exists and get patient info
-            patient_result = conn.execute(
+            patient_result = await conn.execute(
                 text("""
                     SELECT patient_id, first_name, last_name, room_id
                     FROM patients
@@ -554,7 +532,7 @@ async def create_emergency_alert(
             room_id = patient_dict.get('room_id') or f"Room {patient_id}"
             
             # Create emergency alert
-            alert_result = conn.execute(
+            alert_result = await conn.execute(
                 text("""
                     INSERT INTO alerts (
                         patient_id,
@@ -580,7 +558,7 @@ async def create_emergency_alert(
             alert_id = alert_result.lastrowid
             
             # Get the created alert
-            alert_result = conn.execute(
+            alert_result = await conn.execute(
                 text("""
                     SELECT alert_id, patient_id, alert_type, message, threshold, created_at, acknowledged_at
                     FROM alerts
@@ -624,6 +602,7 @@ async def create_emergency_alert(
                     "type": "emergency_alert",
                     "alert": {
                         "id": f"emergency-{patient_id}",
+                        "alert_id": alert_dict["alert_id"],  # Lets clients match the alert_created event and REST rows
                         "type": "Emergency Help Request",
                         "patient": patient_name,
                         "severity": "Critical",
@@ -634,7 +613,7 @@ async def create_emergency_alert(
                     }
                 }
                 print(f"🚨 Broadcasting emergency alert: {alert_message}")
-                await manager.broadcast(alert_message)
+                await manager.broadcast_to_patient(patient_id, alert_message)
                 print(f"✅ Emergency alert broadcasted to {len(manager.active_connections)} connected clients")
             else:
                 print("⚠️ Warning: WebSocket manager not available for emergency alert broadcast")
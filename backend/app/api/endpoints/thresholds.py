@@ -5,7 +5,8 @@ from fastapi import APIRouter, HTTPException, Depends
 from sqlalchemy import text
 from typing import List, Dict, Any
 from pydantic import BaseModel, Field
-from app.db.database import get_engine
+from app.db.database import get_async_engine
+from app.db.alert_rules import invalidate_thresholds
 from app.api.dependencies import get_current_user
 
 router = APIRouter(prefix="/api/thresholds", tags=["thresholds"])
@@ -28,9 +29,9 @@ async def list_thresholds() -> List[Dict[str, Any]]:
         List of threshold records
     """
     try:
-        engine = get_engine()
-        with engine.connect() as conn:
-            result = conn.execute(
+        engine = get_async_engine()
+        async with engine.connect() as conn:
+            result = await conn.execute(
                 text("SELECT threshold_id, name, type, min_value, max_value, unit, patient_id, created_by, notes, created_at FROM thresholds ORDER BY name, type")
             )
             thresholds = [dict(row._mapping) for row in result]
@@ -51,9 +52,9 @@ async def get_thresholds_by_name(name: str) -> List[Dict[str, Any]]:
         List of threshold records for the given name (warning and danger)
     """
     try:
-        engine = get_engine()
-        with engine.connect() as conn:
-            result = conn.execute(
+        engine = get_async_engine()
+        async with engine.connect() as conn:
+            result = await conn.execute(
                 text("SELECT threshold_id, name, type, min_value, max_value, unit, patient_id, created_by, notes, created_at FROM thresholds WHERE name = :name ORDER BY type"),
                 {"name": name}
             )
@@ -96,10 +97,10 @@ async def update_threshold(
         raise HTTPException(status_code=400, detail="Threshold type in body must match URL parameter")
     
     try:
-        engine = get_engine()
-        with engine.connect() as conn:
+        engine = get_async_engine()
+        async with engine.connect() as conn:
             # Check if threshold exists
-            check_result = conn.execute(
+            check_result = await conn.execute(
                 text("SELECT threshold_id FROM thresholds WHERE name = :name AND type = :type"),
                 {"name": name, "type": threshold_type}
             )
@@ -107,7 +108,7 @@ async def update_threshold(
             
             if existing:
                 # Update existing threshold
-                conn.execute(
+                await conn.execute(
                     text("""
                         UPDATE thresholds 
                         SET min_value = :min_value, max_value = :max_value
@@ -120,10 +121,10 @@ async def update_threshold(
                         "max_value": threshold_data.max_value
                     }
                 )
-                conn.commit()
+                await conn.commit()
             else:
                 # Insert new threshold
-                conn.execute(
+                await conn.execute(
                     text("""
                         INSERT INTO thresholds (name, type, min_value, max_value)
                         VALUES (:name, :type, :min_value, :max_value)
@@ -135,10 +136,11 @@ async def update_threshold(
                         "max_value": threshold_data.max_value
                     }
                 )
-                conn.commit()
+                await conn.commit()
+            invalidate_thresholds()
             
             # Fetch and return updated threshold
-            result = conn.execute(
+            result = await conn.execute(
                 text("SELECT threshold_id, name, type, min_value, max_value, unit, patient_id, created_by, notes, created_at FROM thresholds WHERE name = :name AND type = :type"),
                 {"name": name, "type": threshold_type}
             )
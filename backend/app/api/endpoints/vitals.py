@@ -0,0 +1,91 @@
+"""
+Vitals ingest endpoint - bedside gateways post readings here
+"""
+import json
+import os
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Union
+from fastapi import APIRouter, HTTPException, Depends
+from pydantic import BaseModel, Field
+from app.api.dependencies import get_current_user
+from app.db.ingest import IngestBufferFull, get_ingest_buffer
+from app.core.tracing import stamp_reading
+
+router = APIRouter(prefix="/api/vitals", tags=["vitals"])
+
+INGEST_MAX_REQUEST_ROWS = int(os.getenv("INGEST_MAX_REQUEST_ROWS", "5000"))
+
+
+# Pydantic models for request/response
+class VitalReading(BaseModel):
+    patient_id: int = Field(..., ge=1)
+    device_id: Optional[int] = Field(None, ge=0)
+    ts: Optional[datetime] = None  # Defaults to the time the reading is received
+    heart_rate: Optional[int] = None
+    spo2: Optional[int] = None
+    bp_systolic: Optional[int] = None
+    bp_diastolic: Optional[int] = None
+    temperature_c: Optional[float] = None
+    respiration: Optional[int] = None
+    metadata: Optional[Dict[str, Any]] = None
+
+
+def _to_row(reading: VitalReading, received_at: datetime) -> Dict[str, Any]:
+    """Convert a reading to INSERT parameters."""
+    row = reading.model_dump()
+    ts = row["ts"] or received_at
+    if ts.tzinfo is not None:
+        # vitals.ts is a naive local DATETIME, like the simulator writes
+        ts = ts.astimezone().replace(tzinfo=None)
+    row["ts"] = ts
+    # Trace id and ingest time for end-to-end latency tracing (see app.core.tracing)
+    stamp_reading(row, received_at.timestamp())
+    if isinstance(row["metadata"], dict):
+        row["metadata"] = json.dumps(row["metadata"])
+    return row
+
+
+@router.post("", status_code=201)
+async def ingest_vitals(
+    readings: Union[VitalReading, List[VitalReading]],
+    current_user: Dict[str, Any] = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Ingest one reading or an array of readings (staff / gateway accounts only).
+
+    Readings from all callers are written together in micro-batches; the
+    response is sent once this request's rows are committed.
+
+    Returns:
+        {"accepted": n, "rejected": [{"index": i, "error": "..."}]}
+
+    Raises:
+        429 if the ingest buffer is full (retry after a short delay)
+    """
+    # Access Control: patients cannot write vitals
+    if current_user["role"] == "patient":
+        raise HTTPException(
+            status_code=403,
+            detail="You do not have permission to ingest vitals"
+        )
+
+    if not isinstance(readings, list):
+        readings = [readings]
+    if len(readings) > INGEST_MAX_REQUEST_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many readings in one request (max {INGEST_MAX_REQUEST_ROWS})"
+        )
+
+    received_at = datetime.now()
+    rows = [_to_row(reading, received_at) for reading in readings]
+
+    try:
+        errors = await get_ingest_buffer().submit(rows)
+    except IngestBufferFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    rejected = [{"index": index, "error": error} for index, error in enumerate(errors) if error is not None]
+    return {"accepted": len(rows) - len(rejected), "rejected": rejected}
@@ -1,8 +1,14 @@
 """
 WebSocket endpoints for real-time updates
 """
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from app.websocket.connection_manager import ConnectionManager
+import json
+from typing import List, Dict, Any, Optional
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException
+from sqlalchemy import text
+from app.db.database import get_async_engine
+from app.api.dependencies import get_current_user
+from app.websocket.connection_manager import ConnectionManager, STAFF_ROLES
+from app.websocket.encoding import ENCODING_JSON, available_encodings
 
 router = APIRouter(tags=["websocket"])
 
@@ -16,30 +22,287 @@ def set_manager(mgr: ConnectionManager):
     manager = mgr
 
 
+async def get_assigned_patient_ids(staff_id: int) -> List[int]:
+    """
+    Get the patients assigned to a staff member via staff_patients.
+
+    Args:
+        staff_id: Staff ID
+
+    Returns:
+        List of assigned patient IDs
+    """
+    engine = get_async_engine()
+    async with engine.connect() as conn:
+        result = await conn.execute(
+            text("SELECT DISTINCT patient_id FROM staff_patients WHERE staff_id = :staff_id"),
+            {"staff_id": int(staff_id)}
+        )
+        return [row[0] for row in result]
+
+
+async def _authenticate(websocket: WebSocket, token: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Authenticate a connection with a JWT and remember the user on the manager.
+
+    Returns:
+        User dictionary, or None if authentication failed
+    """
+    if not token:
+        await _send_error(websocket, "Missing token")
+        return None
+    try:
+        user = await get_current_user(token)
+    except HTTPException as e:
+        await _send_error(websocket, e.detail)
+        return None
+
+    manager.set_user(websocket, user)
+    await manager.send_personal_message(json.dumps({
+        "type": "auth_ok",
+        "id": user["id"],
+        "role": user["role"]
+    }), websocket)
+    return user
+
+
+async def _send_error(websocket: WebSocket, detail: str):
+    """Send a protocol error to a single client."""
+    await manager.send_personal_message(json.dumps({"type": "error", "detail": detail}), websocket)
+
+
+async def _handle_subscribe(websocket: WebSocket, message: Dict[str, Any]):
+    """
+    Handle a subscribe request.
+
+    Accepted forms:
+        {"action": "subscribe", "patient_ids": [1, 2, 3]}
+        {"action": "subscribe", "scope": "assigned"}
+
+    Either form may carry "resume_from" and "epoch" (see _handle_resume):
+    the missed frames are then queued right after subscribing, before any
+    live frame for the new subscriptions, so the client sees seqs in order.
+    """
+    user = manager.get_user(websocket)
+    if user is None:
+        await _send_error(websocket, "Authenticate before subscribing")
+        return
+
+    role = user.get("role")
+    if message.get("scope") == "assigned":
+        if role == "patient":
+            patient_ids = [user["id"]]
+        elif role in STAFF_ROLES:
+            try:
+                patient_ids = await get_assigned_patient_ids(user["id"])
+            except Exception as e:
+                await _send_error(websocket, f"Database error: {str(e)}")
+                return
+        else:
+            patient_ids = []
+    else:
+        try:
+            patient_ids = [int(pid) for pid in message.get("patient_ids") or []]
+        except (TypeError, ValueError):
+            await _send_error(websocket, "patient_ids must be a list of integers")
+            return
+
+        # Access Control:
+        # - Staff can subscribe to any patient
+        # - Patients can only subscribe to their own data
+        if role == "patient" and any(pid != user["id"] for pid in patient_ids):
+            await _send_error(websocket, "You do not have permission to subscribe to other patients")
+            return
+
+    # No await may suspend between subscribe() and resume(): a broadcast in
+    # between would be queued ahead of older replayed frames
+    subscribed = manager.subscribe(websocket, patient_ids)
+    await manager.send_personal_message(json.dumps({
+        "type": "subscribed",
+        "patient_ids": sorted(subscribed)
+    }), websocket)
+    if message.get("resume_from") is not None:
+        await _handle_resume(websocket, message["resume_from"], message.get("epoch"))
+
+
+async def _handle_set_encoding(websocket: WebSocket, message: Dict[str, Any]):
+    """
+    Handle an encoding change.
+
+    Accepted form:
+        {"action": "set_encoding", "encoding": "msgpack"}
+    """
+    encoding = message.get("encoding")
+    if not manager.set_encoding(websocket, encoding):
+        await _send_error(websocket, f"Unsupported encoding: {encoding}. Available: {available_encodings()}")
+        return
+    await manager.send_personal_message(json.dumps({"type": "encoding", "encoding": encoding}), websocket)
+
+
+async def _handle_set_stream(websocket: WebSocket, message: Dict[str, Any]):
+    """
+    Handle a stream mode change.
+
+    Accepted form:
+        {"action": "set_stream", "mode": "delta"}   ("full" to switch back)
+    """
+    mode = message.get("mode")
+    if not manager.set_stream_mode(websocket, mode):
+        await _send_error(websocket, f"Unsupported stream mode: {mode}")
+        return
+    await manager.send_personal_message(json.dumps({"type": "stream", "mode": mode}), websocket)
+
+
+async def _handle_unsubscribe(websocket: WebSocket, message: Dict[str, Any]):
+    """
+    Handle an unsubscribe request.
+
+    Accepted forms:
+        {"action": "unsubscribe", "patient_ids": [1, 2]}
+        {"action": "unsubscribe"}  (all patients)
+    """
+    patient_ids = message.get("patient_ids")
+    try:
+        remaining = manager.unsubscribe(
+            websocket,
+            None if patient_ids is None else [int(pid) for pid in patient_ids]
+        )
+    except (TypeError, ValueError):
+        await _send_error(websocket, "patient_ids must be a list of integers")
+        return
+
+    await manager.send_personal_message(json.dumps({
+        "type": "subscribed",
+        "patient_ids": sorted(remaining)
+    }), websocket)
+
+
+async def _handle_resume(websocket: WebSocket, resume_from: Any, epoch: Optional[str]):
+    """
+    Replay the broadcasts missed since resume_from, or ask the client to resync.
+
+    Accepted form:
+        {"action": "resume", "resume_from": 1234, "epoch": "<epoch from hello>"}
+    """
+    try:
+        resume_from = int(resume_from)
+    except (TypeError, ValueError):
+        await _send_error(websocket, "resume_from must be an integer")
+        return
+
+    replayed = manager.resume(websocket, resume_from, epoch)
+    if replayed is None:
+        # Too old (or from another server process): reload over REST
+        await manager.send_personal_message(json.dumps({
+            "type": "resync",
+            "resume_from": resume_from,
+            **manager.replay_position()
+        }), websocket)
+        return
+    await manager.send_personal_message(json.dumps({
+        "type": "resumed",
+        "resume_from": resume_from,
+        "replayed": replayed,
+        **manager.replay_position()
+    }), websocket)
+
+
 @router.websocket("/ws/vitals")
-async def websocket_vitals(websocket: WebSocket):
+async def websocket_vitals(
+    websocket: WebSocket,
+    token: Optional[str] = None,
+    encoding: str = ENCODING_JSON,
+    resume_from: Optional[int] = None,
+    epoch: Optional[str] = None,
+    firehose: bool = True
+):
     """
     WebSocket endpoint for real-time vital signs updates.
-    
+
     Clients connect to this endpoint to receive live updates when new
     vital signs data is inserted into the database.
+
+    Subscription protocol (JSON text messages from the client):
+        {"action": "auth", "token": "<jwt>"}   (or ?token=<jwt> on connect)
+        {"action": "subscribe", "patient_ids": [1, 2]}
+        {"action": "subscribe", "scope": "assigned"}
+        {"action": "subscribe", ..., "resume_from": <seq>, "epoch": "<epoch>"}
+        {"action": "unsubscribe", "patient_ids": [1]}
+        {"action": "set_encoding", "encoding": "msgpack"}   (or ?encoding=...)
+        {"action": "set_stream", "mode": "delta"}
+        {"action": "resume", "resume_from": <seq>, "epoch": "<epoch>"}   (or ?resume_from=...&epoch=...)
+        {"action": "pong"}   (reply to the server's {"type": "ping"} heartbeat)
+
+    Data frames use the negotiated encoding (json, msgpack, columnar or
+    columnar_msgpack); control frames are always JSON text.
+
+    In delta stream mode vitals arrive as "vitals_delta" frames whose rows
+    carry patient_id, vitals_id, ts and only the fields that changed since
+    the previous row sent for that patient. Rows flagged "keyframe" are
+    complete; one is sent on subscribe and periodically afterwards.
+
+    Every push frame carries a "seq"; the first frame on a connection is
+    {"type": "hello", "epoch": ..., "seq": ...}. A reconnecting client that
+    subscribes puts the last seq it saw on the subscribe message and gets
+    the frames it missed followed by "resumed", or "resync" if the gap is
+    no longer buffered. The standalone resume action and query-string form
+    replay for the current subscriptions (everything for firehose clients).
+
+    Once subscribed, a client only receives updates for its patients.
+    Clients that never subscribe receive every update, unless they connect
+    with ?firehose=0 to announce that they will subscribe (then nothing is
+    sent to them before they do, and no firehose frames move their resume
+    position). Clients that send nothing within the heartbeat timeout are
+    disconnected.
     """
     if manager is None:
         await websocket.close(code=1013, reason="Server not ready")
         return
-    
-    await manager.connect(websocket)
-    
+
+    if encoding not in available_encodings():
+        await websocket.close(code=1003, reason=f"Unsupported encoding: {encoding}")
+        return
+
+    await manager.connect(websocket, encoding=encoding, firehose=firehose)
+    await manager.send_personal_message(json.dumps({"type": "hello", **manager.replay_position()}), websocket)
+
     try:
-        # Keep connection alive and wait for messages
+        if token:
+            await _authenticate(websocket, token)
+        if resume_from is not None:
+            await _handle_resume(websocket, resume_from, epoch)
+
         while True:
-            # Optionally receive messages from client (ping/pong, etc.)
             data = await websocket.receive_text()
-            # Echo back or handle client messages if needed
-            # For now, we just keep the connection alive
+            # Any inbound message counts as a heartbeat response
+            manager.touch(websocket)
+            try:
+                message = json.loads(data)
+            except ValueError:
+                # Plain-text keepalives (e.g. "ping") are ignored
+                continue
+            if not isinstance(message, dict):
+                continue
+
+            action = message.get("action")
+            if action == "pong":
+                continue
+            elif action == "auth":
+                await _authenticate(websocket, message.get("token"))
+            elif action == "subscribe":
+                await _handle_subscribe(websocket, message)
+            elif action == "set_stream":
+                await _handle_set_stream(websocket, message)
+            elif action == "set_encoding":
+                await _handle_set_encoding(websocket, message)
+            elif action == "unsubscribe":
+                await _handle_unsubscribe(websocket, message)
+            elif action == "resume":
+                await _handle_resume(websocket, message.get("resume_from"), message.get("epoch"))
+            else:
+                await _send_error(websocket, f"Unknown action: {action}")
     except WebSocketDisconnect:
         manager.disconnect(websocket)
     except Exception as e:
         print(f"WebSocket error: {e}")
         manager.disconnect(websocket)
-
@@ -0,0 +1,321 @@
+"""
+In-process metrics rendered in the Prometheus text format (GET /metrics)
+
+Counters and histograms are updated on the hot paths: HTTP requests,
+connection pool checkouts, poller cycles, WebSocket fan-out, ingest flushes
+and bcrypt. Each update is a bisect and a few integer additions under a
+lock, so they are left on in production (METRICS_ENABLED=0 turns the
+updates off). Gauges such as pool usage, poller lag, WebSocket connections
+and queue depths are read from the running components when /metrics is
+scraped, and the vitals tracing stages (app.core.tracing) are exported as
+the vitals_stage_seconds histogram.
+
+Each process keeps its own metrics; with several uvicorn workers, scrape
+each worker (or run one) to see them all.
+"""
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Any, List, Optional, Tuple, Callable
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Bucket upper bounds (seconds unless noted)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+POOL_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+BCRYPT_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0)
+ROW_BUCKETS = (0, 1, 10, 50, 100, 250, 500, 1000, 5000)  # rows
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """Monotonic counter, optionally labelled."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: Dict[Tuple[Any, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels: Any):
+        """Add to the counter (label values in labelnames order)."""
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge:
+    """Gauge read from a callback at scrape time."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        read: Callable[[], Any],
+        labelnames: Tuple[str, ...] = ()
+    ):
+        """
+        Args:
+            name: Metric name
+            documentation: HELP text
+            read: Returns a number, or {label values tuple: number} if labelled;
+                  None leaves the metric without samples
+            labelnames: Label names
+        """
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+        self.labelnames = labelnames
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.read()
+        except Exception:
+            value = None
+        if value is None:
+            return lines
+        samples = value if isinstance(value, dict) else {(): value}
+        for labels, sample in sorted(samples.items()):
+            if sample is not None:
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(sample)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally labelled."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+        labelnames: Tuple[str, ...] = ()
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.labelnames = labelnames
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self.series: Dict[Tuple[Any, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: Any):
+        """Record one observation (label values in labelnames order)."""
+        if not METRICS_ENABLED:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(series[0]), series[1], series[2]) for labels, series in self.series.items()]
+        for labels, counts, total, count in sorted(snapshot, key=lambda item: item[0]):
+            lines.extend(render_histogram(self.name, self.buckets, counts, total, count, self.labelnames, labels))
+        return lines
+
+
+def render_histogram(
+    name: str,
+    buckets: Tuple[float, ...],
+    counts: List[int],
+    total: float,
+    count: int,
+    labelnames: Tuple[str, ...] = (),
+    labels: Tuple[Any, ...] = ()
+) -> List[str]:
+    """Sample lines of one histogram series from per-bucket (non-cumulative) counts."""
+    lines = []
+    cumulative = 0
+    for bound, bucket_count in zip(buckets + (math.inf,), counts):
+        cumulative += bucket_count
+        le = f'le="{_format_value(bound)}"'
+        lines.append(f"{name}_bucket{_format_labels(labelnames, labels, le)} {cumulative}")
+    lines.append(f"{name}_sum{_format_labels(labelnames, labels)} {_format_value(total)}")
+    lines.append(f"{name}_count{_format_labels(labelnames, labels)} {count}")
+    return lines
+
+
+# ----------------------------------------------------------------------
+# Hot-path metrics
+# ----------------------------------------------------------------------
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    labelnames=("method", "route", "status")
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    "db_pool_checkout_seconds", "Time to get a connection from the pool (including opening one)",
+    buckets=POOL_WAIT_BUCKETS, labelnames=("engine",)
+)
+POLLER_CYCLE_SECONDS = Histogram("poller_cycle_duration_seconds", "Duration of one vitals poller cycle")
+POLLER_CYCLE_ROWS = Histogram("poller_cycle_rows", "Rows broadcast per vitals poller cycle", buckets=ROW_BUCKETS)
+WS_BROADCAST_SECONDS = Histogram(
+    "ws_broadcast_duration_seconds", "Time to route, encode and queue one vitals broadcast for every client"
+)
+WS_BROADCAST_ROWS = Counter("ws_broadcast_rows_total", "Vitals rows broadcast over WebSocket")
+INGEST_ROWS = Counter("ingest_rows_total", "Vitals rows handled by the ingest buffer", labelnames=("result",))
+BCRYPT_VERIFY_SECONDS = Histogram("bcrypt_verify_duration_seconds", "bcrypt password verification time", buckets=BCRYPT_BUCKETS)
+
+
+# ----------------------------------------------------------------------
+# Scrape-time gauges (components are imported lazily to avoid import cycles)
+# ----------------------------------------------------------------------
+
+_connection_manager = None
+
+
+def set_connection_manager(manager):
+    """Register the WebSocket connection manager whose state is exported."""
+    global _connection_manager
+    _connection_manager = manager
+
+
+def _pools() -> Dict[str, Any]:
+    from app.db import database
+    pools = {}
+    if database._engine is not None:
+        pools["sync"] = database._engine.pool
+    if database._async_engine is not None:
+        pools["async"] = database._async_engine.sync_engine.pool
+    return pools
+
+
+def _pool_gauge(read: Callable[[Any], int]) -> Callable[[], Dict[Tuple[str], int]]:
+    return lambda: {(name,): read(pool) for name, pool in _pools().items() if hasattr(pool, "checkedout")}
+
+
+def _poller_stat(key: str) -> Callable[[], Optional[float]]:
+    def read():
+        from app.websocket.poller import get_poller_stats
+        stats = get_poller_stats()
+        return stats[key] if stats else None
+    return read
+
+
+def _clients() -> List[Any]:
+    return list(_connection_manager.clients.values()) if _connection_manager else []
+
+
+def _ingest_pending() -> Optional[int]:
+    from app.db.ingest import get_ingest_stats
+    stats = get_ingest_stats()
+    return stats.get("pending") if stats else None
+
+
+GAUGES = [
+    Gauge("db_pool_size", "Configured pool size", _pool_gauge(lambda pool: pool.size()), ("engine",)),
+    Gauge("db_pool_checked_out", "Connections checked out of the pool", _pool_gauge(lambda pool: pool.checkedout()), ("engine",)),
+    Gauge("db_pool_overflow", "Overflow connections in use (negative while below pool size)",
+          _pool_gauge(lambda pool: pool.overflow()), ("engine",)),
+    Gauge("poller_lag_rows", "Vitals rows not yet broadcast", _poller_stat("lag_rows")),
+    Gauge("poller_lag_seconds", "Age of the oldest vitals row not yet broadcast", _poller_stat("lag_seconds")),
+    Gauge("poller_interval_seconds", "Current vitals poll interval", _poller_stat("poll_interval")),
+    Gauge("ws_connections", "Active WebSocket connections",
+          lambda: len(_connection_manager.active_connections) if _connection_manager else None),
+    Gauge("ws_queue_depth", "Messages queued for WebSocket clients (all clients)",
+          lambda: sum(len(client.queue) for client in _clients()) if _connection_manager else None),
+    Gauge("ws_queue_depth_max", "Longest outbound queue of any WebSocket client",
+          lambda: max((len(client.queue) for client in _clients()), default=0) if _connection_manager else None),
+    Gauge("ws_dropped_messages", "Messages dropped or coalesced for currently connected clients",
+          lambda: sum(client.dropped for client in _clients()) if _connection_manager else None),
+    Gauge("ingest_pending_rows", "Rows waiting in the ingest buffer", _ingest_pending),
+]
+
+
+def _render_trace_stages() -> List[str]:
+    from app.core.tracing import VITALS_TRACING, get_stage_histograms
+    name = "vitals_stage_seconds"
+    lines = [f"# HELP {name} Vitals latency by pipeline stage (see app.core.tracing)", f"# TYPE {name} histogram"]
+    if not VITALS_TRACING:
+        return lines
+    for stage, histogram in get_stage_histograms().items():
+        lines.extend(render_histogram(
+            name, histogram.buckets, list(histogram.counts), histogram.sum, histogram.count, ("stage",), (stage,)
+        ))
+    return lines
+
+
+def render_metrics() -> str:
+    """
+    Render every metric in the Prometheus text exposition format.
+
+    Returns:
+        Metrics text
+    """
+    lines: List[str] = []
+    for metric in (
+        HTTP_REQUEST_SECONDS, DB_POOL_WAIT_SECONDS, POLLER_CYCLE_SECONDS, POLLER_CYCLE_ROWS,
+        WS_BROADCAST_SECONDS, WS_BROADCAST_ROWS, INGEST_ROWS, BCRYPT_VERIFY_SECONDS, *GAUGES
+    ):
+        lines.extend(metric.render())
+    lines.extend(_render_trace_stages())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording HTTP request latency by route template
+    (e.g. /api/patients/{patient_id}/history), so IDs do not explode the label set.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            # Unmatched paths share one label value
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, scope["method"], path, str(status[0]))
@@ -6,6 +6,8 @@ from typing import Optional, Dict, Any
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 import os
+import time
+from app.core.metrics import BCRYPT_VERIFY_SECONDS
 
 # Password hashing context
 # Configure to avoid bcrypt bug detection that causes issues with bcrypt 5.0+
@@ -33,7 +35,11 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     Returns:
         True if password matches, False otherwise
     """
-    return pwd_context.verify(plain_password, hashed_password)
+    start = time.perf_counter()
+    try:
+        return pwd_context.verify(plain_password, hashed_password)
+    finally:
+        BCRYPT_VERIFY_SECONDS.observe(time.perf_counter() - start)
 
 
 def get_password_hash(password: str) -> str:
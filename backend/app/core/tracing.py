@@ -0,0 +1,252 @@
+"""
+End-to-end latency tracing for vitals readings
+
+Writers (db_writer and the ingest API) stamp each reading's metadata with a
+trace_id and ingest_ts (epoch seconds when the reading entered the system);
+a trace_id sent by a gateway is kept. The poller and the WebSocket layer
+then time every stage a reading goes through, into one histogram per stage:
+
+- ingest_to_pickup: ingest until the poller read the row (covers the insert,
+  the commit and waiting for the next poll)
+- query: one poller query (a page or a gap re-check)
+- serialize: encoding one frame for one client encoding
+- queue_wait: a frame waiting in a client's outbound queue
+- send: writing one frame to one client socket
+- ingest_to_delivered: ingest of the oldest row in a frame until the frame
+  was written to a client
+
+ingest_ts is wall-clock time, so the ingest_* stages assume the writer's and
+the API's clocks are in sync (NTP) when they run on different hosts.
+
+With VITALS_TRACE_SAMPLE > 0 that fraction of batches is logged with its
+stage timings and the trace_id of its oldest reading, so a reading can be
+followed from the writer to the first client that received it.
+"""
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from typing import Dict, Any, List, Optional, Tuple
+
+VITALS_TRACING = os.getenv("VITALS_TRACING", "1") == "1"
+VITALS_TRACE_SAMPLE = float(os.getenv("VITALS_TRACE_SAMPLE", "0"))
+
+# Upper bounds in seconds (Prometheus-style; anything larger goes to +Inf)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGES = ("ingest_to_pickup", "query", "serialize", "queue_wait", "send", "ingest_to_delivered")
+
+
+class StageHistogram:
+    """Fixed-bucket histogram of stage durations in seconds."""
+
+    def __init__(self, buckets: Tuple[float, ...] = STAGE_BUCKETS):
+        """
+        Args:
+            buckets: Ascending bucket upper bounds in seconds
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()  # db_writer and the spool drainer observe from threads
+
+    def observe(self, seconds: float):
+        """Record one duration."""
+        seconds = max(0.0, seconds)
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, percent: float) -> float:
+        """
+        Estimate a percentile by interpolating inside its bucket.
+
+        Returns:
+            Seconds (0 if nothing was recorded)
+        """
+        if not self.count:
+            return 0.0
+        rank = percent / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                low = self.buckets[index - 1] if index > 0 else 0.0
+                high = self.buckets[index] if index < len(self.buckets) else self.max
+                return min(low + (high - low) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """(upper bound, observations <= bound) pairs, ending with +Inf."""
+        pairs, total = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Summarize the histogram.
+
+        Returns:
+            Dictionary with count, mean, p50/p90/p99 and max in milliseconds
+        """
+        return {
+            "count": self.count,
+            "mean_ms": self.sum / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p90_ms": self.percentile(90) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+# Stage name -> histogram (one set per process)
+_histograms: Dict[str, StageHistogram] = {stage: StageHistogram() for stage in STAGES}
+
+
+def observe(stage: str, seconds: float):
+    """
+    Record a stage duration.
+
+    Args:
+        stage: One of STAGES
+        seconds: Duration in seconds
+    """
+    if VITALS_TRACING:
+        _histograms[stage].observe(seconds)
+
+
+def get_stage_histograms() -> Dict[str, StageHistogram]:
+    """Get the stage histograms (for exporters)."""
+    return _histograms
+
+
+def get_trace_stats() -> Optional[Dict[str, Any]]:
+    """
+    Get per-stage latency statistics.
+
+    Returns:
+        Stage name -> statistics, or None if tracing is disabled
+    """
+    if not VITALS_TRACING:
+        return None
+    return {stage: histogram.get_stats() for stage, histogram in _histograms.items()}
+
+
+def _metadata_dict(metadata: Any) -> Optional[Dict[str, Any]]:
+    """Parse a metadata value (JSON text, dict or None)."""
+    if isinstance(metadata, dict):
+        return metadata
+    if isinstance(metadata, (str, bytes)):
+        try:
+            value = json.loads(metadata)
+        except ValueError:
+            return None
+        return value if isinstance(value, dict) else None
+    return None
+
+
+def stamp_reading(row: Dict[str, Any], ingest_ts: Optional[float] = None):
+    """
+    Add trace_id and ingest_ts to a reading's metadata (in place).
+
+    Metadata stays in the form it came in: a dict stays a dict, JSON text
+    or None becomes JSON text. Metadata that is not a JSON object is left
+    untouched.
+
+    Args:
+        row: Vitals insert parameters
+        ingest_ts: Epoch seconds to record (default: now)
+    """
+    if not VITALS_TRACING:
+        return
+    metadata = row.get("metadata")
+    values = {} if metadata is None else _metadata_dict(metadata)
+    if values is None:
+        return
+    values.setdefault("trace_id", uuid.uuid4().hex[:16])
+    values.setdefault("ingest_ts", round(ingest_ts if ingest_ts is not None else time.time(), 6))
+    row["metadata"] = values if isinstance(metadata, dict) else json.dumps(values, separators=(",", ":"))
+
+
+def reading_trace(row: Dict[str, Any]) -> Tuple[Optional[str], Optional[float]]:
+    """
+    Get a reading's trace_id and ingest_ts from its metadata.
+
+    Returns:
+        (trace_id, ingest_ts), each None if missing
+    """
+    values = _metadata_dict(row.get("metadata"))
+    if not values:
+        return None, None
+    ingest_ts = values.get("ingest_ts")
+    return values.get("trace_id"), float(ingest_ts) if isinstance(ingest_ts, (int, float)) else None
+
+
+class BatchTrace:
+    """Timing context of one broadcast batch, carried with its frames to every client."""
+
+    def __init__(
+        self,
+        rows: List[Dict[str, Any]],
+        picked_up_at: Optional[float] = None,
+        query_seconds: Optional[float] = None
+    ):
+        """
+        Read the batch's ingest timestamps and record ingest_to_pickup.
+
+        Args:
+            rows: Broadcast rows
+            picked_up_at: Epoch seconds the poller read the rows (None for other sources)
+            query_seconds: Duration of the query that returned them
+        """
+        self.oldest_ingest_ts: Optional[float] = None
+        self.trace_id: Optional[str] = None
+        for row in rows:
+            trace_id, ingest_ts = reading_trace(row)
+            if ingest_ts is None:
+                continue
+            if picked_up_at is not None:
+                observe("ingest_to_pickup", picked_up_at - ingest_ts)
+            if self.oldest_ingest_ts is None or ingest_ts < self.oldest_ingest_ts:
+                self.oldest_ingest_ts, self.trace_id = ingest_ts, trace_id
+
+        self.rows = len(rows)
+        self.picked_up_at = picked_up_at
+        self.query_seconds = query_seconds
+        self.serialize_seconds = 0.0
+        self.sampled = VITALS_TRACE_SAMPLE > 0 and self.trace_id is not None and random.random() < VITALS_TRACE_SAMPLE
+        self._logged = False
+
+    def delivered(self, sent_at: float, queue_wait: float, send_seconds: float):
+        """
+        Record a frame of this batch written to a client.
+
+        Args:
+            sent_at: Epoch seconds the write finished
+            queue_wait: Seconds the frame waited in the client's queue
+            send_seconds: Seconds the write took
+        """
+        if self.oldest_ingest_ts is None:
+            return
+        observe("ingest_to_delivered", sent_at - self.oldest_ingest_ts)
+        if self.sampled and not self._logged:
+            # Logged once, at the first client that received the batch
+            self._logged = True
+            pickup = f"{(self.picked_up_at - self.oldest_ingest_ts) * 1000:.1f} ms" if self.picked_up_at else "n/a"
+            query = f"{self.query_seconds * 1000:.1f} ms" if self.query_seconds is not None else "n/a"
+            print(
+                f"🔎 Trace {self.trace_id} ({self.rows} row batch): ingest→pickup {pickup} | query {query} | "
+                f"serialize {self.serialize_seconds * 1000:.2f} ms | queue {queue_wait * 1000:.1f} ms | "
+                f"send {send_seconds * 1000:.2f} ms | ingest→first client {(sent_at - self.oldest_ingest_ts) * 1000:.1f} ms"
+            )
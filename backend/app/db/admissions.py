@@ -0,0 +1,253 @@
+"""
+Active-admission cache for vitals ingestion
+
+With ADMISSION_CHECK=app, the ingest buffer and db_writer check each batch
+against an in-memory set of admitted patients and reject rows for anyone
+else before inserting, instead of trg_vitals_validate_admission counting
+admissions once per row. The API drops that trigger at startup in this mode.
+
+The set is reloaded when the admissions table changes. A probe of its row
+count and latest updated_at runs at most every ADMISSION_CACHE_TTL seconds;
+a patient missing from the set is looked up before their rows are rejected,
+so new admissions are accepted right away. A discharge can therefore take
+up to ADMISSION_CACHE_TTL seconds to take effect.
+
+Dropping the trigger affects every writer, so writers left on
+ADMISSION_CHECK=trigger check whether it still exists (every
+TRIGGER_CHECK_TTL seconds) and validate through the cache while it is
+missing.
+"""
+import os
+import time
+from typing import Dict, Any, List, Optional, Set, Tuple
+from sqlalchemy import text, bindparam
+from app.db.triggers import VALIDATE_ADMISSION_TRIGGER, TriggerProbe, drop_trigger_sql
+
+ADMISSION_CHECK = os.getenv("ADMISSION_CHECK", "trigger")  # trigger | app
+ADMISSION_CACHE_TTL = float(os.getenv("ADMISSION_CACHE_TTL", "5"))
+
+# Same text as the trigger's SIGNAL, so callers see the same rejection
+NOT_ADMITTED_ERROR = "Cannot insert vitals: Patient must have an active admission"
+
+ACTIVE_ADMISSION_FILTER = "status IN ('admitted', 'verified') AND discharge_time IS NULL"
+
+ADMISSIONS_VERSION_SQL = "SELECT COUNT(*), MAX(updated_at) FROM admissions"
+
+ACTIVE_PATIENTS_SQL = f"SELECT DISTINCT patient_id FROM admissions WHERE {ACTIVE_ADMISSION_FILTER}"
+
+ACTIVE_AMONG_SQL = text(f"""
+    SELECT DISTINCT patient_id FROM admissions
+    WHERE patient_id IN :patient_ids AND {ACTIVE_ADMISSION_FILTER}
+""").bindparams(bindparam("patient_ids", expanding=True))
+
+
+class AdmissionCache:
+    """Set of patients with an active admission, reloaded when admissions change."""
+
+    def __init__(self, ttl: float = ADMISSION_CACHE_TTL):
+        """
+        Initialize an empty cache.
+
+        Args:
+            ttl: Seconds between checks of whether the admissions table changed
+        """
+        self.ttl = ttl
+        self.active: Set[int] = set()
+        self.version: Optional[Tuple[Any, Any]] = None
+        self.checked_at: Optional[float] = None
+        self.reloads = 0
+        self.miss_lookups = 0
+        self.rows_checked = 0
+        self.rows_rejected = 0
+
+    def invalidate(self):
+        """Reload on the next batch (after an admission or discharge)."""
+        self.version = None
+        self.checked_at = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics.
+
+        Returns:
+            Dictionary with the set size and counters
+        """
+        return {
+            "active_patients": len(self.active),
+            "reloads": self.reloads,
+            "miss_lookups": self.miss_lookups,
+            "rows_checked": self.rows_checked,
+            "rows_rejected": self.rows_rejected,
+        }
+
+    def _due(self) -> bool:
+        return self.checked_at is None or time.monotonic() - self.checked_at > self.ttl
+
+    def _load(self, version: Tuple[Any, Any], patient_ids) -> None:
+        self.active = {int(patient_id) for patient_id in patient_ids}
+        self.version = version
+        self.reloads += 1
+
+    def _split(
+        self,
+        rows: List[Dict[str, Any]],
+        found: Set[int]
+    ) -> Tuple[List[Dict[str, Any]], List[Optional[str]]]:
+        """Partition rows using the set plus patients found by the miss lookup."""
+        self.active |= found
+        errors: List[Optional[str]] = []
+        accepted: List[Dict[str, Any]] = []
+        for row in rows:
+            if int(row["patient_id"]) in self.active:
+                accepted.append(row)
+                errors.append(None)
+            else:
+                errors.append(NOT_ADMITTED_ERROR)
+        self.rows_checked += len(rows)
+        self.rows_rejected += len(rows) - len(accepted)
+        return accepted, errors
+
+    def _missing(self, rows: List[Dict[str, Any]]) -> List[int]:
+        return sorted({int(row["patient_id"]) for row in rows} - self.active)
+
+    async def check_async(self, conn, rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Optional[str]]]:
+        """
+        Validate a batch on an async connection.
+
+        Args:
+            conn: AsyncConnection
+            rows: Vitals rows
+
+        Returns:
+            (rows to insert, one error or None per input row)
+        """
+        if self._due():
+            version = tuple((await conn.execute(text(ADMISSIONS_VERSION_SQL))).fetchone())
+            if version != self.version:
+                result = await conn.execute(text(ACTIVE_PATIENTS_SQL))
+                self._load(version, [row[0] for row in result])
+            self.checked_at = time.monotonic()
+
+        found: Set[int] = set()
+        missing = self._missing(rows)
+        if missing:
+            self.miss_lookups += 1
+            result = await conn.execute(ACTIVE_AMONG_SQL, {"patient_ids": missing})
+            found = {int(row[0]) for row in result}
+        return self._split(rows, found)
+
+    def check_sync(self, conn, rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Optional[str]]]:
+        """
+        Validate a batch on a sync connection.
+
+        Args:
+            conn: Connection
+            rows: Vitals rows
+
+        Returns:
+            (rows to insert, one error or None per input row)
+        """
+        if self._due():
+            version = tuple(conn.execute(text(ADMISSIONS_VERSION_SQL)).fetchone())
+            if version != self.version:
+                result = conn.execute(text(ACTIVE_PATIENTS_SQL))
+                self._load(version, [row[0] for row in result])
+            self.checked_at = time.monotonic()
+
+        found: Set[int] = set()
+        missing = self._missing(rows)
+        if missing:
+            self.miss_lookups += 1
+            result = conn.execute(ACTIVE_AMONG_SQL, {"patient_ids": missing})
+            found = {int(row[0]) for row in result}
+        return self._split(rows, found)
+
+
+# Global admission cache (one per process)
+_cache: Optional[AdmissionCache] = None
+_trigger_probe = TriggerProbe(VALIDATE_ADMISSION_TRIGGER, "validating admissions against the admission cache")
+
+
+def app_admission_check_sync(conn, check: str = ADMISSION_CHECK) -> bool:
+    """
+    Whether a writer must validate admissions itself (sync connection).
+
+    Args:
+        conn: Connection the batch is inserted on
+        check: The writer's configured mode (app or trigger)
+
+    Returns:
+        True in app mode, or when the trigger has been dropped
+    """
+    return check == "app" or _trigger_probe.missing_sync(conn)
+
+
+async def app_admission_check_async(conn, check: str = ADMISSION_CHECK) -> bool:
+    """
+    Whether a writer must validate admissions itself (async connection).
+
+    Args:
+        conn: AsyncConnection the batch is inserted on
+        check: The writer's configured mode (app or trigger)
+
+    Returns:
+        True in app mode, or when the trigger has been dropped
+    """
+    return check == "app" or await _trigger_probe.missing_async(conn)
+
+
+def get_admission_cache() -> AdmissionCache:
+    """
+    Get or create the global admission cache.
+
+    Returns:
+        AdmissionCache instance
+    """
+    global _cache
+    if _cache is None:
+        _cache = AdmissionCache()
+    return _cache
+
+
+def invalidate_admissions():
+    """Reload the admission set before the next batch."""
+    if _cache is not None:
+        _cache.invalidate()
+
+
+async def start_admission_check():
+    """
+    Move admission validation into the application if ADMISSION_CHECK=app.
+
+    Drops trg_vitals_validate_admission (re-run sql/ddl/triggers.sql to go
+    back to ADMISSION_CHECK=trigger) and loads the admission set.
+    """
+    if ADMISSION_CHECK != "app":
+        return
+
+    from app.db.database import get_async_engine
+
+    engine = get_async_engine()
+    try:
+        async with engine.begin() as conn:
+            await conn.exec_driver_sql(drop_trigger_sql(VALIDATE_ADMISSION_TRIGGER))
+        print(f"🔧 Dropped {VALIDATE_ADMISSION_TRIGGER} (ADMISSION_CHECK=app)")
+    except Exception as e:
+        print(f"⚠️  Could not drop {VALIDATE_ADMISSION_TRIGGER}: {e}")
+
+    cache = get_admission_cache()
+    async with engine.connect() as conn:
+        await cache.check_async(conn, [])
+    print(f"✅ Admission cache ready ({len(cache.active)} admitted patients)")
+
+
+def get_admission_stats() -> Optional[Dict[str, Any]]:
+    """
+    Get statistics of the admission cache.
+
+    Returns:
+        Cache statistics, or None if this process never validated admissions
+    """
+    if ADMISSION_CHECK != "app" and _cache is None:
+        return None
+    return get_admission_cache().get_stats()
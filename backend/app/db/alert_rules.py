@@ -0,0 +1,873 @@
+"""
+Application-side threshold alert rules
+
+With ALERT_ENGINE=app, vitals batches are checked against an in-memory copy
+of the thresholds table in the transaction that inserts them, and the
+resulting alerts are written with one multi-row INSERT. The API drops
+trg_vitals_threshold_alert at startup in this mode; re-run
+sql/ddl/triggers.sql before switching back to ALERT_ENGINE=trigger.
+Writers left on ALERT_ENGINE=trigger (the simulator, other API instances)
+check whether the trigger still exists every TRIGGER_CHECK_TTL seconds and
+evaluate alerts in the application while it is missing, so no process ends
+up writing vitals without threshold alerts.
+
+Each batch first probes a checksum of the thresholds table (a few dozen
+rows) and reloads the cache when it changed, so a threshold updated through
+any worker applies to the next batch of every writer.
+
+The rules are the trigger's:
+- Monitored columns: heart_rate, spo2, bp_systolic, bp_diastolic,
+  temperature_c, respiration (NULL values are not checked)
+- A patient-specific threshold takes precedence over the global one
+- The critical threshold is checked first; the warning threshold only when
+  the value is inside the critical range
+- No alert if the patient already has an unacknowledged alert of the same
+  type for the same vital from the last 10 minutes (including one raised
+  earlier in the same batch)
+- Messages: "Critical|Warning threshold breach for <name>: value=<v>", with
+  ", min=<min>, max=<max>" appended for heart_rate and spo2
+
+Deduplication (ALERT_DEDUPE):
+- db: query the batch's recent unacknowledged alerts, like the trigger
+- memory (default): an in-process index of open alerts per (patient, vital,
+  type), rebuilt from the alerts table at startup. Each batch probes the
+  newest alert_id and the acknowledgements of the dedupe window
+  (ALERTS_VERSION_SQL, an index range scan) and resyncs the index when
+  they changed, so alerts written or acknowledged by other processes (API
+  workers, the simulator, a spool drainer) are seen by the next batch. After an acknowledgement the key stays disarmed until
+  ALERT_REARM_READINGS consecutive readings are back inside the range,
+  narrowed by ALERT_HYSTERESIS_PCT percent of each limit, so a value
+  oscillating around a limit does not raise a new alert after every
+  acknowledgement. The disarm lapses after the dedupe window, so a value
+  that stays out of range alerts again. ALERT_REARM_READINGS=0 re-arms
+  immediately, as the trigger does.
+
+Limitation (both modes, and the trigger too): two processes evaluating the
+same key in transactions that run at the same time do not see each other's
+uncommitted alerts, so both may write one. With memory dedupe a batch also
+misses alerts another process committed after the batch's probe.
+
+Evaluation only stages its changes to the index (PendingAlerts); the caller
+commits them once the insert transaction has committed, so alerts lost with
+a failed insert never mark their key as open.
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass, replace
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Any, List, Optional, Set, Tuple
+from sqlalchemy import text, bindparam
+from app.db.triggers import THRESHOLD_ALERT_TRIGGER, TriggerProbe, drop_trigger_sql
+
+ALERT_ENGINE = os.getenv("ALERT_ENGINE", "trigger")  # trigger | app
+THRESHOLD_CACHE_TTL = float(os.getenv("THRESHOLD_CACHE_TTL", "30"))
+ALERT_DEDUPE = os.getenv("ALERT_DEDUPE", "memory")  # memory | db
+ALERT_HYSTERESIS_PCT = float(os.getenv("ALERT_HYSTERESIS_PCT", "5"))
+ALERT_REARM_READINGS = int(os.getenv("ALERT_REARM_READINGS", "3"))
+
+MONITORED_VITALS = ("heart_rate", "spo2", "bp_systolic", "bp_diastolic", "temperature_c", "respiration")
+RANGE_IN_MESSAGE = ("heart_rate", "spo2")
+ALERT_TYPES = ("critical", "warning")  # Checked in this order
+DEDUPE_WINDOW_MINUTES = 10
+
+THRESHOLDS_SQL = "SELECT name, type, min_value, max_value, patient_id FROM thresholds ORDER BY threshold_id"
+
+# Changes whenever a threshold row is added, removed or edited
+THRESHOLDS_VERSION_SQL = """
+    SELECT COUNT(*), COALESCE(SUM(CRC32(CONCAT_WS('|', threshold_id, name, type,
+        COALESCE(min_value, ''), COALESCE(max_value, ''), COALESCE(patient_id, '')))), 0)
+    FROM thresholds
+"""
+
+RECENT_ALERTS_SQL = text(f"""
+    SELECT DISTINCT patient_id, alert_type, threshold
+    FROM alerts
+    WHERE patient_id IN :patient_ids
+        AND acknowledged_at IS NULL
+        AND created_at >= DATE_SUB(NOW(6), INTERVAL {DEDUPE_WINDOW_MINUTES} MINUTE)
+""").bindparams(bindparam("patient_ids", expanding=True))
+
+# Keys alerted in the dedupe window: age of the newest open alert (NULL if
+# none is open) and whether any was acknowledged
+OPEN_ALERTS_SQL = f"""
+    SELECT patient_id, alert_type, threshold,
+           TIMESTAMPDIFF(MICROSECOND, MAX(CASE WHEN acknowledged_at IS NULL THEN created_at END), NOW(6)) AS age_us,
+           MAX(acknowledged_at IS NOT NULL) AS acknowledged
+    FROM alerts
+    WHERE threshold IS NOT NULL
+        AND created_at >= DATE_SUB(NOW(6), INTERVAL {DEDUPE_WINDOW_MINUTES} MINUTE)
+    GROUP BY patient_id, alert_type, threshold
+"""
+
+# Changes whenever an alert is written, or one from the dedupe window is acknowledged
+ALERTS_VERSION_SQL = f"""
+    SELECT MAX(alert_id), COUNT(acknowledged_at), MAX(acknowledged_at)
+    FROM alerts
+    WHERE created_at >= DATE_SUB(NOW(6), INTERVAL {DEDUPE_WINDOW_MINUTES} MINUTE)
+"""
+
+# (min_value, max_value)
+Range = Tuple[Optional[float], Optional[float]]
+# (patient_id, alert_type, threshold name)
+AlertKey = Tuple[int, str, str]
+
+
+def _format_double(value: float) -> str:
+    """Format a DOUBLE the way MySQL's CONCAT does (120 -> '120', 38.5 -> '38.5')."""
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _stored_value(name: str, value: Any) -> float:
+    """The value as the vitals column stores it (INT, or DECIMAL(4,2) for temperature_c)."""
+    quantum = Decimal("0.01") if name == "temperature_c" else Decimal("1")
+    return float(Decimal(str(value)).quantize(quantum, rounding=ROUND_HALF_UP))
+
+
+def _breached(value: float, limits: Range) -> bool:
+    """Whether a value is outside a threshold range."""
+    low, high = limits
+    return (low is not None and value < low) or (high is not None and value > high)
+
+
+def _recovered(value: float, limits: Range, hysteresis_pct: float) -> bool:
+    """Whether a value is inside a range narrowed by hysteresis_pct percent of each limit."""
+    low, high = limits
+    if low is not None and value < low + abs(low) * hysteresis_pct / 100:
+        return False
+    if high is not None and value > high - abs(high) * hysteresis_pct / 100:
+        return False
+    return True
+
+
+def alert_message(alert_type: str, name: str, value: float, limits: Range) -> str:
+    """
+    Build the alert message the trigger would write.
+
+    Args:
+        alert_type: critical or warning
+        name: Vital name (thresholds.name)
+        value: Measured value
+        limits: Threshold (min, max) that was breached
+
+    Returns:
+        Message text
+    """
+    message = f"{alert_type.capitalize()} threshold breach for {name}: value={_format_double(value)}"
+    if name in RANGE_IN_MESSAGE:
+        low, high = limits
+        if low is not None:
+            message += f", min={_format_double(low)}"
+        if high is not None:
+            message += f", max={_format_double(high)}"
+    return message
+
+
+class ThresholdCache:
+    """In-memory thresholds, resolved per patient (patient-specific over global)."""
+
+    def __init__(self, ttl: float = THRESHOLD_CACHE_TTL):
+        """
+        Initialize an empty cache.
+
+        Args:
+            ttl: Seconds before the cache is reloaded even without invalidate()
+        """
+        self.ttl = ttl
+        self.global_limits: Dict[Tuple[str, str], Range] = {}
+        self.patient_limits: Dict[int, Dict[Tuple[str, str], Range]] = {}
+        self.loaded_at: Optional[float] = None
+        self.version: Optional[Tuple[Any, Any]] = None
+        self.reloads = 0
+
+    def is_stale(self, version: Optional[Tuple[Any, Any]] = None) -> bool:
+        """
+        Whether the cache must be (re)loaded before use.
+
+        Args:
+            version: Current THRESHOLDS_VERSION_SQL result (None to check the TTL only)
+        """
+        if version is not None and version != self.version:
+            return True
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl
+
+    def invalidate(self):
+        """Force a reload before the next evaluation (after thresholds change)."""
+        self.loaded_at = None
+        self.version = None
+
+    def load(self, rows, version: Optional[Tuple[Any, Any]] = None) -> None:
+        """
+        Replace the cached thresholds.
+
+        Args:
+            rows: Rows of THRESHOLDS_SQL, in threshold_id order
+            version: THRESHOLDS_VERSION_SQL result read with them
+        """
+        global_limits: Dict[Tuple[str, str], Range] = {}
+        patient_limits: Dict[int, Dict[Tuple[str, str], Range]] = {}
+        for row in rows:
+            name, alert_type, low, high, patient_id = row
+            limits = (
+                float(low) if low is not None else None,
+                float(high) if high is not None else None,
+            )
+            target = global_limits if patient_id is None else patient_limits.setdefault(int(patient_id), {})
+            # First row wins, like the trigger's LIMIT 1
+            target.setdefault((name, alert_type), limits)
+        self.global_limits = global_limits
+        self.patient_limits = patient_limits
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.reloads += 1
+
+    def resolve(self, patient_id: int) -> Dict[Tuple[str, str], Range]:
+        """
+        Thresholds that apply to one patient.
+
+        Args:
+            patient_id: Patient ID
+
+        Returns:
+            {(name, type): (min, max)}
+        """
+        overrides = self.patient_limits.get(patient_id)
+        if not overrides:
+            return self.global_limits
+        return {**self.global_limits, **overrides}
+
+
+class RecentAlertSet:
+    """Trigger-style dedupe: keys with a recent unacknowledged alert, queried per batch."""
+
+    def __init__(self, active: Set[AlertKey]):
+        """
+        Initialize from the recent-alert query.
+
+        Args:
+            active: Keys with an unacknowledged alert from the dedupe window
+        """
+        self.active = active
+
+    def admit(self, key: AlertKey, now: float) -> bool:
+        """Whether a breach of this key raises an alert (recorded as open if so)."""
+        if key in self.active:
+            return False
+        self.active.add(key)
+        return True
+
+    def observe(self, key: AlertKey, value: float, limits: Range):
+        """Readings inside the range do not matter for this dedupe."""
+
+
+@dataclass
+class AlertState:
+    """Dedupe state of one (patient, alert type, vital) key."""
+    open_until: float = 0.0  # time.time() when the last alert's dedupe window ends
+    armed: bool = True
+    disarmed_until: float = 0.0  # time.time() when a disarm lapses even without recovery
+    recovered: int = 0  # Consecutive readings inside the hysteresis band while disarmed
+
+
+class AlertStateIndex:
+    """
+    In-memory open-alert index with hysteresis and re-arm rules.
+
+    A breach raises an alert only if the key has no open alert and is armed.
+    Acknowledging disarms the key; it re-arms after rearm_readings consecutive
+    readings inside the range narrowed by hysteresis_pct, or window_seconds
+    after the acknowledgement, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        window_seconds: float = DEDUPE_WINDOW_MINUTES * 60,
+        hysteresis_pct: float = ALERT_HYSTERESIS_PCT,
+        rearm_readings: int = ALERT_REARM_READINGS
+    ):
+        """
+        Initialize an empty index.
+
+        Args:
+            window_seconds: How long an unacknowledged alert suppresses new ones
+                            (and the longest an acknowledged key stays disarmed)
+            hysteresis_pct: Percent of each limit a value must clear to count as recovered
+            rearm_readings: Recovered readings needed to re-arm after an acknowledgement
+        """
+        self.window_seconds = window_seconds
+        self.hysteresis_pct = hysteresis_pct
+        self.rearm_readings = max(0, rearm_readings)
+        self.states: Dict[AlertKey, AlertState] = {}
+        self.disarmed_suppressed = 0
+        self.version: Optional[Tuple[Any, ...]] = None  # ALERTS_VERSION_SQL at the last resync
+        self.resyncs = 0
+        # Writer threads (db_writer, spool drainer) commit into one index while
+        # the API acknowledges and resyncs; evaluation only reads it
+        self._lock = threading.RLock()
+
+    def _peek(self, key: AlertKey) -> Optional[AlertState]:
+        """A key's state, for reading only."""
+        return self.states.get(key)
+
+    def _get(self, key: AlertKey) -> Optional[AlertState]:
+        """A key's state, to be updated in place."""
+        return self.states.get(key)
+
+    def begin(self) -> "PendingAlerts":
+        """Stage changes for one transaction (see PendingAlerts)."""
+        return PendingAlerts(self)
+
+    def admit(self, key: AlertKey, now: float) -> bool:
+        """
+        Record a breach.
+
+        Args:
+            key: (patient_id, alert_type, threshold name)
+            now: Current time.time()
+
+        Returns:
+            True if an alert should be written (the key is then open)
+        """
+        state = self._get(key)
+        if state is None:
+            self.states[key] = AlertState(open_until=now + self.window_seconds)
+            return True
+        if state.open_until > now:
+            return False
+        if not state.armed:
+            if state.disarmed_until > now:
+                state.recovered = 0
+                self.disarmed_suppressed += 1
+                return False
+            # Still out of range a full window after the acknowledgement
+            state.armed = True
+            state.recovered = 0
+        state.open_until = now + self.window_seconds
+        return True
+
+    def observe(self, key: AlertKey, value: float, limits: Range):
+        """
+        Record a reading inside the key's range (counts towards re-arming).
+
+        Args:
+            key: (patient_id, alert_type, threshold name)
+            value: Measured value
+            limits: The key's threshold range
+        """
+        state = self._peek(key)
+        if state is None or state.armed:
+            return
+        state = self._get(key)
+        if _recovered(value, limits, self.hysteresis_pct):
+            state.recovered += 1
+            if state.recovered >= self.rearm_readings:
+                state.armed = True
+                state.recovered = 0
+        else:
+            state.recovered = 0
+
+    def acknowledge(self, key: AlertKey, now: Optional[float] = None):
+        """
+        Close a key's open alert and disarm it if re-arm rules are enabled.
+
+        Args:
+            key: (patient_id, alert_type, threshold name)
+            now: Current time.time() (default: now)
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            state = self._get(key)
+            if state is None:
+                if not self.rearm_readings:
+                    return
+                state = self.states[key] = AlertState()
+            state.open_until = 0.0
+            if self.rearm_readings:
+                state.armed = False
+                state.disarmed_until = now + self.window_seconds
+                state.recovered = 0
+
+    def resync(self, rows, now: float, version: Optional[Tuple[Any, ...]] = None):
+        """
+        Align open alerts with the alerts table.
+
+        Keys open here whose alert the table shows as acknowledged were
+        acknowledged elsewhere (another worker or process) and are treated
+        as such. Keys open here with no alert in the table at all are only
+        closed, not disarmed: the alert was never written. Keys that are
+        armed, or whose disarm lapsed, and have no open alert are forgotten.
+
+        Args:
+            rows: Rows of OPEN_ALERTS_SQL
+            now: Current time.time()
+            version: ALERTS_VERSION_SQL result read with the rows
+        """
+        with self._lock:
+            self.version = version
+            self.resyncs += 1
+            open_keys = set()
+            acknowledged_keys = set()
+            for patient_id, alert_type, threshold, age_us, acknowledged in rows:
+                key = (int(patient_id), alert_type, threshold)
+                if age_us is not None:
+                    state = self.states.setdefault(key, AlertState())
+                    state.open_until = now + self.window_seconds - int(age_us) / 1_000_000
+                    open_keys.add(key)
+                elif acknowledged:
+                    acknowledged_keys.add(key)
+            for key, state in list(self.states.items()):
+                if key in open_keys or state.open_until <= now:
+                    continue
+                if key in acknowledged_keys:
+                    self.acknowledge(key, now)
+                else:
+                    state.open_until = 0.0
+            self.states = {
+                key: state for key, state in self.states.items()
+                if state.open_until > now or (not state.armed and state.disarmed_until > now)
+            }
+
+    def get_stats(self, now: float) -> Dict[str, Any]:
+        """
+        Get index statistics.
+
+        Args:
+            now: Current time.time()
+
+        Returns:
+            Open and disarmed key counts
+        """
+        return {
+            "open_alerts": sum(1 for state in self.states.values() if state.open_until > now),
+            "disarmed": sum(1 for state in self.states.values() if not state.armed and state.disarmed_until > now),
+            "disarmed_suppressed": self.disarmed_suppressed,
+            "resyncs": self.resyncs,
+        }
+
+
+class PendingAlerts(AlertStateIndex):
+    """
+    Alert state changes of a transaction that has not committed yet.
+
+    Evaluation reads through to the parent (the engine's index, or the
+    enclosing transaction for a savepoint) but writes only here, so alerts
+    claimed by an insert that fails or rolls back never mark their key as
+    open. commit() applies the changes and counters to the parent once the
+    transaction or savepoint has committed; otherwise the object is dropped.
+    """
+
+    def __init__(self, parent: AlertStateIndex, engine: Optional["AlertRulesEngine"] = None):
+        """
+        Args:
+            parent: Index (or enclosing PendingAlerts) the changes apply to
+            engine: Engine whose counters are updated on commit (top level only)
+        """
+        super().__init__(parent.window_seconds, parent.hysteresis_pct, parent.rearm_readings)
+        self.parent = parent
+        self.engine = engine
+        self.rows_evaluated = 0
+        self.alerts_written = 0
+        self.alerts_suppressed = 0
+
+    def _peek(self, key: AlertKey) -> Optional[AlertState]:
+        state = self.states.get(key)
+        return state if state is not None else self.parent._peek(key)
+
+    def _get(self, key: AlertKey) -> Optional[AlertState]:
+        state = self.states.get(key)
+        if state is None:
+            base = self.parent._peek(key)
+            if base is not None:
+                state = self.states[key] = replace(base)
+        return state
+
+    def record(self, rows: int, alerts: int, suppressed: int):
+        """Count an evaluated batch (reported once committed)."""
+        self.rows_evaluated += rows
+        self.alerts_written += alerts
+        self.alerts_suppressed += suppressed
+
+    def commit(self):
+        """Apply the staged changes to the parent (after the transaction committed)."""
+        parent = self.parent
+        with parent._lock:
+            parent.states.update(self.states)
+            parent.disarmed_suppressed += self.disarmed_suppressed
+        if isinstance(parent, PendingAlerts):
+            parent.record(self.rows_evaluated, self.alerts_written, self.alerts_suppressed)
+        elif self.engine is not None:
+            self.engine.record(self.rows_evaluated, self.alerts_written, self.alerts_suppressed)
+        self.states = {}
+        self.disarmed_suppressed = 0
+        self.rows_evaluated = self.alerts_written = self.alerts_suppressed = 0
+
+
+def evaluate_batch(
+    rows: List[Dict[str, Any]],
+    cache: ThresholdCache,
+    dedupe,
+    now: Optional[float] = None
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Evaluate a batch of vitals rows column by column.
+
+    Thresholds are resolved once per distinct patient in the batch. Each
+    monitored column is then scanned in row order, which is all the dedupe
+    needs since alert keys never span columns.
+
+    Args:
+        rows: Vitals rows in insert order
+        cache: Loaded threshold cache
+        dedupe: RecentAlertSet, or the PendingAlerts of the insert transaction
+        now: Evaluation time (time.time() by default)
+
+    Returns:
+        (alerts in the order the trigger would insert them, number suppressed)
+    """
+    now = time.time() if now is None else now
+    patient_ids = [int(row["patient_id"]) for row in rows]
+    resolved = {patient_id: cache.resolve(patient_id) for patient_id in set(patient_ids)}
+    found: List[Tuple[int, int, Dict[str, Any]]] = []
+    suppressed = 0
+
+    for column_index, name in enumerate(MONITORED_VITALS):
+        for row_index, row in enumerate(rows):
+            raw = row.get(name)
+            if raw is None:
+                continue
+            patient_id = patient_ids[row_index]
+            limits_by_type = resolved[patient_id]
+            value = _stored_value(name, raw)
+
+            for alert_type in ALERT_TYPES:
+                limits = limits_by_type.get((name, alert_type))
+                if limits is None:
+                    continue
+                key = (patient_id, alert_type, name)
+                if not _breached(value, limits):
+                    dedupe.observe(key, value, limits)
+                    continue
+                if dedupe.admit(key, now):
+                    found.append((row_index, column_index, {
+                        "patient_id": patient_id,
+                        "alert_type": alert_type,
+                        "message": alert_message(alert_type, name, value, limits),
+                        "threshold": name,
+                    }))
+                else:
+                    suppressed += 1
+                # A critical breach never falls through to the warning check
+                break
+
+    found.sort(key=lambda item: (item[0], item[1]))
+    return [alert for _, _, alert in found], suppressed
+
+
+def _insert_alerts_statement(alerts: List[Dict[str, Any]]):
+    """One multi-row INSERT for a list of alerts (created_at from the server clock)."""
+    values = []
+    params: Dict[str, Any] = {}
+    for i, alert in enumerate(alerts):
+        values.append(f"(:patient_id_{i}, :alert_type_{i}, :message_{i}, :threshold_{i}, NOW(6))")
+        for field in ("patient_id", "alert_type", "message", "threshold"):
+            params[f"{field}_{i}"] = alert[field]
+    sql = "INSERT INTO alerts (patient_id, alert_type, message, threshold, created_at) VALUES " + ", ".join(values)
+    return text(sql), params
+
+
+class AlertRulesEngine:
+    """Evaluates vitals batches inside the caller's insert transaction."""
+
+    def __init__(self, cache: Optional[ThresholdCache] = None, dedupe_mode: str = ALERT_DEDUPE):
+        """
+        Initialize the engine.
+
+        Args:
+            cache: Threshold cache (a new one by default)
+            dedupe_mode: memory (AlertStateIndex) or db (query per batch)
+        """
+        self.cache = cache or ThresholdCache()
+        self.dedupe_mode = dedupe_mode
+        self.index = AlertStateIndex()
+        self.rows_evaluated = 0
+        self.alerts_written = 0
+        self.alerts_suppressed = 0
+
+    def invalidate(self):
+        """Reload thresholds before the next batch."""
+        self.cache.invalidate()
+
+    def acknowledge(self, patient_id: int, alert_type: str, threshold: Optional[str]):
+        """
+        Note that an alert was acknowledged through this process's API.
+
+        Args:
+            patient_id: Patient ID
+            alert_type: Alert type
+            threshold: Threshold name (alerts without one are not rule alerts)
+        """
+        if threshold is not None:
+            self.index.acknowledge((int(patient_id), alert_type, threshold))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get rule engine statistics.
+
+        Returns:
+            Dictionary with counters, cache and dedupe index state
+        """
+        stats = {
+            "dedupe": self.dedupe_mode,
+            "rows_evaluated": self.rows_evaluated,
+            "alerts_written": self.alerts_written,
+            "alerts_suppressed": self.alerts_suppressed,
+            "threshold_reloads": self.cache.reloads,
+            "global_thresholds": len(self.cache.global_limits),
+            "patient_overrides": len(self.cache.patient_limits),
+        }
+        if self.dedupe_mode == "memory":
+            stats.update(self.index.get_stats(time.time()))
+        return stats
+
+    async def _sync_index_async(self, conn):
+        """Resync the open-alert index if the alerts table changed since the last resync."""
+        version = tuple((await conn.execute(text(ALERTS_VERSION_SQL))).fetchone())
+        if version != self.index.version:
+            open_rows = (await conn.execute(text(OPEN_ALERTS_SQL))).fetchall()
+            self.index.resync(open_rows, time.time(), version)
+
+    def _sync_index_sync(self, conn):
+        """Resync the open-alert index if the alerts table changed since the last resync."""
+        version = tuple(conn.execute(text(ALERTS_VERSION_SQL)).fetchone())
+        if version != self.index.version:
+            open_rows = conn.execute(text(OPEN_ALERTS_SQL)).fetchall()
+            self.index.resync(open_rows, time.time(), version)
+
+    def begin(self) -> PendingAlerts:
+        """
+        Stage the alert state of one insert transaction.
+
+        Returns:
+            PendingAlerts to commit() once the transaction has committed
+        """
+        return PendingAlerts(self.index, self)
+
+    def record(self, rows: int, alerts: int, suppressed: int):
+        """Count committed evaluations."""
+        self.rows_evaluated += rows
+        self.alerts_written += alerts
+        self.alerts_suppressed += suppressed
+
+    async def reload_async(self, conn, version: Optional[Tuple[Any, Any]] = None):
+        """
+        Reload thresholds (and resync open alerts if the alerts table changed) on an async connection.
+
+        Args:
+            conn: AsyncConnection
+            version: Thresholds version just probed (read here if None)
+        """
+        if version is None:
+            version = tuple((await conn.execute(text(THRESHOLDS_VERSION_SQL))).fetchone())
+        self.cache.load((await conn.execute(text(THRESHOLDS_SQL))).fetchall(), version)
+        if self.dedupe_mode == "memory":
+            await self._sync_index_async(conn)
+
+    def reload_sync(self, conn, version: Optional[Tuple[Any, Any]] = None):
+        """
+        Reload thresholds (and resync open alerts if the alerts table changed) on a sync connection.
+
+        Args:
+            conn: Connection
+            version: Thresholds version just probed (read here if None)
+        """
+        if version is None:
+            version = tuple(conn.execute(text(THRESHOLDS_VERSION_SQL)).fetchone())
+        self.cache.load(conn.execute(text(THRESHOLDS_SQL)).fetchall(), version)
+        if self.dedupe_mode == "memory":
+            self._sync_index_sync(conn)
+
+    async def apply_async(
+        self,
+        conn,
+        rows: List[Dict[str, Any]],
+        parent: Optional[PendingAlerts] = None
+    ) -> PendingAlerts:
+        """
+        Evaluate rows just inserted on an async connection and write their alerts.
+
+        Args:
+            conn: AsyncConnection inside the insert transaction
+            rows: Inserted vitals rows
+            parent: PendingAlerts of the enclosing transaction when inserting in a savepoint
+
+        Returns:
+            PendingAlerts to commit() once the transaction (or savepoint) has committed
+        """
+        pending = parent.begin() if parent is not None else self.begin()
+        if not rows:
+            return pending
+        version = tuple((await conn.execute(text(THRESHOLDS_VERSION_SQL))).fetchone())
+        if self.cache.is_stale(version):
+            await self.reload_async(conn, version)
+        elif self.dedupe_mode == "memory":
+            await self._sync_index_async(conn)
+        if self.dedupe_mode == "memory":
+            dedupe = pending
+        else:
+            patient_ids = sorted({int(row["patient_id"]) for row in rows})
+            result = await conn.execute(RECENT_ALERTS_SQL, {"patient_ids": patient_ids})
+            dedupe = RecentAlertSet({(int(r[0]), r[1], r[2]) for r in result})
+
+        alerts, suppressed = evaluate_batch(rows, self.cache, dedupe)
+        if alerts:
+            statement, params = _insert_alerts_statement(alerts)
+            await conn.execute(statement, params)
+        pending.record(len(rows), len(alerts), suppressed)
+        return pending
+
+    def apply_sync(
+        self,
+        conn,
+        rows: List[Dict[str, Any]],
+        parent: Optional[PendingAlerts] = None
+    ) -> PendingAlerts:
+        """
+        Evaluate rows just inserted on a sync connection and write their alerts.
+
+        Args:
+            conn: Connection inside the insert transaction
+            rows: Inserted vitals rows
+            parent: PendingAlerts of the enclosing transaction when inserting in a savepoint
+
+        Returns:
+            PendingAlerts to commit() once the transaction (or savepoint) has committed
+        """
+        pending = parent.begin() if parent is not None else self.begin()
+        if not rows:
+            return pending
+        version = tuple(conn.execute(text(THRESHOLDS_VERSION_SQL)).fetchone())
+        if self.cache.is_stale(version):
+            self.reload_sync(conn, version)
+        elif self.dedupe_mode == "memory":
+            self._sync_index_sync(conn)
+        if self.dedupe_mode == "memory":
+            dedupe = pending
+        else:
+            patient_ids = sorted({int(row["patient_id"]) for row in rows})
+            result = conn.execute(RECENT_ALERTS_SQL, {"patient_ids": patient_ids})
+            dedupe = RecentAlertSet({(int(r[0]), r[1], r[2]) for r in result})
+
+        alerts, suppressed = evaluate_batch(rows, self.cache, dedupe)
+        if alerts:
+            statement, params = _insert_alerts_statement(alerts)
+            conn.execute(statement, params)
+        pending.record(len(rows), len(alerts), suppressed)
+        return pending
+
+
+# Global rules engine (one per process)
+_engine: Optional[AlertRulesEngine] = None
+_trigger_probe = TriggerProbe(THRESHOLD_ALERT_TRIGGER, "evaluating threshold alerts in the application")
+
+
+def app_alerts_sync(conn) -> bool:
+    """
+    Whether a writer must evaluate threshold alerts itself (sync connection).
+
+    Args:
+        conn: Connection the batch is inserted on
+
+    Returns:
+        True with ALERT_ENGINE=app, or when the trigger has been dropped
+    """
+    return ALERT_ENGINE == "app" or _trigger_probe.missing_sync(conn)
+
+
+async def app_alerts_async(conn) -> bool:
+    """
+    Whether a writer must evaluate threshold alerts itself (async connection).
+
+    Args:
+        conn: AsyncConnection the batch is inserted on
+
+    Returns:
+        True with ALERT_ENGINE=app, or when the trigger has been dropped
+    """
+    return ALERT_ENGINE == "app" or await _trigger_probe.missing_async(conn)
+
+
+def get_rules_engine() -> AlertRulesEngine:
+    """
+    Get or create the global rules engine.
+
+    Returns:
+        AlertRulesEngine instance
+    """
+    global _engine
+    if _engine is None:
+        _engine = AlertRulesEngine()
+    return _engine
+
+
+def invalidate_thresholds():
+    """Drop cached thresholds after they were changed through the API."""
+    if _engine is not None:
+        _engine.invalidate()
+
+
+def alert_acknowledged(alert: Dict[str, Any]):
+    """
+    Update the open-alert index after an alert was acknowledged through the API.
+
+    Args:
+        alert: Alert record with patient_id, alert_type and threshold
+    """
+    if _engine is not None:
+        _engine.acknowledge(alert["patient_id"], alert["alert_type"], alert.get("threshold"))
+
+
+async def start_alert_rules():
+    """
+    Switch alert generation to the application if ALERT_ENGINE=app.
+
+    Drops trg_vitals_threshold_alert, preloads the threshold cache and
+    rebuilds the open-alert index. If the trigger cannot be dropped (missing
+    TRIGGER privilege) it keeps firing, and dedupe falls back to the per-batch
+    query so the engine sees the trigger's alerts and does not duplicate them.
+    """
+    if ALERT_ENGINE != "app":
+        return
+
+    from app.db.database import get_async_engine
+
+    engine = get_async_engine()
+    rules = get_rules_engine()
+    try:
+        async with engine.begin() as conn:
+            await conn.exec_driver_sql(drop_trigger_sql(THRESHOLD_ALERT_TRIGGER))
+        print(f"🔧 Dropped {THRESHOLD_ALERT_TRIGGER} (ALERT_ENGINE=app)")
+    except Exception as e:
+        print(f"⚠️  Could not drop {THRESHOLD_ALERT_TRIGGER}: {e}")
+        rules.dedupe_mode = "db"
+
+    async with engine.connect() as conn:
+        await rules.reload_async(conn)
+    open_alerts = rules.index.get_stats(time.time())["open_alerts"] if rules.dedupe_mode == "memory" else "n/a"
+    print(
+        f"✅ Alert rules engine ready ({len(rules.cache.global_limits)} global thresholds, "
+        f"dedupe={rules.dedupe_mode}, open alerts: {open_alerts})"
+    )
+
+
+def get_alert_rules_stats() -> Optional[Dict[str, Any]]:
+    """
+    Get statistics of the rules engine.
+
+    Returns:
+        Rule engine statistics, or None if this process never evaluated alerts
+    """
+    if ALERT_ENGINE != "app" and _engine is None:
+        return None
+    return get_rules_engine().get_stats()
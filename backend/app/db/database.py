@@ -1,18 +1,83 @@
 """
 Database connection management using SQLAlchemy Core
+
+Two engines share the same configuration:
+- get_async_engine(): aiomysql-backed AsyncEngine used by the API, the auth
+  dependency and the WebSocket poller, so queries never block the event loop
+- get_engine(): synchronous PyMySQL engine for the simulator and scripts
 """
 import os
-from typing import Optional
+import time
+from typing import Optional, Dict, Any
 from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Engine
-from sqlalchemy.pool import QueuePool
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from dotenv import load_dotenv
+from app.core.metrics import DB_POOL_WAIT_SECONDS
+from app.db.query_stats import instrument_engine
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Global engine instance
+# Global engine instances
 _engine: Optional[Engine] = None
+_async_engine: Optional[AsyncEngine] = None
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waits (db_pool_checkout_seconds)."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - start, "sync")
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records how long each checkout waits."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - start, "async")
+
+
+def get_db_settings() -> Dict[str, Any]:
+    """
+    Read the database configuration from environment variables.
+
+    Returns:
+        Dictionary with host, port, user, password and database
+    """
+    return {
+        "host": os.getenv("DB_HOST", "localhost"),
+        "port": int(os.getenv("DB_PORT", "3307")),
+        "user": os.getenv("DB_USER", "root"),
+        "password": os.getenv("DB_PASSWORD", "root"),
+        "database": os.getenv("DB_NAME", "mymedql"),
+    }
+
+
+def _build_connection_string(driver: str) -> str:
+    """
+    Build the database URL from environment variables.
+
+    Args:
+        driver: SQLAlchemy dialect+driver (e.g. "mysql+pymysql")
+
+    Returns:
+        Database connection string
+    """
+    settings = get_db_settings()
+    return (
+        f"{driver}://{settings['user']}:{settings['password']}"
+        f"@{settings['host']}:{settings['port']}/{settings['database']}"
+    )
 
 
 def get_engine() -> Engine:
@@ -26,32 +91,46 @@ def get_engine() -> Engine:
     global _engine
     
     if _engine is None:
-        # Read database configuration from environment variables
-        db_host = os.getenv("DB_HOST", "localhost")
-        db_port = int(os.getenv("DB_PORT", "3307"))
-        db_name = os.getenv("DB_NAME", "mymedql")
-        db_user = os.getenv("DB_USER", "root")
-        db_password = os.getenv("DB_PASSWORD", "root")
-        
-        # Build connection string
-        connection_string = (
-            f"mysql+pymysql://{db_user}:{db_password}"
-            f"@{db_host}:{db_port}/{db_name}"
-        )
+        connection_string = _build_connection_string("mysql+pymysql")
         
         # Create engine with connection pooling
         _engine = create_engine(
             connection_string,
-            poolclass=QueuePool,
-            pool_size=10,
-            max_overflow=20,
+            poolclass=TimedQueuePool,
+            pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
             pool_pre_ping=True,  # Verify connections before using
             echo=False,  # Set to True for SQL debugging
         )
+        instrument_engine(_engine, "sync")
     
     return _engine
 
 
+def get_async_engine() -> AsyncEngine:
+    """
+    Get or create the async database engine (aiomysql driver).
+    Uses connection pooling for efficiency.
+    
+    Returns:
+        SQLAlchemy AsyncEngine instance
+    """
+    global _async_engine
+    
+    if _async_engine is None:
+        _async_engine = create_async_engine(
+            _build_connection_string("mysql+aiomysql"),
+            poolclass=TimedAsyncQueuePool,
+            pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+            pool_pre_ping=True,  # Verify connections before using
+            echo=False,  # Set to True for SQL debugging
+        )
+        instrument_engine(_async_engine.sync_engine, "async")
+    
+    return _async_engine
+
+
 def test_connection() -> bool:
     """
     Test the database connection.
@@ -80,3 +159,12 @@ def close_connection():
         _engine.dispose()
         _engine = None
 
+
+async def close_async_connection():
+    """
+    Close the async database engine and all connections.
+    """
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
@@ -0,0 +1,351 @@
+"""
+Micro-batched vitals ingestion
+
+Readings from all HTTP callers go into one in-process buffer. A single
+flusher task writes them with multi-row INSERTs when either INGEST_BATCH_ROWS
+rows are waiting or the oldest one has waited INGEST_FLUSH_MS, and each
+caller is answered once the transaction holding its rows has committed.
+With ALERT_ENGINE=app (or once trg_vitals_threshold_alert has been dropped)
+the batch's threshold alerts are written in that same transaction (see
+alert_rules.py); with ADMISSION_CHECK=app (or once
+trg_vitals_validate_admission has been dropped) rows for patients without an
+active admission are rejected before the INSERT (see admissions.py).
+
+With INGEST_SPOOL_DIR set, batches are appended to a durable on-disk spool
+instead and callers are answered once their rows are on disk; the spool's
+drainer writes them to MySQL, riding out database outages. Rows the database
+refuses are then recorded in the spool's rejected.jsonl rather than returned.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Any, List, Optional, Tuple
+from sqlalchemy import text
+from app.db.database import get_async_engine
+from app.db.alert_rules import PendingAlerts, app_alerts_async, get_rules_engine
+from app.db.admissions import app_admission_check_async, get_admission_cache
+from app.core.metrics import INGEST_ROWS
+
+INGEST_BATCH_ROWS = int(os.getenv("INGEST_BATCH_ROWS", "500"))
+INGEST_FLUSH_MS = float(os.getenv("INGEST_FLUSH_MS", "50"))
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "20000"))
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR")  # Spool batches to disk first (see spool.py)
+
+INSERT_VITALS_SQL = """
+    INSERT INTO vitals (
+        patient_id, device_id, ts, heart_rate, spo2,
+        bp_systolic, bp_diastolic, temperature_c, respiration, metadata
+    )
+    VALUES (
+        :patient_id, :device_id, :ts, :heart_rate, :spo2,
+        :bp_systolic, :bp_diastolic, :temperature_c, :respiration, :metadata
+    )
+"""
+
+
+# Server errors that mean "this row is unacceptable", so retrying it can never succeed:
+# SIGNAL from a trigger (e.g. no active admission), foreign key, duplicate key,
+# NULL in a NOT NULL column, out-of-range / invalid value. Anything else (deadlock,
+# lock wait timeout, shutdown, read-only during failover, lost connection...) is
+# transient and says nothing about the rows.
+ROW_REJECTION_CODES = frozenset({1644, 1452, 1062, 1048, 1264, 1366})
+
+
+class IngestBufferFull(Exception):
+    """Raised when accepting more rows would exceed the buffer capacity."""
+
+
+@dataclass
+class _Submission:
+    """One caller's rows: per-row errors, and a future resolved when all are flushed."""
+    errors: List[Optional[str]]
+    remaining: int
+    future: asyncio.Future
+
+
+def _server_error_code(error: Exception) -> Optional[int]:
+    """MySQL error code of a DBAPI error wrapped by SQLAlchemy, if any."""
+    args = getattr(getattr(error, "orig", None), "args", None)
+    if args and isinstance(args[0], int):
+        return args[0]
+    return None
+
+
+def _is_row_rejection(error: Exception) -> bool:
+    """Whether the server refused the rows themselves (see ROW_REJECTION_CODES)."""
+    return _server_error_code(error) in ROW_REJECTION_CODES
+
+
+class VitalsIngestBuffer:
+    """
+    Bounded buffer of vitals rows flushed to MySQL in batches.
+
+    A batch is one transaction. If the server rejects it (e.g. the admission
+    trigger refuses a reading for a discharged patient), its rows are retried
+    one per transaction so only the offending rows fail.
+    """
+
+    def __init__(
+        self,
+        batch_rows: int = INGEST_BATCH_ROWS,
+        flush_ms: float = INGEST_FLUSH_MS,
+        max_pending: int = INGEST_MAX_PENDING,
+        spool_dir: Optional[str] = INGEST_SPOOL_DIR
+    ):
+        """
+        Initialize the buffer.
+
+        Args:
+            batch_rows: Rows per INSERT / transaction (flush as soon as this many wait)
+            flush_ms: Longest a row waits before a partial batch is flushed
+            max_pending: Rows the buffer holds before callers get backpressure
+            spool_dir: Spool directory to write batches to instead of MySQL
+        """
+        self.batch_rows = max(1, batch_rows)
+        self.flush_delay = flush_ms / 1000.0
+        self.max_pending = max(self.batch_rows, max_pending)
+        # (row, submission, index in submission, monotonic arrival time)
+        self.pending: Deque[tuple] = deque()
+        self.rows_ingested = 0
+        self.rows_rejected = 0
+        self.rows_refused = 0
+        self.batches = 0
+        self.last_flush_ms = 0.0
+        self.spool_dir = spool_dir
+        self.spool = None
+        self.running = False
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Start the flusher task."""
+        if self.running:
+            return
+        if self.spool_dir:
+            # Imported here: the spool reuses this module's INSERT
+            from app.db.spool import get_spool
+            self.spool = await asyncio.to_thread(get_spool, self.spool_dir)
+        self.running = True
+        self._task = asyncio.create_task(self._flush_loop())
+        print("🚀 Vitals ingest buffer started")
+
+    async def stop(self):
+        """Flush what is still buffered, then stop the flusher task."""
+        self.running = False
+        self._wakeup.set()
+        if self._task:
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self.spool:
+            from app.db.spool import stop_spool
+            await asyncio.to_thread(stop_spool, self.spool_dir)
+            self.spool = None
+        print("🛑 Vitals ingest buffer stopped")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get ingest statistics.
+
+        Returns:
+            Dictionary with pending rows, counters and the last flush duration
+        """
+        return {
+            "pending": len(self.pending),
+            "rows_ingested": self.rows_ingested,
+            "rows_rejected": self.rows_rejected,
+            "rows_refused": self.rows_refused,
+            "batches": self.batches,
+            "avg_batch_rows": self.rows_ingested / self.batches if self.batches else 0.0,
+            "last_flush_ms": self.last_flush_ms,
+            "spool": self.spool.get_stats() if self.spool else None,
+        }
+
+    async def submit(self, rows: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """
+        Queue rows and wait until they are committed.
+
+        Args:
+            rows: Insert parameters (see INSERT_VITALS_SQL)
+
+        Returns:
+            One entry per row: None if stored, otherwise the error the
+            database rejected it with
+
+        Raises:
+            IngestBufferFull: If the buffer cannot take the rows right now
+            Exception: The database error if a batch could not be written at all
+        """
+        if not rows:
+            return []
+        if not self.running:
+            raise IngestBufferFull("Ingest buffer is not running")
+        if len(self.pending) + len(rows) > self.max_pending:
+            self.rows_refused += len(rows)
+            INGEST_ROWS.inc(len(rows), "refused")
+            raise IngestBufferFull(f"Ingest buffer full ({len(self.pending)} rows pending)")
+
+        submission = _Submission(
+            errors=[None] * len(rows),
+            remaining=len(rows),
+            future=asyncio.get_running_loop().create_future()
+        )
+        now = time.monotonic()
+        for index, row in enumerate(rows):
+            self.pending.append((row, submission, index, now))
+        self._wakeup.set()
+        # Shielded: a caller that disconnects must not cancel the shared result
+        return await asyncio.shield(submission.future)
+
+    async def _flush_loop(self):
+        """Wait for a full batch or the oldest row's deadline, then flush."""
+        while self.running or self.pending:
+            if not self.pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            deadline = self.pending[0][3] + self.flush_delay
+            while self.running and len(self.pending) < self.batch_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            batch = [self.pending.popleft() for _ in range(min(self.batch_rows, len(self.pending)))]
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                print(f"❌ Error flushing vitals batch: {e}")
+                self._fail(batch, e)
+
+    async def _flush(self, batch: List[tuple]):
+        """Insert one batch and answer the callers whose rows it carried."""
+        rows = [item[0] for item in batch]
+        started = time.perf_counter()
+        engine = get_async_engine()
+        try:
+            if self.spool:
+                await asyncio.to_thread(self.spool.append, rows)
+                errors: List[Optional[str]] = [None] * len(rows)
+            else:
+                async with engine.begin() as conn:
+                    errors, pending = await self._write(conn, rows)
+                if pending is not None:
+                    pending.commit()
+        except Exception as e:
+            if not _is_row_rejection(e):
+                # Transient and client/connection errors say nothing about the rows
+                raise
+            errors = await self._insert_individually(rows)
+
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+        self.batches += 1
+        self._resolve(batch, errors)
+
+    async def _write(self, conn, rows: List[Dict[str, Any]]) -> Tuple[List[Optional[str]], Optional[PendingAlerts]]:
+        """
+        Insert rows in the caller's transaction.
+
+        Returns:
+            (one error or None per row, alert state to commit after the
+            transaction, or None if alerts were left to the trigger)
+        """
+        errors: List[Optional[str]] = [None] * len(rows)
+        pending = None
+        if await app_admission_check_async(conn):
+            rows, errors = await get_admission_cache().check_async(conn, rows)
+        if rows:
+            await conn.execute(text(INSERT_VITALS_SQL), rows)
+            if await app_alerts_async(conn):
+                pending = await get_rules_engine().apply_async(conn, rows)
+        return errors, pending
+
+    async def _insert_individually(self, rows: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """Retry a rejected batch one row per transaction to isolate bad rows."""
+        engine = get_async_engine()
+        errors: List[Optional[str]] = []
+        for row in rows:
+            try:
+                async with engine.begin() as conn:
+                    row_errors, pending = await self._write(conn, [row])
+                if pending is not None:
+                    pending.commit()
+                errors.extend(row_errors)
+            except Exception as e:
+                orig = getattr(e, "orig", e)
+                errors.append(str(orig.args[1]) if len(getattr(orig, "args", ())) > 1 else str(orig))
+        return errors
+
+    def _fail(self, batch: List[tuple], error: Exception):
+        """Fail the submissions in a batch that could not be written at all."""
+        self.rows_rejected += len(batch)
+        INGEST_ROWS.inc(len(batch), "failed")
+        for _, submission, _, _ in batch:
+            if not submission.future.done():
+                submission.future.set_exception(error)
+
+    def _resolve(self, batch: List[tuple], errors: List[Optional[str]]):
+        """Record per-row results and complete submissions that are fully flushed."""
+        rejected = sum(1 for error in errors if error is not None)
+        INGEST_ROWS.inc(len(batch) - rejected, "accepted")
+        if rejected:
+            INGEST_ROWS.inc(rejected, "rejected")
+        for (row, submission, index, _), error in zip(batch, errors):
+            submission.errors[index] = error
+            submission.remaining -= 1
+            if error is None:
+                self.rows_ingested += 1
+            else:
+                self.rows_rejected += 1
+            if submission.remaining == 0 and not submission.future.done():
+                submission.future.set_result(submission.errors)
+
+
+# Global ingest buffer (started in main.py)
+_buffer: Optional[VitalsIngestBuffer] = None
+
+
+def get_ingest_buffer() -> VitalsIngestBuffer:
+    """
+    Get or create the global ingest buffer.
+
+    Returns:
+        VitalsIngestBuffer instance
+    """
+    global _buffer
+    if _buffer is None:
+        _buffer = VitalsIngestBuffer()
+    return _buffer
+
+
+async def start_ingest_buffer():
+    """Start the global ingest buffer."""
+    await get_ingest_buffer().start()
+
+
+async def stop_ingest_buffer():
+    """Flush and stop the global ingest buffer."""
+    global _buffer
+    if _buffer:
+        await _buffer.stop()
+        _buffer = None
+
+
+def get_ingest_stats() -> Optional[Dict[str, Any]]:
+    """
+    Get statistics of the ingest buffer.
+
+    Returns:
+        Ingest statistics, or None if the buffer is not running
+    """
+    if _buffer is None:
+        return None
+    return _buffer.get_stats()
@@ -0,0 +1,289 @@
+"""
+SQL statement timing and slow-query log
+
+instrument_engine() hooks before_cursor_execute / after_cursor_execute (and
+handle_error, for statements that fail or time out) on an engine
+(get_engine() and the async engine's sync_engine are instrumented when they
+are created) and aggregates every statement by its normalized text:
+literals and placeholders become ?, IN lists and multi-row VALUES collapse
+to one element, and whitespace is squeezed. For each normalized statement
+it keeps the count, total/max time, rows and how many executions failed
+(failed executions count towards the time too).
+
+Statements slower than SLOW_QUERY_MS are logged. For SELECTs the EXPLAIN
+plan is fetched on a background thread through the sync engine, at most
+once per statement every SLOW_QUERY_EXPLAIN_INTERVAL seconds, so a slow
+request is never made slower. The last plan is kept with the statement.
+
+GET /debug/queries (admins) reports the top statements.
+"""
+import os
+import queue
+import re
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Any, List, Optional
+from sqlalchemy import event
+
+QUERY_STATS = os.getenv("QUERY_STATS", "1") == "1"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "1") == "1"
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "300"))
+QUERY_STATS_MAX_STATEMENTS = int(os.getenv("QUERY_STATS_MAX_STATEMENTS", "2000"))
+
+# Only this much of a statement is normalized (multi-row INSERTs can be huge)
+MAX_STATEMENT_CHARS = 2000
+
+ORDER_KEYS = ("total", "max", "mean", "count", "rows", "errors")
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|:\w+\b|\?")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?\b", re.IGNORECASE)
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_VALUE = r"(?:\?|NULL|\w+\(\s*\??\s*\))"
+_VALUES_ROWS = re.compile(rf"(\(\s*{_VALUE}(?:\s*,\s*{_VALUE})*\s*\))(?:\s*,\s*\(\s*{_VALUE}(?:\s*,\s*{_VALUE})*\s*\))+", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def normalize_statement(statement: str) -> str:
+    """
+    Reduce a statement to its shape so executions with different values aggregate.
+
+    Args:
+        statement: SQL as sent to the driver
+
+    Returns:
+        Normalized statement
+    """
+    sql = statement[:MAX_STATEMENT_CHARS]
+    sql = _STRING.sub("?", sql)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _WHITESPACE.sub(" ", sql).strip()
+    sql = _IN_LIST.sub("IN (...)", sql)
+    sql = _VALUES_ROWS.sub(r"\1, ...", sql)
+    if len(statement) > MAX_STATEMENT_CHARS:
+        sql += " …"
+    return sql
+
+
+class QueryStats:
+    """Per normalized statement: executions, time and rows."""
+
+    def __init__(self, max_statements: int = QUERY_STATS_MAX_STATEMENTS):
+        """
+        Args:
+            max_statements: Distinct statements tracked; later ones go to an "(other)" entry
+        """
+        self.max_statements = max_statements
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.since = time.time()
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        statement: str,
+        seconds: float,
+        rows: int,
+        engine: str,
+        slow: bool = False,
+        error: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Add one execution (error=True if it raised).
+
+        Returns:
+            The statement's entry
+        """
+        with self._lock:
+            entry = self.entries.get(statement)
+            if entry is None:
+                if len(self.entries) >= self.max_statements:
+                    statement = "(other)"
+                    entry = self.entries.get(statement)
+                if entry is None:
+                    entry = self.entries[statement] = {
+                        "statement": statement,
+                        "engine": engine,
+                        "count": 0,
+                        "total": 0.0,
+                        "max": 0.0,
+                        "rows": 0,
+                        "slow": 0,
+                        "errors": 0,
+                        "explain": None,
+                        "explained_at": None,
+                    }
+            entry["count"] += 1
+            entry["total"] += seconds
+            entry["rows"] += max(rows, 0)
+            if seconds > entry["max"]:
+                entry["max"] = seconds
+            if slow:
+                entry["slow"] += 1
+            if error:
+                entry["errors"] += 1
+            return entry
+
+    def top(self, limit: int = 20, order_by: str = "total") -> List[Dict[str, Any]]:
+        """
+        Get the statements that dominate database time.
+
+        Args:
+            limit: Number of statements
+            order_by: total, max, mean, count, rows or errors
+
+        Returns:
+            Entries with times in milliseconds, largest first
+        """
+        with self._lock:
+            entries = [dict(entry) for entry in self.entries.values()]
+        for entry in entries:
+            entry["mean"] = entry["total"] / entry["count"] if entry["count"] else 0.0
+        entries.sort(key=lambda entry: entry[order_by], reverse=True)
+        total_time = sum(entry["total"] for entry in entries) or 1.0
+        return [
+            {
+                "statement": entry["statement"],
+                "engine": entry["engine"],
+                "count": entry["count"],
+                "total_ms": entry["total"] * 1000,
+                "mean_ms": entry["mean"] * 1000,
+                "max_ms": entry["max"] * 1000,
+                "rows": entry["rows"],
+                "share": entry["total"] / total_time,
+                "slow": entry["slow"],
+                "errors": entry["errors"],
+                "explain": entry["explain"],
+            }
+            for entry in entries[:limit]
+        ]
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        with self._lock:
+            self.entries.clear()
+            self.since = time.time()
+
+
+# Global statistics (one per process)
+_stats = QueryStats()
+_explain_queue: "queue.Queue" = queue.Queue(maxsize=100)
+_explain_thread: Optional[threading.Thread] = None
+_explain_lock = threading.Lock()
+
+
+def get_query_stats() -> QueryStats:
+    """Get the process's query statistics."""
+    return _stats
+
+
+def _explain_worker():
+    """Fetch EXPLAIN plans for slow SELECTs through the sync engine."""
+    from app.db.database import get_engine
+
+    while True:
+        entry, statement, parameters = _explain_queue.get()
+        try:
+            # Raw DBAPI cursor: same paramstyle as the original statement, and no events fire
+            connection = get_engine().raw_connection()
+            try:
+                cursor = connection.cursor()
+                cursor.execute("EXPLAIN " + statement, parameters)
+                columns = [column[0] for column in cursor.description]
+                plan = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                cursor.close()
+            finally:
+                connection.close()
+            with _stats._lock:
+                entry["explain"] = plan
+            for row in plan:
+                print(
+                    f"   ↳ {row.get('table')}: type={row.get('type')} key={row.get('key')} "
+                    f"rows={row.get('rows')} extra={row.get('Extra')}"
+                )
+        except Exception as e:
+            with _stats._lock:
+                entry["explain"] = [{"error": str(e)}]
+            print(f"   ↳ EXPLAIN failed: {e}")
+
+
+def _request_explain(entry: Dict[str, Any], statement: str, parameters: Any):
+    """Queue an EXPLAIN for a slow SELECT, at most once per interval per statement."""
+    global _explain_thread
+    now = time.monotonic()
+    if entry["explained_at"] is not None and now - entry["explained_at"] < SLOW_QUERY_EXPLAIN_INTERVAL:
+        return
+    entry["explained_at"] = now
+    with _explain_lock:
+        if _explain_thread is None:
+            _explain_thread = threading.Thread(target=_explain_worker, name="slow-query-explain", daemon=True)
+            _explain_thread.start()
+    try:
+        _explain_queue.put_nowait((entry, statement, parameters))
+    except queue.Full:
+        pass
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _make_after_cursor_execute(engine_name: str):
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        try:
+            rows = cursor.rowcount
+        except Exception:
+            rows = 0
+        normalized = normalize_statement(statement)
+        slow = elapsed * 1000 >= SLOW_QUERY_MS
+        entry = _stats.record(normalized, elapsed, rows or 0, engine_name, slow)
+
+        if slow:
+            print(f"🐢 Slow query ({elapsed * 1000:.1f} ms, {rows} rows, {engine_name}): {normalized[:300]}")
+            if SLOW_QUERY_EXPLAIN and not executemany and normalized.lstrip("( ").upper().startswith("SELECT"):
+                _request_explain(entry, statement, parameters)
+    return after_cursor_execute
+
+
+def _make_handle_error(engine_name: str):
+    def handle_error(context):
+        # after_cursor_execute never runs for a failed statement: take its start time here
+        conn = context.connection
+        starts = conn.info.get("query_start") if conn is not None else None
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        if context.statement is None:
+            return
+        normalized = normalize_statement(context.statement)
+        slow = elapsed * 1000 >= SLOW_QUERY_MS
+        _stats.record(normalized, elapsed, 0, engine_name, slow, error=True)
+
+        if slow:
+            print(
+                f"🐢 Slow query failed ({elapsed * 1000:.1f} ms, {engine_name}): {normalized[:300]}\n"
+                f"   ↳ {context.original_exception}"
+            )
+    return handle_error
+
+
+def instrument_engine(engine, name: str):
+    """
+    Time every statement an engine executes (no-op if QUERY_STATS=0).
+
+    Args:
+        engine: Engine (for an AsyncEngine pass its sync_engine)
+        name: Engine label in the report (e.g. "sync", "async")
+    """
+    if not QUERY_STATS:
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _make_after_cursor_execute(name))
+    event.listen(engine, "handle_error", _make_handle_error(name))
@@ -0,0 +1,593 @@
+"""
+Durable on-disk spool for vitals ingestion
+
+Writers append batches to segment files in a spool directory and return as
+soon as the batch is on disk; a drainer thread replays the spool to MySQL in
+order, in transactions of up to SPOOL_DRAIN_ROWS rows, backing off while the
+database is unreachable. Used by db_writer when VITALS_SPOOL_DIR is set and
+by the API ingest buffer when INGEST_SPOOL_DIR is set.
+
+Several processes can share one configured directory (uvicorn workers, scale
+mode shards): each claims the first free numbered sub-spool, <dir>/0,
+<dir>/1, ..., and owns it exclusively. A sub-spool whose process went away
+(e.g. after a restart with fewer workers) is an orphan: drainers look for
+orphans every SPOOL_ORPHAN_INTERVAL seconds and replay them.
+
+Layout of a sub-spool directory:
+- spool.id: random id of this spool (names its checkpoint row)
+- spool.lock: flock held by the process that owns the spool
+- segment-<first seq>.log: append-only frames, rotated at SPOOL_SEGMENT_BYTES
+- rejected.jsonl: rows the database refused (e.g. no active admission)
+
+A frame is a 16-byte header (payload length, CRC32 of the payload, sequence
+number) followed by the batch as JSON. A torn frame at the end of the last
+segment (crash during a write) is truncated on open; a frame with a bad
+checksum ends its segment with a warning.
+
+Replay is idempotent: the last drained sequence number is stored in
+ingest_spool_checkpoints in the same transaction as the rows, so frames are
+applied exactly once even if the process dies between commit and cleanup.
+Segments are deleted once all their frames are checkpointed. Only data
+errors (see ingest.ROW_REJECTION_CODES) send rows to rejected.jsonl; on any
+other error (deadlock, server restart, failover...) the frames stay pending
+and the drainer backs off and retries.
+"""
+import atexit
+import json
+import os
+import struct
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, date
+from decimal import Decimal
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no exclusive spool ownership
+    fcntl = None
+
+from sqlalchemy import text
+from app.db.database import get_engine
+from app.db.ingest import INSERT_VITALS_SQL, _is_row_rejection
+from app.db.alert_rules import PendingAlerts, app_alerts_sync, get_rules_engine
+from app.db.admissions import app_admission_check_sync, get_admission_cache
+
+SPOOL_SEGMENT_BYTES = int(os.getenv("SPOOL_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+SPOOL_DRAIN_ROWS = int(os.getenv("SPOOL_DRAIN_ROWS", "5000"))
+SPOOL_FSYNC = os.getenv("SPOOL_FSYNC", "1") == "1"
+SPOOL_RETRY_MAX = float(os.getenv("SPOOL_RETRY_MAX", "30"))
+SPOOL_MAX_SLOTS = int(os.getenv("SPOOL_MAX_SLOTS", "64"))
+SPOOL_ORPHAN_INTERVAL = float(os.getenv("SPOOL_ORPHAN_INTERVAL", "30"))
+
+HEADER = struct.Struct(">IIQ")  # payload length, crc32, sequence number
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+
+CHECKPOINT_SELECT_SQL = "SELECT last_seq FROM ingest_spool_checkpoints WHERE spool_id = :spool_id"
+CHECKPOINT_UPSERT_SQL = """
+    INSERT INTO ingest_spool_checkpoints (spool_id, last_seq)
+    VALUES (:spool_id, :last_seq)
+    ON DUPLICATE KEY UPDATE last_seq = VALUES(last_seq)
+"""
+
+
+class SpoolInUse(Exception):
+    """Raised when another process owns the spool directory (or every sub-spool of it)."""
+
+
+def _encode(value: Any) -> Any:
+    """JSON encoder for row values."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot spool value of type {type(value).__name__}")
+
+
+def _decode_rows(payload: bytes) -> List[Dict[str, Any]]:
+    """Decode a frame payload back into insert parameters."""
+    rows = json.loads(payload)
+    for row in rows:
+        if isinstance(row.get("ts"), str):
+            row["ts"] = datetime.fromisoformat(row["ts"])
+    return rows
+
+
+def _segment_path(directory: Path, first_seq: int) -> Path:
+    return directory / f"{SEGMENT_PREFIX}{first_seq:020d}{SEGMENT_SUFFIX}"
+
+
+def _segment_first_seq(path: Path) -> int:
+    return int(path.name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+
+def _scan(path: Path, start: int = 0, end: Optional[int] = None):
+    """
+    Iterate over the valid frames of a segment.
+
+    Yields:
+        (seq, payload, offset after the frame)
+
+    Stops at the end of data, at a torn frame, or at a checksum mismatch;
+    the generator's return value says which ("end", "torn" or "corrupt").
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        offset = start
+        while end is None or offset < end:
+            header = f.read(HEADER.size)
+            if not header:
+                return "end"
+            if len(header) < HEADER.size:
+                return "torn"
+            length, crc, seq = HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return "torn"
+            if zlib.crc32(payload) != crc:
+                return "corrupt"
+            offset += HEADER.size + length
+            yield seq, payload, offset
+        return "end"
+
+
+class VitalsSpool:
+    """Segmented append-only spool with an in-process drainer thread."""
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = SPOOL_SEGMENT_BYTES,
+        drain_rows: int = SPOOL_DRAIN_ROWS,
+        fsync: bool = SPOOL_FSYNC
+    ):
+        """
+        Open (or create) a spool directory.
+
+        Args:
+            directory: Spool directory
+            segment_bytes: Size at which a new segment is started
+            drain_rows: Rows per replay transaction (whole frames)
+            fsync: fsync after every append
+
+        Raises:
+            SpoolInUse: If another process holds the spool lock
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self.drain_rows = max(1, drain_rows)
+        self.fsync = fsync
+
+        self._lock_fd = os.open(self.directory / "spool.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(self._lock_fd)
+                raise SpoolInUse(f"Spool {self.directory} is owned by another process")
+
+        id_path = self.directory / "spool.id"
+        if not id_path.exists():
+            id_path.write_text(uuid.uuid4().hex)
+        self.spool_id = id_path.read_text().strip()
+
+        # Writer state
+        self._lock = threading.Lock()
+        self._appended = threading.Condition(self._lock)
+        self.last_seq = 0
+        self._file = None
+        self._file_path: Optional[Path] = None
+        self._file_size = 0
+        self._recover()
+
+        # Drainer state
+        self._read_segment: Optional[Path] = None
+        self._read_offset = 0
+        self.checkpoint: Optional[int] = None
+        self.frames_appended = 0
+        self.rows_appended = 0
+        self.rows_drained = 0
+        self.rows_rejected = 0
+        self.orphans_drained = 0
+        self.db_healthy = True
+        self.last_error: Optional[str] = None
+        self.running = False
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def _segments(self) -> List[Path]:
+        return sorted(self.directory.glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}"), key=_segment_first_seq)
+
+    def _recover(self):
+        """Find the last sequence number and cut a torn tail off the newest segment."""
+        segments = self._segments()
+        if not segments:
+            return
+        last = segments[-1]
+        good_end = 0
+        scanner = _scan(last)
+        while True:
+            try:
+                seq, _, good_end = next(scanner)
+                self.last_seq = seq
+            except StopIteration as stop:
+                if stop.value != "end":
+                    print(f"⚠️  Spool: truncating {stop.value} tail of {last.name} at byte {good_end}")
+                    os.truncate(last, good_end)
+                break
+        if self.last_seq == 0:
+            # Nothing valid in the newest segment: its name still records where it started
+            self.last_seq = _segment_first_seq(last) - 1
+        self._file_path = last
+        self._file = open(last, "ab")
+        self._file_size = good_end
+
+    def _rotate(self):
+        """Start a new segment for the next frame."""
+        if self._file:
+            self._file.close()
+        self._file_path = _segment_path(self.directory, self.last_seq + 1)
+        self._file = open(self._file_path, "ab")
+        self._file_size = 0
+
+    def append(self, rows: List[Dict[str, Any]]) -> int:
+        """
+        Durably append a batch.
+
+        Args:
+            rows: Vitals insert parameters
+
+        Returns:
+            Sequence number of the frame
+        """
+        payload = json.dumps(rows, default=_encode, separators=(",", ":")).encode()
+        with self._lock:
+            if self._file is None or self._file_size >= self.segment_bytes:
+                self._rotate()
+            seq = self.last_seq + 1
+            self._file.write(HEADER.pack(len(payload), zlib.crc32(payload), seq) + payload)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.last_seq = seq
+            self._file_size += HEADER.size + len(payload)
+            self.frames_appended += 1
+            self.rows_appended += len(rows)
+            self._appended.notify_all()
+        return seq
+
+    # ------------------------------------------------------------------
+    # Draining
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Start the drainer thread."""
+        if self.running:
+            return
+        self.running = True
+        self._thread = threading.Thread(target=self._drain_loop, name="vitals-spool-drainer", daemon=True)
+        self._thread.start()
+        print(f"🚀 Vitals spool started ({self.directory}, last seq {self.last_seq})")
+
+    def stop(self, timeout: float = 10.0):
+        """
+        Stop the drainer (after one last drain attempt) and close the spool.
+
+        Frames not yet drained stay on disk for the next run.
+        """
+        with self._lock:
+            self.running = False
+            self._appended.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+        os.close(self._lock_fd)
+        print(f"🛑 Vitals spool stopped ({self.last_seq - (self.checkpoint or 0)} frame(s) pending)")
+
+    def drain(self):
+        """
+        Replay everything on disk in the calling thread, then close the spool.
+
+        Used for orphaned sub-spools. Stops early (leaving the rest on disk)
+        if the database is unavailable.
+        """
+        self.running = False
+        self._drain_loop()
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+        os.close(self._lock_fd)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get spool statistics.
+
+        Returns:
+            Dictionary with sequence numbers, counters and health
+        """
+        segments = self._segments()
+        return {
+            "directory": str(self.directory),
+            "last_seq": self.last_seq,
+            "checkpoint": self.checkpoint,
+            "pending_frames": self.last_seq - (self.checkpoint or 0) if self.checkpoint is not None else None,
+            "segments": len(segments),
+            "bytes": sum(path.stat().st_size for path in segments if path.exists()),
+            "rows_appended": self.rows_appended,
+            "rows_drained": self.rows_drained,
+            "rows_rejected": self.rows_rejected,
+            "orphans_drained": self.orphans_drained,
+            "db_healthy": self.db_healthy,
+            "last_error": self.last_error,
+        }
+
+    def _read_frames(self, after: int) -> List[Tuple[int, List[Dict[str, Any]]]]:
+        """Read the next frames after a sequence number, up to drain_rows rows."""
+        with self._lock:
+            active, active_end = self._file_path, self._file_size
+
+        frames: List[Tuple[int, List[Dict[str, Any]]]] = []
+        rows = 0
+        for path in self._segments():
+            if self._read_segment is not None and _segment_first_seq(path) < _segment_first_seq(self._read_segment):
+                continue
+            if path != self._read_segment:
+                self._read_segment, self._read_offset = path, 0
+            # Never read past what the writer has finished in the active segment
+            end = active_end if path == active else None
+            scanner = _scan(path, self._read_offset, end)
+            while True:
+                try:
+                    seq, payload, offset = next(scanner)
+                except StopIteration as stop:
+                    if stop.value == "corrupt":
+                        print(f"⚠️  Spool: checksum mismatch in {path.name} at byte {self._read_offset}, skipping the rest")
+                        if path == active:
+                            with self._lock:
+                                self._rotate()
+                        self._read_offset = path.stat().st_size
+                    break
+                self._read_offset = offset
+                if seq <= after:
+                    continue
+                frames.append((seq, _decode_rows(payload)))
+                rows += len(frames[-1][1])
+                if rows >= self.drain_rows:
+                    return frames
+            if path == active:
+                break
+        return frames
+
+    def _write_rows(
+        self,
+        conn,
+        rows: List[Dict[str, Any]],
+        parent: Optional[PendingAlerts] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[PendingAlerts]]:
+        """
+        Insert rows like the ingest buffer does.
+
+        Args:
+            conn: Connection inside the drain transaction
+            rows: Rows to insert
+            parent: Alert state of the enclosing transaction (when in a savepoint)
+
+        Returns:
+            (rows rejected up front, alert state to commit once the rows are
+            committed, or None if alerts were left to the trigger)
+        """
+        rejected: List[Dict[str, Any]] = []
+        pending = None
+        if app_admission_check_sync(conn):
+            accepted, errors = get_admission_cache().check_sync(conn, rows)
+            rejected = [dict(row, error=error) for row, error in zip(rows, errors) if error]
+            rows = accepted
+        if rows:
+            conn.execute(text(INSERT_VITALS_SQL), rows)
+            if app_alerts_sync(conn):
+                pending = get_rules_engine().apply_sync(conn, rows, parent)
+        return rejected, pending
+
+    def _write_isolating(self, conn, rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Optional[PendingAlerts]]:
+        """Insert rows one per savepoint so only the rows the server refuses are dropped."""
+        rejected: List[Dict[str, Any]] = []
+        pending: Optional[PendingAlerts] = None
+        for row in rows:
+            try:
+                with conn.begin_nested():
+                    row_rejected, row_pending = self._write_rows(conn, [row], pending)
+                rejected.extend(row_rejected)
+                # A released savepoint's alerts belong to the drain transaction
+                if row_pending is not None:
+                    if pending is None:
+                        pending = row_pending
+                    else:
+                        row_pending.commit()
+            except Exception as e:
+                if not _is_row_rejection(e):
+                    # e.g. a deadlock or shutdown: retry the whole drain later
+                    raise
+                orig = getattr(e, "orig", e)
+                rejected.append(dict(row, error=str(orig.args[1]) if len(orig.args) > 1 else str(orig)))
+        return rejected, pending
+
+    def _apply(self, frames: List[Tuple[int, List[Dict[str, Any]]]], isolate: bool) -> List[Dict[str, Any]]:
+        """Write frames and advance the checkpoint in one transaction."""
+        rows = [row for _, frame_rows in frames for row in frame_rows]
+        with get_engine().begin() as conn:
+            rejected, pending = self._write_isolating(conn, rows) if isolate else self._write_rows(conn, rows)
+            conn.execute(text(CHECKPOINT_UPSERT_SQL), {"spool_id": self.spool_id, "last_seq": frames[-1][0]})
+        if pending is not None:
+            pending.commit()
+        return rejected
+
+    def _record_rejected(self, rejected: List[Dict[str, Any]]):
+        """Keep refused rows for inspection."""
+        self.rows_rejected += len(rejected)
+        with open(self.directory / "rejected.jsonl", "a") as f:
+            for row in rejected:
+                f.write(json.dumps(row, default=_encode) + "\n")
+        print(f"⚠️  Spool: {len(rejected)} row(s) rejected by the database (see rejected.jsonl)")
+
+    def _purge(self):
+        """Delete segments whose frames are all checkpointed."""
+        segments = self._segments()
+        for path, following in zip(segments, segments[1:]):
+            if _segment_first_seq(following) - 1 <= self.checkpoint and path != self._read_segment:
+                path.unlink()
+
+    def _drain_orphans(self):
+        """Replay the sub-spools next to this one that no process owns any more."""
+        for path in _spool_candidates(self.directory.parent):
+            if path == self.directory:
+                continue
+            try:
+                orphan = VitalsSpool(str(path), self.segment_bytes, self.drain_rows, fsync=False)
+            except SpoolInUse:
+                continue
+            orphan.drain()
+            if orphan.checkpoint is not None and orphan.rows_drained + orphan.rows_rejected:
+                self.orphans_drained += 1
+                print(f"📥 Spool: replayed orphaned {path} ({orphan.rows_drained} row(s), last seq {orphan.last_seq})")
+
+    def _drain_loop(self):
+        """Replay frames to the database until stopped."""
+        backoff = 0.5
+        frames: List[Tuple[int, List[Dict[str, Any]]]] = []
+        next_orphan_check = time.monotonic() if self.running else None
+        while True:
+            try:
+                if self.checkpoint is None:
+                    with get_engine().connect() as conn:
+                        value = conn.execute(text(CHECKPOINT_SELECT_SQL), {"spool_id": self.spool_id}).scalar()
+                    self.checkpoint = int(value or 0)
+                    self._read_segment, self._read_offset = None, 0
+
+                if not frames:
+                    frames = self._read_frames(self.checkpoint)
+                if not frames and next_orphan_check is not None and time.monotonic() >= next_orphan_check:
+                    next_orphan_check = time.monotonic() + SPOOL_ORPHAN_INTERVAL
+                    self._drain_orphans()
+                if not frames:
+                    with self._lock:
+                        if not self.running:
+                            return
+                        if self.last_seq <= self.checkpoint:
+                            self._appended.wait(timeout=1.0)
+                    continue
+
+                try:
+                    rejected = self._apply(frames, isolate=False)
+                except Exception as e:
+                    if not _is_row_rejection(e):
+                        # Transient: back off and retry without moving the checkpoint
+                        raise
+                    # The server refused part of the batch: find the offending rows
+                    rejected = self._apply(frames, isolate=True)
+
+                if rejected:
+                    self._record_rejected(rejected)
+                self.rows_drained += sum(len(frame_rows) for _, frame_rows in frames) - len(rejected)
+                self.checkpoint = frames[-1][0]
+                frames = []
+                self._purge()
+                self.db_healthy, self.last_error, backoff = True, None, 0.5
+            except Exception as e:
+                if self.db_healthy:
+                    print(f"❌ Spool: database unavailable, holding {self.last_seq - (self.checkpoint or 0)} frame(s): {e}")
+                self.db_healthy, self.last_error = False, str(e)
+                if not self.running:
+                    return
+                time.sleep(backoff)
+                backoff = min(backoff * 2, SPOOL_RETRY_MAX)
+
+
+def _spool_candidates(directory: Path) -> List[Path]:
+    """Existing spools under a configured directory: its numbered sub-spools, and the directory itself if it is one."""
+    candidates = [directory] if (directory / "spool.id").exists() else []
+    if directory.is_dir():
+        candidates.extend(sorted(
+            (path for path in directory.iterdir() if path.name.isdigit() and (path / "spool.id").exists()),
+            key=lambda path: int(path.name)
+        ))
+    return candidates
+
+
+def open_spool_slot(directory: str) -> VitalsSpool:
+    """
+    Open the first sub-spool of a directory no other process owns.
+
+    Args:
+        directory: Configured spool directory (shared by workers / shards)
+
+    Returns:
+        VitalsSpool for <directory>/<slot>
+
+    Raises:
+        SpoolInUse: If all SPOOL_MAX_SLOTS sub-spools are owned
+    """
+    for slot in range(SPOOL_MAX_SLOTS):
+        try:
+            return VitalsSpool(str(Path(directory) / str(slot)))
+        except SpoolInUse:
+            continue
+    raise SpoolInUse(
+        f"All {SPOOL_MAX_SLOTS} sub-spools of {directory} are owned by other processes "
+        f"(raise SPOOL_MAX_SLOTS for more workers/shards)"
+    )
+
+
+# Global spools (one per configured directory per process)
+_spools: Dict[str, VitalsSpool] = {}
+_spools_lock = threading.Lock()
+
+
+def get_spool(directory: str) -> VitalsSpool:
+    """
+    Get the process's spool for a directory, claiming a sub-spool and starting its drainer on first use.
+
+    Args:
+        directory: Configured spool directory
+
+    Returns:
+        VitalsSpool instance
+    """
+    with _spools_lock:
+        spool = _spools.get(directory)
+        if spool is None:
+            spool = _spools[directory] = open_spool_slot(directory)
+            spool.start()
+            # Give the drainer a last chance to empty the spool when a script exits
+            atexit.register(stop_spool, directory)
+        return spool
+
+
+def stop_spool(directory: str):
+    """Stop and close a spool opened with get_spool()."""
+    with _spools_lock:
+        spool = _spools.pop(directory, None)
+    if spool:
+        spool.stop()
+
+
+def get_spool_stats(directory: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Get statistics of a spool.
+
+    Returns:
+        Spool statistics, or None if it is not open in this process
+    """
+    spool = _spools.get(directory) if directory else None
+    return spool.get_stats() if spool else None
@@ -0,0 +1,341 @@
+"""
+Per-patient snapshot cache for GET /api/patients/{id}/summary
+
+vw_patient_summary aggregates over all of vitals and alerts, so serving the
+summary from it costs the same whatever the patient. Instead, the first
+request for a patient loads the view row once (a cold miss), and the
+snapshot is then kept current from the broadcasts every worker already
+sees (poller, CDC or relayed from the cluster leader):
+
+- vitals rows update total_vital_readings, last_vital_ts and the latest_*
+  values (the reading with the newest ts wins, like the view)
+- alert_created events count towards alerts_last_24h and unresolved_alerts;
+  alert_acknowledged events decrement unresolved_alerts
+
+The cold-miss queries run in one transaction, so the view row and the
+patient's highest vitals_id / alert_id come from the same snapshot. Events
+broadcast while they run are buffered and replayed on top, and rows at or
+below those IDs are skipped, so nothing is counted twice.
+
+Demographics and admission status only change through rare writes; a
+snapshot is reloaded after SUMMARY_CACHE_TTL seconds, which also bounds any
+drift (e.g. a row that committed out of order around the cold miss).
+"""
+import os
+import time
+from typing import Dict, Any, List, Optional
+from sqlalchemy import text
+
+SUMMARY_CACHE = os.getenv("SUMMARY_CACHE", "1") == "1"
+SUMMARY_CACHE_TTL = float(os.getenv("SUMMARY_CACHE_TTL", "300"))
+
+ALERT_WINDOW_SECONDS = 24 * 3600
+
+LATEST_FIELDS = {
+    "latest_heart_rate": "heart_rate",
+    "latest_spo2": "spo2",
+    "latest_bp_systolic": "bp_systolic",
+    "latest_bp_diastolic": "bp_diastolic",
+    "latest_temperature_c": "temperature_c",
+    "latest_respiration": "respiration",
+}
+
+PATIENT_SUMMARY_SQL = text("""
+    SELECT
+        patient_id,
+        full_name,
+        gender,
+        room_id,
+        total_vital_readings,
+        last_vital_ts,
+        latest_heart_rate,
+        latest_spo2,
+        latest_bp_systolic,
+        latest_bp_diastolic,
+        latest_temperature_c,
+        latest_respiration,
+        alerts_last_24h,
+        unresolved_alerts,
+        admission_status,
+        admitted_at
+    FROM vw_patient_summary
+    WHERE patient_id = :pid
+""")
+
+MAX_VITALS_ID_SQL = text("SELECT COALESCE(MAX(vitals_id), 0) FROM vitals WHERE patient_id = :pid")
+
+# Seconds each alert of the last 24h has left in the window, and the newest alert_id
+RECENT_ALERTS_SQL = text("""
+    SELECT TIMESTAMPDIFF(MICROSECOND, NOW(), created_at + INTERVAL 24 HOUR) / 1000000 AS remaining
+    FROM alerts
+    WHERE patient_id = :pid AND created_at >= NOW() - INTERVAL 24 HOUR
+""")
+
+MAX_ALERT_ID_SQL = text("SELECT COALESCE(MAX(alert_id), 0) FROM alerts WHERE patient_id = :pid")
+
+
+class PatientSnapshot:
+    """Summary of one patient, updated in place by broadcasts."""
+
+    def __init__(
+        self,
+        summary: Dict[str, Any],
+        max_vitals_id: int,
+        max_alert_id: int,
+        alert_expiries: List[float],
+        loaded_at: float
+    ):
+        """
+        Args:
+            summary: vw_patient_summary row
+            max_vitals_id: Highest vitals_id the row already counts
+            max_alert_id: Highest alert_id the row already counts
+            alert_expiries: Monotonic times the alerts of the last 24h leave the window
+            loaded_at: Monotonic time of the cold miss
+        """
+        self.summary = dict(summary)
+        self.summary["total_vital_readings"] = int(self.summary["total_vital_readings"] or 0)
+        self.summary["unresolved_alerts"] = int(self.summary["unresolved_alerts"] or 0)
+        self.max_vitals_id = max_vitals_id
+        self.max_alert_id = max_alert_id
+        self.alert_expiries = sorted(alert_expiries)
+        self.loaded_at = loaded_at
+
+    def apply_vitals(self, row: Dict[str, Any]):
+        """Count a new reading and make it the latest if it is the newest."""
+        vitals_id = row.get("vitals_id")
+        if vitals_id is not None:
+            if vitals_id <= self.max_vitals_id:
+                return  # Already in the loaded row (or a replayed broadcast)
+            self.max_vitals_id = vitals_id
+
+        summary = self.summary
+        summary["total_vital_readings"] += 1
+        ts, last_ts = row.get("ts"), summary["last_vital_ts"]
+        try:
+            newest = last_ts is None or (ts is not None and ts >= last_ts)
+        except TypeError:
+            newest = True
+        if newest:
+            summary["last_vital_ts"] = ts
+            for field, column in LATEST_FIELDS.items():
+                summary[field] = row.get(column)
+
+    def apply_alert(self, event_type: str, alert: Dict[str, Any]):
+        """Count a new alert, or an acknowledgement of an open one."""
+        if event_type == "alert_created":
+            alert_id = alert.get("alert_id")
+            if alert_id is not None:
+                if alert_id <= self.max_alert_id:
+                    return
+                self.max_alert_id = alert_id
+            self.alert_expiries.append(time.monotonic() + ALERT_WINDOW_SECONDS)
+            if alert.get("acknowledged_at") is None:
+                self.summary["unresolved_alerts"] += 1
+        elif event_type == "alert_acknowledged":
+            self.summary["unresolved_alerts"] = max(0, self.summary["unresolved_alerts"] - 1)
+
+    def get(self, now: float) -> Dict[str, Any]:
+        """Get the summary as the view would return it now."""
+        expired = 0
+        while expired < len(self.alert_expiries) and self.alert_expiries[expired] <= now:
+            expired += 1
+        if expired:
+            del self.alert_expiries[:expired]
+        return {**self.summary, "alerts_last_24h": len(self.alert_expiries)}
+
+
+class SummaryCache:
+    """Patient ID -> PatientSnapshot, loaded on first request and kept current by broadcasts."""
+
+    def __init__(self, ttl: float = SUMMARY_CACHE_TTL):
+        """
+        Initialize an empty cache.
+
+        Args:
+            ttl: Seconds before a snapshot is reloaded from the view
+        """
+        self.ttl = ttl
+        self.snapshots: Dict[int, PatientSnapshot] = {}
+        # Patient ID -> events broadcast while its cold miss is loading
+        self.loading: Dict[int, List[tuple]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.rows_applied = 0
+        self.alerts_applied = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics.
+
+        Returns:
+            Dictionary with the snapshot count and counters
+        """
+        lookups = self.hits + self.misses
+        return {
+            "snapshots": len(self.snapshots),
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "rows_applied": self.rows_applied,
+            "alerts_applied": self.alerts_applied,
+        }
+
+    def invalidate(self, patient_id: Optional[int] = None):
+        """
+        Drop a patient's snapshot (or all of them) so the next request reloads it.
+
+        Args:
+            patient_id: Patient to drop; None drops every snapshot
+        """
+        if patient_id is None:
+            self.snapshots.clear()
+        else:
+            self.snapshots.pop(patient_id, None)
+
+    def on_vitals(self, rows: List[Dict[str, Any]]):
+        """Apply broadcast vitals rows to the snapshots they belong to."""
+        snapshots, loading = self.snapshots, self.loading
+        if not snapshots and not loading:
+            return
+        for row in rows:
+            patient_id = row.get("patient_id")
+            snapshot = snapshots.get(patient_id)
+            if snapshot is not None:
+                snapshot.apply_vitals(row)
+                self.rows_applied += 1
+            elif patient_id in loading:
+                loading[patient_id].append(("vitals", row))
+
+    def on_patient_message(self, patient_id: int, message: Dict[str, Any]):
+        """Apply a broadcast alert event to the patient's snapshot."""
+        event_type = message.get("type")
+        if event_type not in ("alert_created", "alert_acknowledged"):
+            return
+        alert = message.get("alert") or {}
+        snapshot = self.snapshots.get(patient_id)
+        if snapshot is not None:
+            snapshot.apply_alert(event_type, alert)
+            self.alerts_applied += 1
+        elif patient_id in self.loading:
+            self.loading[patient_id].append((event_type, alert))
+
+    async def get_summary(self, patient_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Get a patient's summary from the snapshot, loading it on a cold miss.
+
+        Args:
+            patient_id: Patient ID
+
+        Returns:
+            Summary dictionary (same fields as vw_patient_summary), or None
+            if the patient does not exist
+        """
+        now = time.monotonic()
+        snapshot = self.snapshots.get(patient_id)
+        if snapshot is not None and now - snapshot.loaded_at < self.ttl:
+            self.hits += 1
+            return snapshot.get(now)
+
+        self.misses += 1
+        self.snapshots.pop(patient_id, None)
+        owner = patient_id not in self.loading
+        if owner:
+            self.loading[patient_id] = []
+        try:
+            snapshot = await self._load(patient_id)
+        except BaseException:
+            if owner:
+                self.loading.pop(patient_id, None)
+            raise
+        if snapshot is None:
+            if owner:
+                self.loading.pop(patient_id, None)
+            return None
+
+        # Concurrent misses for the same patient: the first one installs its snapshot
+        if owner:
+            for event in self.loading.pop(patient_id, []):
+                if event[0] == "vitals":
+                    snapshot.apply_vitals(event[1])
+                else:
+                    snapshot.apply_alert(event[0], event[1])
+            self.snapshots[patient_id] = snapshot
+        return snapshot.get(time.monotonic())
+
+    async def _load(self, patient_id: int) -> Optional[PatientSnapshot]:
+        """Read the view row and the IDs it covers in one transaction."""
+        from app.db.database import get_async_engine
+
+        params = {"pid": patient_id}
+        engine = get_async_engine()
+        async with engine.connect() as conn:
+            summary = (await conn.execute(PATIENT_SUMMARY_SQL, params)).fetchone()
+            if not summary:
+                return None
+            max_vitals_id = (await conn.execute(MAX_VITALS_ID_SQL, params)).scalar()
+            max_alert_id = (await conn.execute(MAX_ALERT_ID_SQL, params)).scalar()
+            remaining = (await conn.execute(RECENT_ALERTS_SQL, params)).scalars().all()
+            await conn.commit()
+
+        loaded_at = time.monotonic()
+        return PatientSnapshot(
+            dict(summary._mapping),
+            int(max_vitals_id or 0),
+            int(max_alert_id or 0),
+            [loaded_at + float(seconds) for seconds in remaining if seconds is not None],
+            loaded_at
+        )
+
+
+# Global cache (one per worker process)
+_cache = SummaryCache()
+
+
+def get_summary_cache() -> SummaryCache:
+    """Get the process's summary cache."""
+    return _cache
+
+
+async def get_patient_summary(patient_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Get a patient's summary (from the snapshot cache unless SUMMARY_CACHE=0).
+
+    Args:
+        patient_id: Patient ID
+
+    Returns:
+        Summary dictionary, or None if the patient does not exist
+    """
+    if SUMMARY_CACHE:
+        return await _cache.get_summary(patient_id)
+
+    from app.db.database import get_async_engine
+
+    engine = get_async_engine()
+    async with engine.connect() as conn:
+        summary = (await conn.execute(PATIENT_SUMMARY_SQL, {"pid": patient_id})).fetchone()
+    return dict(summary._mapping) if summary else None
+
+
+def invalidate_patient_summary(patient_id: Optional[int] = None):
+    """
+    Reload a patient's summary on its next request (after a write the broadcasts do not carry).
+
+    Args:
+        patient_id: Patient to reload; None reloads every patient
+    """
+    _cache.invalidate(patient_id)
+
+
+def get_summary_cache_stats() -> Optional[Dict[str, Any]]:
+    """
+    Get summary cache statistics.
+
+    Returns:
+        Cache statistics, or None if SUMMARY_CACHE=0
+    """
+    if not SUMMARY_CACHE:
+        return None
+    return _cache.get_stats()
@@ -0,0 +1,140 @@
+"""
+Drop and recreate the vitals triggers from sql/ddl/triggers.sql
+
+Used when a check moves from a trigger into the application
+(ALERT_ENGINE=app, ADMISSION_CHECK=app) and by the benchmarks that compare
+both. Creating a trigger with binary logging on needs SUPER or
+log_bin_trust_function_creators=1.
+
+Dropping a trigger affects every process writing to the database, not only
+the one configured to replace it. TriggerProbe lets writers notice that a
+trigger is gone and run the application-side check themselves.
+"""
+import os
+import re
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+TRIGGERS_SQL_PATH = Path(__file__).resolve().parents[2] / "sql" / "ddl" / "triggers.sql"
+
+VALIDATE_ADMISSION_TRIGGER = "trg_vitals_validate_admission"
+THRESHOLD_ALERT_TRIGGER = "trg_vitals_threshold_alert"
+
+TRIGGER_CHECK_TTL = float(os.getenv("TRIGGER_CHECK_TTL", "5"))
+
+TRIGGER_EXISTS_SQL = """
+    SELECT COUNT(*) FROM information_schema.TRIGGERS
+    WHERE TRIGGER_SCHEMA = DATABASE() AND TRIGGER_NAME = %s
+"""
+
+
+@lru_cache(maxsize=None)
+def trigger_definition(name: str) -> str:
+    """
+    Get a trigger's CREATE TRIGGER statement from triggers.sql.
+
+    Args:
+        name: Trigger name
+
+    Returns:
+        The statement without the DELIMITER wrapper
+    """
+    sql = TRIGGERS_SQL_PATH.read_text()
+    match = re.search(rf"(CREATE TRIGGER {re.escape(name)}\b.*?\bEND)\$\$", sql, re.DOTALL)
+    if not match:
+        raise ValueError(f"Trigger {name} not found in {TRIGGERS_SQL_PATH}")
+    return match.group(1)
+
+
+def drop_trigger_sql(name: str) -> str:
+    """DROP TRIGGER statement for a trigger."""
+    return f"DROP TRIGGER IF EXISTS {name}"
+
+
+def trigger_exists(conn, name: str) -> bool:
+    """
+    Check whether a trigger exists (sync connection).
+
+    Args:
+        conn: Connection
+        name: Trigger name
+
+    Returns:
+        True if the trigger is defined in the current database
+    """
+    return conn.exec_driver_sql(TRIGGER_EXISTS_SQL, (name,)).scalar() > 0
+
+
+def drop_trigger(conn, name: str):
+    """
+    Drop a trigger if it exists (sync connection).
+
+    Args:
+        conn: Connection
+        name: Trigger name
+    """
+    conn.exec_driver_sql(drop_trigger_sql(name))
+
+
+def create_trigger(conn, name: str):
+    """
+    (Re)create a trigger from triggers.sql (sync connection).
+
+    Args:
+        conn: Connection
+        name: Trigger name
+    """
+    conn.exec_driver_sql(drop_trigger_sql(name))
+    conn.exec_driver_sql(trigger_definition(name))
+
+
+class TriggerProbe:
+    """Whether a trigger still exists, re-checked at most every TRIGGER_CHECK_TTL seconds."""
+
+    def __init__(self, name: str, fallback: str, ttl: float = TRIGGER_CHECK_TTL):
+        """
+        Args:
+            name: Trigger name
+            fallback: What the writer does instead (for the warning when it disappears)
+            ttl: Seconds between checks
+        """
+        self.name = name
+        self.fallback = fallback
+        self.ttl = ttl
+        self.present: Optional[bool] = None
+        self.checked_at: Optional[float] = None
+
+    def _due(self) -> bool:
+        return self.checked_at is None or time.monotonic() - self.checked_at > self.ttl
+
+    def _update(self, present: bool):
+        if self.present is not False and not present:
+            print(f"⚠️  {self.name} is missing (dropped by another process?), {self.fallback}")
+        elif self.present is False and present:
+            print(f"🔧 {self.name} is back, leaving the check to it")
+        self.present = present
+        self.checked_at = time.monotonic()
+
+    def missing_sync(self, conn) -> bool:
+        """
+        Check on a sync connection.
+
+        Returns:
+            True if the trigger does not exist
+        """
+        if self._due():
+            self._update(trigger_exists(conn, self.name))
+        return not self.present
+
+    async def missing_async(self, conn) -> bool:
+        """
+        Check on an async connection.
+
+        Returns:
+            True if the trigger does not exist
+        """
+        if self._due():
+            self._update((await conn.exec_driver_sql(TRIGGER_EXISTS_SQL, (self.name,))).scalar() > 0)
+        return not self.present
@@ -2,11 +2,21 @@
 FastAPI main application
 """
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.endpoints import patients, analytics, auth, websocket, thresholds, alerts
+from app.api.endpoints import patients, analytics, auth, websocket, thresholds, alerts, vitals, debug
 from app.websocket.connection_manager import ConnectionManager
-from app.websocket.poller import start_poller, stop_poller
+from app.websocket.poller import get_poller_stats
+from app.websocket.alert_poller import get_alert_poller_stats
+from app.websocket.cdc import start_vitals_feed, stop_vitals_feed, get_cdc_stats
+from app.websocket.cluster import POLLER_MODE, start_cluster, stop_cluster, get_cluster_stats
+from app.db.database import close_async_connection
+from app.db.ingest import start_ingest_buffer, stop_ingest_buffer, get_ingest_stats
+from app.core.tracing import get_trace_stats
+from app.core.metrics import CONTENT_TYPE, MetricsMiddleware, render_metrics, set_connection_manager
+from app.db.alert_rules import start_alert_rules, get_alert_rules_stats
+from app.db.admissions import start_admission_check, get_admission_stats
+from app.db.summary_cache import get_summary_cache_stats
 
 # Global connection manager
 connection_manager = ConnectionManager()
@@ -19,16 +29,30 @@ async def lifespan(app: FastAPI):
     """
     # Startup
     print("🚀 Starting MyMedQL API...")
-    await start_poller(connection_manager)
+    await connection_manager.start()
+    if POLLER_MODE == "leader":
+        # One worker polls, the others receive its broadcasts over IPC
+        await start_cluster(connection_manager)
+    else:
+        await start_vitals_feed(connection_manager)
     websocket.set_manager(connection_manager)
+    set_connection_manager(connection_manager)
+    await start_alert_rules()
+    await start_admission_check()
+    await start_ingest_buffer()
     print("✅ MyMedQL API started")
     
     yield
     
     # Shutdown
     print("🛑 Shutting down MyMedQL API...")
-    await stop_poller()
-    connection_manager.disconnect_all()
+    await stop_ingest_buffer()
+    if POLLER_MODE == "leader":
+        await stop_cluster()
+    else:
+        await stop_vitals_feed()
+    await connection_manager.stop()
+    await close_async_connection()
     print("✅ MyMedQL API stopped")
 
 
@@ -48,6 +72,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 # Include routers
 app.include_router(patients.router)
@@ -56,6 +81,8 @@ app.include_router(auth.router)
 app.include_router(websocket.router)
 app.include_router(thresholds.router)
 app.include_router(alerts.router)
+app.include_router(vitals.router)
+app.include_router(debug.router)
 
 
 @app.get("/")
@@ -67,5 +94,21 @@ async def root():
 @app.get("/health")
 async def health():
     """Health check endpoint"""
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "poller": get_poller_stats(),
+        "alert_poller": get_alert_poller_stats(),
+        "cdc": get_cdc_stats(),
+        "cluster": get_cluster_stats(),
+        "ingest": get_ingest_stats(),
+        "alert_rules": get_alert_rules_stats(),
+        "admissions": get_admission_stats(),
+        "summary_cache": get_summary_cache_stats(),
+        "tracing": get_trace_stats()
+    }
 
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics endpoint"""
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
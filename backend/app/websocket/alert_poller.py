@@ -0,0 +1,223 @@
+"""
+Background poller that pushes new alerts to staff via WebSocket
+"""
+import asyncio
+import os
+import time
+from typing import Optional, Dict, Any, List
+from sqlalchemy import text
+from app.db.database import get_async_engine
+from app.websocket.connection_manager import ConnectionManager
+
+ALERT_POLL_INTERVAL = float(os.getenv("ALERT_POLL_INTERVAL", "1.0"))
+
+
+def alert_event(event_type: str, alert: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build an alert stream message.
+
+    Args:
+        event_type: alert_created or alert_acknowledged
+        alert: Alert row (alert_id, patient_id, alert_type, message, threshold,
+               created_at, acknowledged_at, optionally patient_name and room_id)
+
+    Returns:
+        Message dictionary for ConnectionManager.broadcast_to_patient
+    """
+    return {"type": event_type, "alert": alert}
+
+
+class AlertPoller:
+    """
+    Polls `alerts` with an alert_id high-water mark and pushes an
+    alert_created event for each new row (including those inserted by
+    trg_vitals_threshold_alert) to the patient's staff subscribers.
+
+    Alerts are inserted inside vitals transactions, so IDs can commit out of
+    order; skipped IDs are re-checked until they appear or expire, like
+    VitalsPoller does for vitals.
+    """
+
+    ALERT_COLUMNS = """
+        a.alert_id, a.patient_id, a.alert_type, a.message, a.threshold,
+        a.created_at, a.acknowledged_at,
+        CONCAT(p.first_name, ' ', p.last_name) AS patient_name, p.room_id
+    """
+
+    def __init__(
+        self,
+        manager: ConnectionManager,
+        poll_interval: float = ALERT_POLL_INTERVAL,
+        page_size: int = 200,
+        gap_timeout: float = 10.0
+    ):
+        """
+        Initialize the alert poller.
+
+        Args:
+            manager: ConnectionManager instance for broadcasting
+            poll_interval: Polling interval in seconds (default: 1.0)
+            page_size: Maximum alerts fetched per query (default: 200)
+            gap_timeout: Seconds to keep waiting for a skipped alert_id (default: 10.0)
+        """
+        self.manager = manager
+        self.poll_interval = poll_interval
+        self.page_size = page_size
+        self.gap_timeout = gap_timeout
+        self.last_alert_id: Optional[int] = None
+        # Skipped alert_id -> monotonic time it was first noticed
+        self.pending_gaps: Dict[int, float] = {}
+        self.alerts_pushed = 0
+        self.running = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Start the polling task."""
+        if self.running:
+            return
+
+        self.running = True
+        self._task = asyncio.create_task(self._poll_loop())
+        print("🚀 Alert poller started")
+
+    async def stop(self):
+        """Stop the polling task."""
+        self.running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        print("🛑 Alert poller stopped")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get the poller's cursor position.
+
+        Returns:
+            Dictionary with last_alert_id, alerts_pushed and pending_gaps
+        """
+        return {
+            "last_alert_id": self.last_alert_id,
+            "alerts_pushed": self.alerts_pushed,
+            "pending_gaps": len(self.pending_gaps),
+        }
+
+    async def _poll_loop(self):
+        """Main polling loop."""
+        while self.running:
+            try:
+                await self._check_and_broadcast()
+            except Exception as e:
+                print(f"❌ Error in alert poller loop: {e}")
+
+            await asyncio.sleep(self.poll_interval)
+
+    def _track_gaps(self, rows: List[Dict[str, Any]]):
+        """Record alert_ids skipped between the cursor and the rows just read."""
+        now = time.monotonic()
+        expected = self.last_alert_id + 1
+        for row in rows:
+            alert_id = row["alert_id"]
+            if alert_id - expected <= self.page_size:
+                for missing in range(expected, alert_id):
+                    if len(self.pending_gaps) >= self.page_size:
+                        break
+                    self.pending_gaps.setdefault(missing, now)
+            expected = alert_id + 1
+
+    async def _fetch(self, conn, where: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Fetch alerts with patient name and room."""
+        result = await conn.execute(
+            text(f"""
+                SELECT {self.ALERT_COLUMNS}
+                FROM alerts a
+                LEFT JOIN patients p ON a.patient_id = p.patient_id
+                WHERE {where}
+                ORDER BY a.alert_id ASC
+                LIMIT :page_size
+            """),
+            {**params, "page_size": self.page_size}
+        )
+        return [dict(row._mapping) for row in result]
+
+    async def _check_and_broadcast(self):
+        """Push alerts created since the high-water mark (and late gap fills)."""
+        try:
+            engine = get_async_engine()
+            async with engine.connect() as conn:
+                if self.last_alert_id is None:
+                    row = (await conn.execute(text("SELECT COALESCE(MAX(alert_id), 0) FROM alerts"))).fetchone()
+                    self.last_alert_id = int(row[0])
+
+                rows: List[Dict[str, Any]] = []
+                if self.pending_gaps:
+                    params = {f"id{i}": gap_id for i, gap_id in enumerate(self.pending_gaps)}
+                    placeholders = ", ".join(f":{name}" for name in params)
+                    late = await self._fetch(conn, f"a.alert_id IN ({placeholders})", params)
+                    for alert in late:
+                        self.pending_gaps.pop(alert["alert_id"], None)
+                    rows.extend(late)
+                    deadline = time.monotonic() - self.gap_timeout
+                    for gap_id, first_seen in list(self.pending_gaps.items()):
+                        if first_seen < deadline:
+                            del self.pending_gaps[gap_id]
+
+                new_rows = await self._fetch(conn, "a.alert_id > :last_alert_id", {"last_alert_id": self.last_alert_id})
+                if new_rows:
+                    self._track_gaps(new_rows)
+                    self.last_alert_id = new_rows[-1]["alert_id"]
+                    rows.extend(new_rows)
+                await conn.commit()
+
+            for alert in rows:
+                await self.manager.broadcast_to_patient(
+                    alert["patient_id"], alert_event("alert_created", alert), staff_only=True
+                )
+            self.alerts_pushed += len(rows)
+            if rows:
+                print(f"🚨 Pushed {len(rows)} new alert(s)")
+
+        except Exception as e:
+            print(f"❌ Error checking for new alerts: {e}")
+
+
+# Global alert poller instance
+_alert_poller: Optional[AlertPoller] = None
+
+
+async def start_alert_poller(manager: ConnectionManager, last_alert_id: Optional[int] = None):
+    """
+    Start the alert poller.
+
+    Args:
+        manager: ConnectionManager instance
+        last_alert_id: Cursor to resume from; None starts at the newest alert
+    """
+    global _alert_poller
+    if _alert_poller is None:
+        _alert_poller = AlertPoller(manager)
+    if last_alert_id is not None:
+        _alert_poller.last_alert_id = last_alert_id
+    await _alert_poller.start()
+
+
+async def stop_alert_poller():
+    """Stop the alert poller."""
+    global _alert_poller
+    if _alert_poller:
+        await _alert_poller.stop()
+        _alert_poller = None
+
+
+def get_alert_poller_stats() -> Optional[Dict[str, Any]]:
+    """
+    Get statistics of the running alert poller.
+
+    Returns:
+        Alert poller statistics, or None if it is not running
+    """
+    if _alert_poller is None:
+        return None
+    return _alert_poller.get_stats()
@@ -0,0 +1,381 @@
+"""
+Binlog change-data-capture source for live vitals and alerts
+
+Instead of polling `vitals` and `alerts` every second, BinlogCDC tails
+MySQL's row-based binary log (as a replica would) and pushes inserted
+vitals and alerts into the same ConnectionManager pipeline. Rows reach
+clients as soon as their transaction commits, and an idle ward costs no
+queries.
+
+Requires the optional `mysql-replication` package, a server with
+binlog_format=ROW, binlog_row_metadata=FULL, and a DB user with
+REPLICATION SLAVE and REPLICATION CLIENT. If any of these are missing, or
+the stream dies, the feed falls back to VitalsPoller and AlertPoller from
+the last vitals_id / alert_id delivered.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Set, Tuple
+from sqlalchemy import text
+from app.db.database import get_async_engine, get_db_settings
+from app.websocket.connection_manager import ConnectionManager
+from app.core.tracing import VITALS_TRACING, BatchTrace
+from app.websocket.poller import VitalsPoller, start_poller, stop_poller
+from app.websocket.alert_poller import alert_event, start_alert_poller, stop_alert_poller
+
+try:
+    from pymysqlreplication import BinLogStreamReader
+    from pymysqlreplication.row_event import WriteRowsEvent
+except ImportError:
+    BinLogStreamReader = None
+
+# Live feed settings
+VITALS_SOURCE = os.getenv("VITALS_SOURCE", "poll")  # poll | binlog
+CDC_SERVER_ID = int(os.getenv("CDC_SERVER_ID", "4242"))  # Must be unique among replicas
+CDC_HEARTBEAT = float(os.getenv("CDC_HEARTBEAT", "5"))
+
+# Fields of a broadcast vitals row, in the poller's order
+VITALS_FIELDS = (
+    "vitals_id", "patient_id", "device_id", "ts",
+    "heart_rate", "spo2", "bp_systolic", "bp_diastolic",
+    "temperature_c", "respiration", "metadata",
+)
+ALERT_FIELDS = (
+    "alert_id", "patient_id", "alert_type", "message",
+    "threshold", "created_at", "acknowledged_at",
+)
+
+
+class BinlogCDC:
+    """
+    Streams committed `vitals` and `alerts` changes from the binlog.
+
+    A daemon thread runs the blocking BinLogStreamReader and hands each row
+    event to the event loop; the loop side enriches vitals with patient names
+    and broadcasts everything queued at that moment as one batch.
+    """
+
+    def __init__(
+        self,
+        manager: ConnectionManager,
+        server_id: int = CDC_SERVER_ID,
+        heartbeat: float = CDC_HEARTBEAT
+    ):
+        """
+        Initialize the CDC source.
+
+        Args:
+            manager: ConnectionManager instance for broadcasting
+            server_id: Replica server ID to register with MySQL
+            heartbeat: Seconds between replication heartbeats (detects a dead stream)
+        """
+        if BinLogStreamReader is None:
+            raise RuntimeError("VITALS_SOURCE=binlog requires the mysql-replication package")
+
+        self.manager = manager
+        self.server_id = server_id
+        self.heartbeat = heartbeat
+        self.settings = get_db_settings()
+        self.last_vitals_id: Optional[int] = None
+        self.last_alert_id: Optional[int] = None
+        self.events = 0
+        self.vitals_rows = 0
+        self.alert_rows = 0
+        self.lag_seconds = 0.0
+        self.fallback = False
+        self.running = False
+        # Rows up to this id were already sent by the catch-up query, except open gaps
+        self._catchup_cursor = 0
+        self._catchup_gaps: Set[int] = set()
+        self._patient_names: Dict[int, Tuple[Optional[str], Optional[str]]] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stream = None
+        self._thread: Optional[threading.Thread] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, last_vitals_id: Optional[int] = None, last_alert_id: Optional[int] = None):
+        """
+        Catch up from the database, then start tailing the binlog.
+
+        Args:
+            last_vitals_id: Cursor to resume from; None sends the last minute of data
+            last_alert_id: Alert cursor to fall back to if the stream fails
+                           (None reads the newest alert_id at the pinned position)
+        """
+        self.last_alert_id = last_alert_id
+        self.running = True
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+
+        # Pin the binlog position before the catch-up query so nothing
+        # committed in between is missed (overlap is filtered out later)
+        log_file, log_pos = await self._binlog_position()
+        if self.last_alert_id is None:
+            # Alerts after this are in the stream; the fallback poller resumes from here
+            self.last_alert_id = await self._max_alert_id()
+        await self._catch_up(last_vitals_id)
+
+        self._thread = threading.Thread(
+            target=self._read_stream, args=(log_file, log_pos), name="binlog-cdc", daemon=True
+        )
+        self._thread.start()
+        self._task = asyncio.create_task(self._dispatch_loop())
+        print(f"🚀 Binlog CDC started at {log_file}:{log_pos}")
+
+    async def stop(self):
+        """Stop the stream reader and dispatcher (and the fallback poller, if any)."""
+        self.running = False
+        if self._stream is not None:
+            # Closing the connection unblocks the reader thread
+            try:
+                self._stream.close()
+            except Exception:
+                pass
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join, 5)
+        if self.fallback:
+            await stop_poller()
+            await stop_alert_poller()
+        print("🛑 Binlog CDC stopped")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get CDC statistics.
+
+        Returns:
+            Dictionary with last_vitals_id, counters, replication lag and
+            whether the poller fallback is active
+        """
+        return {
+            "source": "poll" if self.fallback else "binlog",
+            "last_vitals_id": self.last_vitals_id,
+            "last_alert_id": self.last_alert_id,
+            "events": self.events,
+            "vitals_rows": self.vitals_rows,
+            "alert_rows": self.alert_rows,
+            "lag_seconds": self.lag_seconds,
+            "fallback": self.fallback,
+        }
+
+    async def _binlog_position(self) -> Tuple[str, int]:
+        """Read the server's current binlog file and position."""
+        engine = get_async_engine()
+        async with engine.connect() as conn:
+            row = (await conn.execute(text("SHOW MASTER STATUS"))).fetchone()
+        if row is None:
+            raise RuntimeError("Binary logging is disabled on the MySQL server")
+        return row[0], int(row[1])
+
+    async def _max_alert_id(self) -> int:
+        """Read the highest alert_id (the alert cursor as of the pinned position)."""
+        engine = get_async_engine()
+        async with engine.connect() as conn:
+            row = (await conn.execute(text("SELECT COALESCE(MAX(alert_id), 0) FROM alerts"))).fetchone()
+        return int(row[0])
+
+    async def _catch_up(self, last_vitals_id: Optional[int]):
+        """Broadcast rows committed before the stream starts, with the poller's query."""
+        catchup = VitalsPoller(self.manager)
+        catchup.last_vitals_id = last_vitals_id
+        catchup.running = True
+        await catchup._check_and_broadcast()
+        self._catchup_cursor = catchup.last_vitals_id or 0
+        self._catchup_gaps = set(catchup.pending_gaps)
+        self.last_vitals_id = catchup.last_vitals_id
+
+    def _read_stream(self, log_file: str, log_pos: int):
+        """Reader thread: forward row events to the event loop until stopped."""
+        try:
+            self._stream = BinLogStreamReader(
+                connection_settings={
+                    "host": self.settings["host"],
+                    "port": self.settings["port"],
+                    "user": self.settings["user"],
+                    "passwd": self.settings["password"],
+                },
+                server_id=self.server_id,
+                only_events=[WriteRowsEvent],
+                only_schemas=[self.settings["database"]],
+                only_tables=["vitals", "alerts"],
+                log_file=log_file,
+                log_pos=log_pos,
+                resume_stream=True,
+                blocking=True,
+                slave_heartbeat=self.heartbeat,
+            )
+            for event in self._stream:
+                if not self.running:
+                    break
+                rows = [row["values"] for row in event.rows]
+                self._loop.call_soon_threadsafe(
+                    self._queue.put_nowait, (event.table, rows, event.timestamp)
+                )
+        except Exception as e:
+            if self.running:
+                self._loop.call_soon_threadsafe(self._queue.put_nowait, ("error", str(e), None))
+        finally:
+            if self._stream is not None:
+                self._stream.close()
+
+    async def _dispatch_loop(self):
+        """Broadcast queued row events in batches."""
+        while self.running:
+            batch = [await self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            vitals: List[Dict[str, Any]] = []
+            alerts: List[Dict[str, Any]] = []
+            for table, rows, event_ts in batch:
+                if table == "error":
+                    await self._fall_back(rows)
+                    return
+                self.events += 1
+                self.lag_seconds = max(0.0, time.time() - event_ts)
+                if table == "vitals":
+                    vitals.extend(rows)
+                elif table == "alerts":
+                    alerts.extend(rows)
+
+            try:
+                if vitals:
+                    await self._broadcast_vitals(vitals)
+                if alerts:
+                    await self._broadcast_alerts(alerts)
+            except Exception as e:
+                print(f"❌ Error broadcasting binlog changes: {e}")
+
+    async def _broadcast_vitals(self, inserted: List[Dict[str, Any]]):
+        """Shape inserted rows like the poller's, add patient names and broadcast."""
+        picked_up_at = time.time()
+        rows = []
+        for values in inserted:
+            vitals_id = values["vitals_id"]
+            if vitals_id <= self._catchup_cursor:
+                if vitals_id not in self._catchup_gaps:
+                    continue  # Already sent by the catch-up query
+                self._catchup_gaps.discard(vitals_id)
+            row = {field: values.get(field) for field in VITALS_FIELDS}
+            if row["metadata"] is not None and not isinstance(row["metadata"], str):
+                row["metadata"] = json.dumps(row["metadata"], default=str)
+            rows.append(row)
+        if not rows:
+            return
+
+        await self._load_patient_names({row["patient_id"] for row in rows})
+        for row in rows:
+            row["first_name"], row["last_name"] = self._patient_names.get(row["patient_id"], (None, None))
+
+        self.last_vitals_id = max(self.last_vitals_id or 0, max(row["vitals_id"] for row in rows))
+        self.vitals_rows += len(rows)
+        trace = BatchTrace(rows, picked_up_at) if VITALS_TRACING else None
+        await self.manager.broadcast_vitals(rows, datetime.utcnow().isoformat(), trace=trace)
+
+    async def _broadcast_alerts(self, inserted: List[Dict[str, Any]]):
+        """
+        Push new alerts to the patient's staff subscribers (acknowledgements
+        are pushed by the acknowledge endpoint itself).
+        """
+        await self._load_patient_names({values["patient_id"] for values in inserted})
+        for values in inserted:
+            alert = {field: values.get(field) for field in ALERT_FIELDS}
+            first_name, last_name = self._patient_names.get(alert["patient_id"], (None, None))
+            # NULL like the poller's CONCAT when either part is missing
+            alert["patient_name"] = f"{first_name} {last_name}" if first_name is not None and last_name is not None else None
+            self.last_alert_id = max(self.last_alert_id or 0, alert["alert_id"])
+            self.alert_rows += 1
+            await self.manager.broadcast_to_patient(
+                alert["patient_id"], alert_event("alert_created", alert), staff_only=True
+            )
+
+    async def _load_patient_names(self, patient_ids: Set[int]):
+        """Fetch names for patients not seen before (names are effectively static)."""
+        missing = [pid for pid in patient_ids if pid not in self._patient_names]
+        if not missing:
+            return
+
+        params = {f"id{i}": pid for i, pid in enumerate(missing)}
+        placeholders = ", ".join(f":{name}" for name in params)
+        engine = get_async_engine()
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                text(f"SELECT patient_id, first_name, last_name FROM patients WHERE patient_id IN ({placeholders})"),
+                params
+            )
+            for row in result:
+                self._patient_names[row.patient_id] = (row.first_name, row.last_name)
+
+    async def _fall_back(self, error: str):
+        """Switch to the poller after the binlog stream failed."""
+        print(f"❌ Binlog CDC stream failed ({error}), falling back to the poller")
+        self.fallback = True
+        await start_poller(self.manager, last_vitals_id=self.last_vitals_id)
+        await start_alert_poller(self.manager, last_alert_id=self.last_alert_id)
+
+
+# Global CDC instance (only with VITALS_SOURCE=binlog)
+_cdc: Optional[BinlogCDC] = None
+
+
+async def start_vitals_feed(
+    manager: ConnectionManager,
+    last_vitals_id: Optional[int] = None,
+    last_alert_id: Optional[int] = None
+):
+    """
+    Start the live vitals and alert feed: binlog CDC if configured and
+    available, otherwise the vitals and alert pollers.
+
+    Args:
+        manager: ConnectionManager instance
+        last_vitals_id: Cursor to resume from (e.g. after a leader failover)
+        last_alert_id: Alert cursor to resume from
+    """
+    global _cdc
+    if VITALS_SOURCE == "binlog":
+        try:
+            _cdc = BinlogCDC(manager)
+            await _cdc.start(last_vitals_id, last_alert_id)
+            return
+        except Exception as e:
+            print(f"⚠️ Binlog CDC unavailable ({e}), using the poller")
+            if _cdc is not None:
+                last_vitals_id = _cdc.last_vitals_id or last_vitals_id
+                await _cdc.stop()
+                _cdc = None
+    await start_poller(manager, last_vitals_id=last_vitals_id)
+    await start_alert_poller(manager, last_alert_id=last_alert_id)
+
+
+async def stop_vitals_feed():
+    """Stop the live vitals and alert feed."""
+    global _cdc
+    if _cdc is not None:
+        await _cdc.stop()
+        _cdc = None
+    else:
+        await stop_poller()
+        await stop_alert_poller()
+
+
+def get_cdc_stats() -> Optional[Dict[str, Any]]:
+    """
+    Get statistics of the binlog CDC source.
+
+    Returns:
+        CDC statistics, or None if the feed is the poller
+    """
+    if _cdc is None:
+        return None
+    return _cdc.get_stats()
@@ -0,0 +1,338 @@
+"""
+Per-client outbound queue and writer task for WebSocket connections
+"""
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Any, List, Optional, Callable
+from fastapi import WebSocket
+from app.websocket.encoding import ENCODING_JSON, Payload, encode_vitals
+from app.core.tracing import VITALS_TRACING, BatchTrace, observe
+
+# Stream modes for vitals frames
+STREAM_FULL = "full"
+STREAM_DELTA = "delta"
+STREAM_MODES = (STREAM_FULL, STREAM_DELTA)
+
+# Fields always present in a delta row so the client can place it
+DELTA_IDENTITY_FIELDS = ("patient_id", "vitals_id", "ts")
+
+# Overflow policies for a full outbound queue
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_COALESCE = "coalesce"
+OVERFLOW_DISCONNECT = "disconnect"
+OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_COALESCE, OVERFLOW_DISCONNECT)
+
+
+def _diff_row(row: Dict[str, Any], last_row: Dict[str, Any]) -> Dict[str, Any]:
+    """Delta row: identity fields plus the fields that differ from the last row sent."""
+    delta = {field: row.get(field) for field in DELTA_IDENTITY_FIELDS}
+    for field, value in row.items():
+        if field not in DELTA_IDENTITY_FIELDS and last_row.get(field) != value:
+            delta[field] = value
+    return delta
+
+
+@dataclass
+class OutboundMessage:
+    """
+    A message waiting in a client's queue.
+
+    Attributes:
+        data: Encoded message (str is sent as a text frame, bytes as binary)
+        rows: Vital rows carried by the message (only for vitals_update and
+              vitals_delta), used to coalesce to the latest reading per patient
+        frame_rows: Rows as encoded in a vitals_delta frame (None otherwise),
+                    kept so the frame can be re-encoded if one before it is dropped
+        timestamp: Broadcast timestamp of a vitals_update
+        seq: Sequence number of the broadcast (None for control messages)
+        trace: Timing context of the broadcast batch (see app.core.tracing)
+        enqueued_at: Monotonic time the message entered the queue
+    """
+    data: Payload
+    rows: Optional[List[Dict[str, Any]]] = None
+    frame_rows: Optional[List[Dict[str, Any]]] = None
+    timestamp: Optional[str] = None
+    seq: Optional[int] = None
+    trace: Optional[BatchTrace] = None
+    enqueued_at: float = 0.0
+
+
+class ClientConnection:
+    """
+    Wraps a WebSocket with a bounded outbound queue drained by its own writer task,
+    so a slow client never delays the broadcaster or other clients.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        max_queue: int,
+        overflow_policy: str,
+        send_timeout: float,
+        on_dead: Callable[[WebSocket], None],
+        encoding: str = ENCODING_JSON,
+        keyframe_interval: float = 30.0
+    ):
+        """
+        Initialize the client connection.
+
+        Args:
+            websocket: Accepted WebSocket connection
+            max_queue: Maximum number of queued outbound messages
+            overflow_policy: What to do when the queue is full
+                             (drop_oldest, coalesce or disconnect)
+            send_timeout: Seconds a single send may take before the client is dropped
+            on_dead: Callback invoked when the client must be removed
+            encoding: Wire encoding negotiated by the client
+            keyframe_interval: Seconds between full rows per patient in delta mode
+        """
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+
+        self.websocket = websocket
+        self.max_queue = max(1, max_queue)
+        self.overflow_policy = overflow_policy
+        self.send_timeout = send_timeout
+        self.on_dead = on_dead
+        self.encoding = encoding
+        self.stream_mode = STREAM_FULL
+        self.keyframe_interval = keyframe_interval
+        # patient_id -> (last row sent, monotonic time of last keyframe)
+        self.delta_state: Dict[Any, tuple] = {}
+        self.queue: Deque[OutboundMessage] = deque()
+        self.dropped = 0
+        self.last_seen = time.monotonic()
+        self.closed = False
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the writer task."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._writer())
+
+    def touch(self):
+        """Record inbound activity from the client (any message counts as a pong)."""
+        self.last_seen = time.monotonic()
+
+    def enqueue(self, message: OutboundMessage) -> bool:
+        """
+        Queue a message for this client without waiting for the network.
+
+        Args:
+            message: Message to queue
+
+        Returns:
+            False if the client was disconnected because of overflow, True otherwise
+        """
+        if self.closed:
+            return False
+
+        message.enqueued_at = time.monotonic()
+        if len(self.queue) >= self.max_queue:
+            if self.overflow_policy == OVERFLOW_DISCONNECT:
+                print("⚠️ WebSocket client queue full, disconnecting slow client")
+                self.on_dead(self.websocket)
+                return False
+            if self.overflow_policy == OVERFLOW_COALESCE and message.rows is not None:
+                self._coalesce(message)
+                self._wakeup.set()
+                return True
+            # drop_oldest (also the fallback when nothing can be coalesced)
+            lost = set()
+            while len(self.queue) >= self.max_queue:
+                dropped = self.queue.popleft()
+                self.dropped += 1
+                if dropped.rows is not None:
+                    lost.update(row.get("patient_id") for row in dropped.rows)
+            self.queue.append(message)
+            if lost:
+                # The client never gets those rows: later deltas must not build on them
+                self._rekey(lost)
+            self._wakeup.set()
+            return True
+
+        self.queue.append(message)
+        self._wakeup.set()
+        return True
+
+    def _coalesce(self, message: OutboundMessage):
+        """
+        Merge each run of consecutive vitals messages (the new one joins the
+        last run) into a single message carrying only the latest row per
+        patient. Other messages keep their place, so the queue stays in
+        broadcast (seq) order.
+        """
+        kept: Deque[OutboundMessage] = deque()
+        run: List[OutboundMessage] = []
+        for queued in list(self.queue) + [message]:
+            if queued.rows is not None:
+                run.append(queued)
+                continue
+            if run:
+                kept.append(self._merge_run(run))
+                run = []
+            kept.append(queued)
+        if run:
+            kept.append(self._merge_run(run))
+
+        # Runs of one cannot shrink; trim the oldest if still over
+        lost = set()
+        while len(kept) > self.max_queue:
+            dropped = kept.popleft()
+            self.dropped += 1
+            if dropped.rows is not None:
+                lost.update(row.get("patient_id") for row in dropped.rows)
+        self.queue = kept
+        if lost:
+            self._rekey(lost)
+
+    def _merge_run(self, run: List[OutboundMessage]) -> OutboundMessage:
+        """Merge consecutive vitals messages into one with the latest row per patient (full rows)."""
+        if len(run) == 1:
+            return run[0]
+        latest: Dict[Any, Dict[str, Any]] = {}
+        for queued in run:
+            for row in queued.rows:
+                latest.pop(row.get("patient_id"), None)
+                latest[row.get("patient_id")] = row
+        self.dropped += len(run) - 1
+
+        last = run[-1]
+        rows = list(latest.values())
+        return OutboundMessage(
+            data=encode_vitals(rows, last.timestamp, self.encoding, seq=last.seq),
+            rows=rows,
+            timestamp=last.timestamp,
+            seq=last.seq,
+            trace=last.trace,
+            enqueued_at=min(queued.enqueued_at for queued in run)
+        )
+
+    def _rekey(self, patient_ids: set):
+        """
+        Re-encode the queued vitals_delta frames of patients whose earlier rows
+        were dropped: each one's first queued row becomes a keyframe and the
+        following rows are diffed against what the client will actually get.
+        Patients with nothing queued get a keyframe on the next broadcast.
+        """
+        now = time.monotonic()
+        base: Dict[Any, Dict[str, Any]] = {}
+        for queued in self.queue:
+            if queued.rows is None:
+                continue
+            affected = False
+            frame_rows = []
+            for row, frame_row in zip(queued.rows, queued.frame_rows or queued.rows):
+                patient_id = row.get("patient_id")
+                if patient_id in patient_ids:
+                    affected = True
+                    previous = base.get(patient_id)
+                    if queued.frame_rows is not None:
+                        frame_row = {**row, "keyframe": True} if previous is None else _diff_row(row, previous)
+                    base[patient_id] = row
+                frame_rows.append(frame_row)
+            if affected and queued.frame_rows is not None:
+                queued.frame_rows = frame_rows
+                queued.data = encode_vitals(
+                    frame_rows, queued.timestamp, self.encoding, frame_type="vitals_delta", seq=queued.seq
+                )
+
+        for patient_id in patient_ids:
+            if patient_id in base:
+                self.delta_state[patient_id] = (base[patient_id], now)
+            else:
+                self.delta_state.pop(patient_id, None)
+
+    def reset_delta(self, patient_ids: Optional[List[Any]] = None):
+        """
+        Forget what was sent so the next row for these patients is a keyframe.
+
+        Args:
+            patient_ids: Patients to reset (None = all)
+        """
+        if patient_ids is None:
+            self.delta_state.clear()
+            return
+        for patient_id in patient_ids:
+            self.delta_state.pop(patient_id, None)
+
+    def make_delta(self, rows: List[Dict[str, Any]], timestamp: str, seq: Optional[int] = None) -> OutboundMessage:
+        """
+        Build a vitals_delta frame carrying only the fields that changed since
+        the last row sent to this client for each patient. A patient's first
+        row, and one every keyframe_interval seconds, is sent in full.
+
+        Args:
+            rows: Full vital rows
+            timestamp: ISO timestamp of the broadcast
+            seq: Sequence number of the broadcast
+
+        Returns:
+            Message to queue (keeps the full rows for coalescing)
+        """
+        now = time.monotonic()
+        delta_rows = []
+        for row in rows:
+            patient_id = row.get("patient_id")
+            previous = self.delta_state.get(patient_id)
+            if previous is None or now - previous[1] >= self.keyframe_interval:
+                delta_rows.append({**row, "keyframe": True})
+                self.delta_state[patient_id] = (row, now)
+                continue
+
+            last_row, keyframe_at = previous
+            delta_rows.append(_diff_row(row, last_row))
+            self.delta_state[patient_id] = (row, keyframe_at)
+
+        return OutboundMessage(
+            data=encode_vitals(delta_rows, timestamp, self.encoding, frame_type="vitals_delta", seq=seq),
+            rows=rows,
+            frame_rows=delta_rows,
+            timestamp=timestamp,
+            seq=seq
+        )
+
+    async def _writer(self):
+        """Drain the queue to the socket, one message at a time."""
+        try:
+            while not self.closed:
+                if not self.queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+
+                message = self.queue.popleft()
+                started = time.monotonic()
+                if isinstance(message.data, bytes):
+                    send = self.websocket.send_bytes(message.data)
+                else:
+                    send = self.websocket.send_text(message.data)
+                try:
+                    await asyncio.wait_for(send, timeout=self.send_timeout)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"Error sending to client: {e}")
+                    self.on_dead(self.websocket)
+                    return
+
+                if VITALS_TRACING and message.rows is not None:
+                    queue_wait = started - message.enqueued_at
+                    send_seconds = time.monotonic() - started
+                    observe("queue_wait", queue_wait)
+                    observe("send", send_seconds)
+                    if message.trace:
+                        message.trace.delivered(time.time(), queue_wait, send_seconds)
+        except asyncio.CancelledError:
+            pass
+
+    def close(self):
+        """Stop the writer task and discard pending messages."""
+        self.closed = True
+        self.queue.clear()
+        self._wakeup.set()
+        if self._task and self._task is not asyncio.current_task():
+            self._task.cancel()
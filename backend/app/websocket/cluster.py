@@ -0,0 +1,390 @@
+"""
+Single-leader vitals poller across uvicorn worker processes
+
+With several workers, each one used to run its own VitalsPoller, so the
+database was polled N times for the same rows. In leader mode exactly one
+worker (the holder of an flock on POLLER_LOCK_PATH) runs the poller (or the
+binlog CDC feed) and publishes every broadcast over a local Unix socket; the
+other workers follow it and fan the messages out to their own WebSocket
+clients.
+
+The kernel releases the lock when the leader process dies, so a follower
+that sees the socket close retries the lock and the winner resumes polling
+from the highest vitals_id it has already delivered.
+
+Broadcasts made while a worker has no link to the others (still electing,
+or a follower between losing its leader and the next election) are held in
+a bounded buffer. A follower flushes it to the leader once connected; a new
+leader replays it to every follower that connects within two retry
+intervals of the election, which is when the followers of the previous
+leader come back. Messages beyond POLLER_PUBLISH_BUFFER are dropped and
+counted.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime, date
+from decimal import Decimal
+from typing import Deque, Dict, Any, List, Optional, Set
+
+try:
+    import fcntl
+except ImportError:  # Windows: leader election is not available
+    fcntl = None
+
+from app.websocket.connection_manager import ConnectionManager
+from app.websocket.cdc import start_vitals_feed, stop_vitals_feed
+
+# Cluster settings
+POLLER_MODE = os.getenv("POLLER_MODE", "single")  # single | leader
+POLLER_LOCK_PATH = os.getenv("POLLER_LOCK_PATH", "/tmp/mymedql-poller.lock")
+POLLER_IPC_PATH = os.getenv("POLLER_IPC_PATH", "/tmp/mymedql-poller.sock")
+POLLER_RETRY_INTERVAL = float(os.getenv("POLLER_RETRY_INTERVAL", "2"))
+# Broadcasts held while this worker has no leader / followers to send them to
+POLLER_PUBLISH_BUFFER = int(os.getenv("POLLER_PUBLISH_BUFFER", "1000"))
+
+# A single IPC line carries at most one poller page of rows
+IPC_LINE_LIMIT = 16 * 1024 * 1024
+# Followers whose unsent IPC data exceeds this are dropped (they reconnect)
+IPC_MAX_BUFFER = 8 * 1024 * 1024
+
+ROLE_STARTING = "starting"
+ROLE_LEADER = "leader"
+ROLE_FOLLOWER = "follower"
+
+
+def _ipc_default(value: Any) -> Any:
+    """Tag values JSON cannot carry so they round-trip unchanged."""
+    if isinstance(value, datetime):
+        return {"__dt__": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"__dec__": str(value)}
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def _ipc_object_hook(obj: Dict[str, Any]) -> Any:
+    """Restore values tagged by _ipc_default."""
+    if len(obj) == 1:
+        if "__dt__" in obj:
+            return datetime.fromisoformat(obj["__dt__"])
+        if "__dec__" in obj:
+            return Decimal(obj["__dec__"])
+    return obj
+
+
+def encode_ipc(message: Dict[str, Any]) -> bytes:
+    """Encode a relay message as one newline-terminated JSON line."""
+    return json.dumps(message, default=_ipc_default, separators=(",", ":")).encode() + b"\n"
+
+
+def decode_ipc(line: bytes) -> Dict[str, Any]:
+    """Decode a relay message line."""
+    return json.loads(line, object_hook=_ipc_object_hook)
+
+
+class PollerCluster:
+    """
+    Elects one poller leader among the worker processes of a host and relays
+    broadcasts between workers.
+
+    Installed as ConnectionManager.relay: every broadcast made in this worker
+    is published to the others, and messages received from the others are
+    applied locally with relay=False.
+    """
+
+    def __init__(
+        self,
+        manager: ConnectionManager,
+        lock_path: str = POLLER_LOCK_PATH,
+        socket_path: str = POLLER_IPC_PATH,
+        retry_interval: float = POLLER_RETRY_INTERVAL,
+        publish_buffer: int = POLLER_PUBLISH_BUFFER
+    ):
+        """
+        Initialize the cluster member.
+
+        Args:
+            manager: ConnectionManager of this worker
+            lock_path: File locked by the leader
+            socket_path: Unix socket the leader listens on
+            retry_interval: Seconds between election / reconnect attempts
+            publish_buffer: Broadcasts held while there is nobody to relay them to
+        """
+        if fcntl is None:
+            raise RuntimeError("POLLER_MODE=leader requires fcntl (POSIX only)")
+
+        self.manager = manager
+        self.lock_path = lock_path
+        self.socket_path = socket_path
+        self.retry_interval = retry_interval
+        self.role = ROLE_STARTING
+        # Highest vitals_id / alert_id delivered here; the cursors a new leader resumes from
+        self.last_vitals_id: Optional[int] = None
+        self.last_alert_id: Optional[int] = None
+        self.failovers = 0
+        self.relayed = 0
+        self.publish_dropped = 0
+        # Encoded broadcasts waiting for a leader link (or for followers to connect)
+        self._pending: Deque[bytes] = deque(maxlen=publish_buffer)
+        self._backlog: List[bytes] = []
+        self._backlog_until = 0.0
+        self._lock_fd: Optional[int] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._followers: Set[asyncio.StreamWriter] = set()
+        self._leader_writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Start electing / following in the background."""
+        self.manager.relay = self
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Leave the cluster, stopping the poller if this worker leads."""
+        self.manager.relay = None
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self.role == ROLE_LEADER:
+            await stop_vitals_feed()
+        self._close_links()
+        self._release_lock()
+        print("🛑 Poller cluster stopped")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cluster statistics.
+
+        Returns:
+            Role, pid, follower count and relay counters
+        """
+        return {
+            "role": self.role,
+            "pid": os.getpid(),
+            "followers": len(self._followers),
+            "last_vitals_id": self.last_vitals_id,
+            "last_alert_id": self.last_alert_id,
+            "relayed": self.relayed,
+            "publish_pending": len(self._pending),
+            "publish_dropped": self.publish_dropped,
+            "failovers": self.failovers
+        }
+
+    def publish(self, message: Dict[str, Any]):
+        """
+        Forward a broadcast made in this worker to the other workers.
+
+        Args:
+            message: Relay message ({"kind": "vitals" | "patient" | "all", ...})
+        """
+        self._track_cursor(message)
+        line = encode_ipc(message)
+        if self.role == ROLE_LEADER:
+            self._send_to_followers(line)
+        elif self.role == ROLE_FOLLOWER and self._leader_writer is not None:
+            self._leader_writer.write(line)
+        else:
+            # No link yet: hold it until the election settles
+            if len(self._pending) == self._pending.maxlen:
+                if not self.publish_dropped:
+                    print(f"⚠️ Poller relay buffer full ({self._pending.maxlen}), dropping oldest broadcasts")
+                self.publish_dropped += 1
+            self._pending.append(line)
+
+    async def _run(self):
+        """Election loop: lead if the lock is free, otherwise follow the leader."""
+        while True:
+            if self._try_lock():
+                await self._lead()
+                return
+            await self._follow()
+            await asyncio.sleep(self.retry_interval)
+
+    def _try_lock(self) -> bool:
+        """Try to take the leader lock without blocking."""
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    def _release_lock(self):
+        """Release the leader lock (closing the fd drops the flock)."""
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    async def _lead(self):
+        """Serve followers and run the poller until cancelled."""
+        # A previous leader that died leaves its socket file behind
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = await asyncio.start_unix_server(
+            self._handle_follower, path=self.socket_path, limit=IPC_LINE_LIMIT
+        )
+        if self.role == ROLE_FOLLOWER:
+            self.failovers += 1
+        self.role = ROLE_LEADER
+        print(f"👑 Worker {os.getpid()} is the vitals poller leader")
+        # Followers reconnect within a retry interval; replay what was held to each of them
+        self._backlog = list(self._pending)
+        self._backlog_until = time.monotonic() + 2 * self.retry_interval
+        self._pending.clear()
+        await start_vitals_feed(
+            self.manager, last_vitals_id=self.last_vitals_id, last_alert_id=self.last_alert_id
+        )
+        await asyncio.Event().wait()
+
+    async def _handle_follower(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Apply and fan out messages published by one follower."""
+        self._followers.add(writer)
+        if self._backlog:
+            if time.monotonic() < self._backlog_until:
+                writer.write(b"".join(self._backlog))
+            else:
+                self._backlog = []
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self._send_to_followers(line, exclude=writer)
+                await self._apply(line)
+        except (asyncio.CancelledError, ConnectionError):
+            pass
+        except Exception as e:
+            print(f"❌ Poller relay error: {e}")
+        finally:
+            self._followers.discard(writer)
+            writer.close()
+
+    def _send_to_followers(self, line: bytes, exclude: Optional[asyncio.StreamWriter] = None):
+        """Write a line to every follower without waiting for them to read it."""
+        for writer in list(self._followers):
+            if writer is exclude:
+                continue
+            if writer.transport.get_write_buffer_size() > IPC_MAX_BUFFER:
+                print("⚠️ Poller follower is not keeping up, dropping it")
+                self._followers.discard(writer)
+                writer.close()
+                continue
+            writer.write(line)
+
+    async def _follow(self):
+        """Receive the leader's broadcasts until the leader goes away."""
+        try:
+            reader, writer = await asyncio.open_unix_connection(self.socket_path, limit=IPC_LINE_LIMIT)
+        except (FileNotFoundError, ConnectionError):
+            # Leader not listening yet (or just died); retry the election
+            return
+
+        self._leader_writer = writer
+        if self.role != ROLE_FOLLOWER:
+            self.role = ROLE_FOLLOWER
+            print(f"📥 Worker {os.getpid()} is following the vitals poller leader")
+        if self._pending:
+            writer.write(b"".join(self._pending))
+            self._pending.clear()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                await self._apply(line)
+        except ConnectionError:
+            pass
+        except Exception as e:
+            print(f"❌ Poller relay error: {e}")
+        finally:
+            self._leader_writer = None
+            writer.close()
+        print("⚠️ Lost the vitals poller leader, re-running election")
+
+    async def _apply(self, line: bytes):
+        """Deliver a relayed message to this worker's clients."""
+        message = decode_ipc(line)
+        self._track_cursor(message)
+        self.relayed += 1
+        kind = message.get("kind")
+        if kind == "vitals":
+            await self.manager.broadcast_vitals(message["rows"], message["timestamp"], relay=False)
+        elif kind == "patient":
+            await self.manager.broadcast_to_patient(
+                message["patient_id"], message["message"], relay=False, staff_only=message.get("staff_only", False)
+            )
+        elif kind == "all":
+            await self.manager.broadcast(message["message"], relay=False)
+
+    def _track_cursor(self, message: Dict[str, Any]):
+        """Remember the highest vitals_id and alert_id seen for failover."""
+        if message.get("kind") == "patient":
+            payload = message.get("message") or {}
+            alert_id = (payload.get("alert") or {}).get("alert_id")
+            if payload.get("type") == "alert_created" and alert_id is not None:
+                self.last_alert_id = max(self.last_alert_id or 0, alert_id)
+            return
+        if message.get("kind") != "vitals":
+            return
+        for row in message.get("rows") or []:
+            vitals_id = row.get("vitals_id")
+            if vitals_id is not None and (self.last_vitals_id is None or vitals_id > self.last_vitals_id):
+                self.last_vitals_id = vitals_id
+
+    def _close_links(self):
+        """Close the server and all IPC streams."""
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        for writer in list(self._followers):
+            writer.close()
+        self._followers.clear()
+        if self._leader_writer is not None:
+            self._leader_writer.close()
+            self._leader_writer = None
+
+
+# Global cluster member (only in POLLER_MODE=leader)
+_cluster: Optional[PollerCluster] = None
+
+
+async def start_cluster(manager: ConnectionManager):
+    """
+    Join the poller cluster.
+
+    Args:
+        manager: ConnectionManager instance
+    """
+    global _cluster
+    if _cluster is None:
+        _cluster = PollerCluster(manager)
+        await _cluster.start()
+
+
+async def stop_cluster():
+    """Leave the poller cluster."""
+    global _cluster
+    if _cluster:
+        await _cluster.stop()
+        _cluster = None
+
+
+def get_cluster_stats() -> Optional[Dict[str, Any]]:
+    """
+    Get statistics of the cluster member.
+
+    Returns:
+        Cluster statistics, or None outside leader mode
+    """
+    if _cluster is None:
+        return None
+    return _cluster.get_stats()
@@ -1,82 +1,602 @@
 """
 WebSocket connection manager for broadcasting updates to connected clients
 """
-from fastapi import WebSocket
-from typing import List
+import asyncio
 import json
+import os
+import time
+from fastapi import WebSocket
+from typing import List, Dict, Set, Any, Iterable, Optional, Callable
+from app.websocket.client_connection import ClientConnection, OutboundMessage, STREAM_DELTA, STREAM_MODES
+from app.websocket.encoding import ENCODING_JSON, Payload, available_encodings, encode_message, encode_vitals
+from app.websocket.replay import ReplayBuffer, KIND_VITALS, KIND_PATIENT, KIND_ALL
+from app.core.tracing import VITALS_TRACING, BatchTrace, observe
+from app.core.metrics import WS_BROADCAST_SECONDS, WS_BROADCAST_ROWS
+from app.db.summary_cache import get_summary_cache
+
+# Outbound queue / heartbeat settings
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "256"))
+WS_OVERFLOW_POLICY = os.getenv("WS_OVERFLOW_POLICY", "coalesce")  # drop_oldest | coalesce | disconnect
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+WS_PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", "20"))  # 0 disables heartbeats
+WS_PING_TIMEOUT = float(os.getenv("WS_PING_TIMEOUT", "20"))
+WS_DELTA_KEYFRAME_SECONDS = float(os.getenv("WS_DELTA_KEYFRAME_SECONDS", "30"))
+# Roles allowed to receive staff-only messages (e.g. the live alert stream)
+STAFF_ROLES = ["admin", "doctor", "nurse", "viewer"]
+
+# Replay buffer for reconnecting clients
+WS_REPLAY_EVENTS = int(os.getenv("WS_REPLAY_EVENTS", "1000"))
+WS_REPLAY_SECONDS = float(os.getenv("WS_REPLAY_SECONDS", "120"))
 
 
 class ConnectionManager:
     """
-    Manages WebSocket connections and broadcasts messages to all connected clients.
+    Manages WebSocket connections and broadcasts messages to connected clients.
+
+    Clients that subscribe to patient IDs only receive updates for those
+    patients. Clients that never subscribe keep the legacy behaviour and
+    receive every update (firehose), unless they announced on connect that
+    they will subscribe (then they receive nothing until they do).
+
+    Sends never block the caller: each connection has a bounded outbound
+    queue drained by its own writer task, and idle clients are reaped by
+    an application-level ping/pong heartbeat.
+
+    Every broadcast carries a sequence number ("seq") and is kept in a
+    replay buffer so a reconnecting client can resume where it left off.
     """
-    
-    def __init__(self):
-        """Initialize connection manager with empty connection list."""
+
+    def __init__(
+        self,
+        max_queue: int = WS_QUEUE_SIZE,
+        overflow_policy: str = WS_OVERFLOW_POLICY,
+        send_timeout: float = WS_SEND_TIMEOUT,
+        ping_interval: float = WS_PING_INTERVAL,
+        ping_timeout: float = WS_PING_TIMEOUT,
+        keyframe_interval: float = WS_DELTA_KEYFRAME_SECONDS,
+        replay_events: int = WS_REPLAY_EVENTS,
+        replay_seconds: float = WS_REPLAY_SECONDS
+    ):
+        """
+        Initialize connection manager with empty connection list.
+
+        Args:
+            max_queue: Maximum queued outbound messages per client
+            overflow_policy: drop_oldest, coalesce (latest row per patient) or disconnect
+            send_timeout: Seconds a single send may take before the client is dropped
+            ping_interval: Seconds between heartbeat pings (0 disables heartbeats)
+            ping_timeout: Seconds to wait for any client message after a ping
+            keyframe_interval: Seconds between full rows per patient in delta stream mode
+            replay_events: Broadcasts kept for resuming clients
+            replay_seconds: Seconds a broadcast stays replayable
+        """
+        self.max_queue = max_queue
+        self.overflow_policy = overflow_policy
+        self.send_timeout = send_timeout
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.keyframe_interval = keyframe_interval
         self.active_connections: List[WebSocket] = []
-    
-    async def connect(self, websocket: WebSocket):
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        # patient_id -> connections subscribed to that patient
+        self.patient_subscribers: Dict[int, Set[WebSocket]] = {}
+        # connection -> patient_ids it is subscribed to
+        self.client_subscriptions: Dict[WebSocket, Set[int]] = {}
+        # connection -> authenticated user (from JWT)
+        self.client_users: Dict[WebSocket, Dict[str, Any]] = {}
+        # Connections that have never subscribed (receive everything)
+        self.firehose_connections: Set[WebSocket] = set()
+        # Optional relay that forwards broadcasts to sibling worker processes
+        self.relay = None
+        self.replay = ReplayBuffer(replay_events, replay_seconds)
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Start the heartbeat task that pings clients and reaps dead ones."""
+        if self._heartbeat_task is None and self.ping_interval > 0:
+            self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self):
+        """Stop the heartbeat task and disconnect every client."""
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat_task = None
+        self.disconnect_all()
+
+    async def connect(self, websocket: WebSocket, encoding: str = ENCODING_JSON, firehose: bool = True):
         """
         Accept and register a new WebSocket connection.
-        
+
         Args:
             websocket: WebSocket connection to add
+            encoding: Wire encoding for data frames (see app.websocket.encoding)
+            firehose: Receive every update until the connection subscribes
+                      (False for clients that are about to subscribe)
         """
         await websocket.accept()
+        client = ClientConnection(
+            websocket,
+            max_queue=self.max_queue,
+            overflow_policy=self.overflow_policy,
+            send_timeout=self.send_timeout,
+            on_dead=self._drop,
+            encoding=encoding,
+            keyframe_interval=self.keyframe_interval
+        )
+        self.clients[websocket] = client
         self.active_connections.append(websocket)
+        if firehose:
+            self.firehose_connections.add(websocket)
+        client.start()
         print(f"✅ WebSocket client connected. Total connections: {len(self.active_connections)}")
-    
+
     def disconnect(self, websocket: WebSocket):
         """
         Remove a WebSocket connection.
-        
+
         Args:
             websocket: WebSocket connection to remove
         """
         if websocket in self.active_connections:
+            self.unsubscribe(websocket)
             self.active_connections.remove(websocket)
+            self.firehose_connections.discard(websocket)
+            self.client_users.pop(websocket, None)
+            client = self.clients.pop(websocket, None)
+            if client:
+                client.close()
             print(f"❌ WebSocket client disconnected. Total connections: {len(self.active_connections)}")
-    
+
+    def _drop(self, websocket: WebSocket):
+        """Remove a dead or overflowing client and close its socket."""
+        if websocket not in self.active_connections:
+            return
+        self.disconnect(websocket)
+        asyncio.create_task(self._close_socket(websocket))
+
+    @staticmethod
+    async def _close_socket(websocket: WebSocket):
+        """Close a socket, ignoring errors from already-closed connections."""
+        try:
+            await websocket.close(code=1011)
+        except Exception:
+            pass
+
+    def set_encoding(self, websocket: WebSocket, encoding: str) -> bool:
+        """
+        Change the wire encoding used for a connection's data frames.
+
+        Args:
+            websocket: WebSocket connection
+            encoding: Encoding name
+
+        Returns:
+            True if the encoding is supported and was applied
+        """
+        client = self.clients.get(websocket)
+        if client is None or encoding not in available_encodings():
+            return False
+        client.encoding = encoding
+        return True
+
+    def set_stream_mode(self, websocket: WebSocket, mode: str) -> bool:
+        """
+        Switch a connection between full rows and delta-encoded vitals frames.
+
+        Args:
+            websocket: WebSocket connection
+            mode: "full" or "delta"
+
+        Returns:
+            True if the mode is supported and was applied
+        """
+        client = self.clients.get(websocket)
+        if client is None or mode not in STREAM_MODES:
+            return False
+        client.stream_mode = mode
+        client.reset_delta()
+        return True
+
+    def replay_position(self) -> Dict[str, Any]:
+        """Current replay epoch and latest sequence number."""
+        return {"epoch": self.replay.epoch, "seq": self.replay.seq}
+
+    def resume(self, websocket: WebSocket, resume_from: int, epoch: Optional[str] = None) -> Optional[int]:
+        """
+        Queue the broadcasts a reconnecting client missed, filtered by its
+        current subscriptions and encoded for its encoding and stream mode.
+
+        Args:
+            websocket: WebSocket connection
+            resume_from: Last seq the client received
+            epoch: Epoch the seq belongs to (from the hello frame)
+
+        Returns:
+            Number of frames queued, or None if the gap can no longer be
+            replayed and the client must resync
+        """
+        client = self.clients.get(websocket)
+        if client is None:
+            return 0
+        if epoch is not None and epoch != self.replay.epoch:
+            return None
+        entries = self.replay.since(resume_from)
+        if entries is None:
+            return None
+
+        firehose = websocket in self.firehose_connections
+        subscriptions = self.client_subscriptions.get(websocket, set())
+        queued = 0
+        for entry in entries:
+            if entry.kind == KIND_VITALS:
+                rows = entry.rows if firehose else [
+                    row for row in entry.rows if _patient_key(row.get("patient_id")) in subscriptions
+                ]
+                if not rows:
+                    continue
+                if client.stream_mode == STREAM_DELTA:
+                    message = client.make_delta(rows, entry.timestamp, entry.seq)
+                else:
+                    message = OutboundMessage(
+                        data=encode_vitals(rows, entry.timestamp, client.encoding, seq=entry.seq),
+                        rows=rows,
+                        timestamp=entry.timestamp,
+                        seq=entry.seq
+                    )
+            else:
+                if entry.kind == KIND_PATIENT:
+                    if entry.staff_only:
+                        if _patient_key(entry.patient_id) not in subscriptions or not self._is_staff(websocket):
+                            continue
+                    elif not firehose and _patient_key(entry.patient_id) not in subscriptions:
+                        continue
+                message = OutboundMessage(data=encode_message(entry.message, client.encoding), seq=entry.seq)
+            if not client.enqueue(message):
+                break
+            queued += 1
+        return queued
+
+    def touch(self, websocket: WebSocket):
+        """
+        Record inbound activity on a connection (keeps it alive for the heartbeat).
+
+        Args:
+            websocket: WebSocket connection
+        """
+        client = self.clients.get(websocket)
+        if client:
+            client.touch()
+
+    def queue_depths(self) -> List[int]:
+        """Current outbound queue length of every client."""
+        return [len(client.queue) for client in self.clients.values()]
+
+    async def _heartbeat_loop(self):
+        """Ping clients periodically and reap those that stopped responding."""
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            try:
+                now = time.monotonic()
+                ping_text = json.dumps({"type": "ping", "ts": time.time()})
+                for websocket, client in list(self.clients.items()):
+                    if now - client.last_seen > self.ping_interval + self.ping_timeout:
+                        print("⚠️ WebSocket client missed heartbeat, disconnecting")
+                        self._drop(websocket)
+                    else:
+                        client.enqueue(OutboundMessage(data=ping_text))
+            except Exception as e:
+                print(f"❌ Error in WebSocket heartbeat: {e}")
+
+    def set_user(self, websocket: WebSocket, user: Dict[str, Any]):
+        """
+        Attach an authenticated user to a connection.
+
+        Args:
+            websocket: WebSocket connection
+            user: User dictionary as returned by get_current_user
+        """
+        self.client_users[websocket] = user
+
+    def get_user(self, websocket: WebSocket) -> Optional[Dict[str, Any]]:
+        """
+        Get the authenticated user for a connection.
+
+        Args:
+            websocket: WebSocket connection
+
+        Returns:
+            User dictionary, or None if the connection has not authenticated
+        """
+        return self.client_users.get(websocket)
+
+    def subscribe(self, websocket: WebSocket, patient_ids: Iterable[int]) -> Set[int]:
+        """
+        Subscribe a connection to updates for the given patients.
+        The connection stops receiving the unfiltered firehose.
+
+        Args:
+            websocket: WebSocket connection
+            patient_ids: Patient IDs to subscribe to
+
+        Returns:
+            Full set of patient IDs the connection is now subscribed to
+        """
+        self.firehose_connections.discard(websocket)
+        topics = self.client_subscriptions.setdefault(websocket, set())
+        patient_ids = [int(pid) for pid in patient_ids]
+        for patient_id in patient_ids:
+            topics.add(patient_id)
+            self.patient_subscribers.setdefault(patient_id, set()).add(websocket)
+
+        # Start each (re)subscribed patient with a keyframe
+        client = self.clients.get(websocket)
+        if client:
+            client.reset_delta(patient_ids)
+        return set(topics)
+
+    def unsubscribe(self, websocket: WebSocket, patient_ids: Optional[Iterable[int]] = None) -> Set[int]:
+        """
+        Unsubscribe a connection from the given patients (or from all patients).
+
+        Args:
+            websocket: WebSocket connection
+            patient_ids: Patient IDs to unsubscribe from (None = all)
+
+        Returns:
+            Remaining set of patient IDs the connection is subscribed to
+        """
+        topics = self.client_subscriptions.get(websocket)
+        if not topics:
+            return set()
+
+        targets = set(topics) if patient_ids is None else {int(pid) for pid in patient_ids}
+        for patient_id in targets:
+            topics.discard(patient_id)
+            subscribers = self.patient_subscribers.get(patient_id)
+            if subscribers is not None:
+                subscribers.discard(websocket)
+                if not subscribers:
+                    del self.patient_subscribers[patient_id]
+
+        if not topics:
+            self.client_subscriptions.pop(websocket, None)
+        return set(topics)
+
+    def get_subscriptions(self, websocket: WebSocket) -> Set[int]:
+        """
+        Get the patient IDs a connection is subscribed to.
+
+        Args:
+            websocket: WebSocket connection
+
+        Returns:
+            Set of subscribed patient IDs
+        """
+        return set(self.client_subscriptions.get(websocket, set()))
+
+    def _recipients_for_patient(self, patient_id: Any, staff_only: bool = False) -> Set[WebSocket]:
+        """
+        Connections that should receive an update for a patient: its subscribers
+        plus firehose clients, or only its staff subscribers if staff_only.
+        """
+        subscribers = self.patient_subscribers.get(_patient_key(patient_id), ())
+        if staff_only:
+            return {connection for connection in subscribers if self._is_staff(connection)}
+        return self.firehose_connections | set(subscribers)
+
+    def _is_staff(self, websocket: WebSocket) -> bool:
+        """Whether a connection authenticated as a staff member."""
+        user = self.client_users.get(websocket)
+        return user is not None and user.get("role") in STAFF_ROLES
+
     async def send_personal_message(self, message: str, websocket: WebSocket):
         """
         Send a message to a specific WebSocket connection.
-        
+
         Args:
-            message: Message to send
+            message: Message to send (control messages are always JSON text)
             websocket: Target WebSocket connection
         """
-        try:
-            await websocket.send_text(message)
-        except Exception as e:
-            print(f"Error sending personal message: {e}")
-            self.disconnect(websocket)
-    
-    async def broadcast(self, message: dict):
+        client = self.clients.get(websocket)
+        if client:
+            client.enqueue(OutboundMessage(data=message))
+
+    def _send_encoded(
+        self,
+        connections: Iterable[WebSocket],
+        encode: Callable[[str], Payload],
+        cache: Dict[Any, Payload],
+        cache_key: Any = None,
+        rows: Optional[List[Dict[str, Any]]] = None,
+        timestamp: Optional[str] = None,
+        seq: Optional[int] = None,
+        trace: Optional[BatchTrace] = None
+    ):
+        """
+        Queue a message for the given connections (never blocks on the network).
+        The payload is encoded once per client encoding and shared through cache;
+        delta-mode clients get their own vitals_delta frame instead. Encoding
+        time of vitals frames is recorded as the serialize tracing stage.
+        """
+        for connection in list(connections):
+            client = self.clients.get(connection)
+            if not client:
+                continue
+            if rows is not None and client.stream_mode == STREAM_DELTA:
+                encode_start = time.perf_counter()
+                message = client.make_delta(rows, timestamp, seq)
+                self._observe_serialize(time.perf_counter() - encode_start, trace)
+                message.trace = trace
+                client.enqueue(message)
+                continue
+            key = (client.encoding, cache_key)
+            data = cache.get(key)
+            if data is None:
+                encode_start = time.perf_counter()
+                data = encode(client.encoding)
+                if rows is not None:
+                    self._observe_serialize(time.perf_counter() - encode_start, trace)
+                cache[key] = data
+            client.enqueue(OutboundMessage(data=data, rows=rows, timestamp=timestamp, seq=seq, trace=trace))
+
+    def _observe_serialize(self, seconds: float, trace: Optional[BatchTrace]):
+        observe("serialize", seconds)
+        if trace:
+            trace.serialize_seconds += seconds
+
+    async def broadcast(self, message: dict, relay: bool = True):
         """
         Broadcast a message to all connected WebSocket clients.
-        
+
+        Args:
+            message: Dictionary to broadcast (encoded per client encoding)
+            relay: Also forward to sibling workers (False for relayed messages)
+        """
+        if relay and self.relay:
+            self.relay.publish({"kind": "all", "message": message})
+        entry = self.replay.append(KIND_ALL)
+        message = entry.message = {**message, "seq": entry.seq}
+        if not self.active_connections:
+            return
+
+        self._send_encoded(
+            self.active_connections,
+            lambda encoding: encode_message(message, encoding),
+            cache={}
+        )
+
+    async def broadcast_to_patient(
+        self,
+        patient_id: int,
+        message: dict,
+        relay: bool = True,
+        staff_only: bool = False
+    ):
+        """
+        Send a message to the clients subscribed to a patient
+        (plus legacy clients that have not subscribed to anything).
+
+        Args:
+            patient_id: Patient the message is about
+            message: Dictionary to send (encoded per client encoding)
+            relay: Also forward to sibling workers (False for relayed messages)
+            staff_only: Only send to subscribers authenticated as staff
+                        (never to firehose clients)
+        """
+        if relay and self.relay:
+            self.relay.publish({
+                "kind": "patient", "patient_id": patient_id, "message": message, "staff_only": staff_only
+            })
+        get_summary_cache().on_patient_message(patient_id, message)
+        entry = self.replay.append(KIND_PATIENT, patient_id=patient_id, staff_only=staff_only)
+        message = entry.message = {**message, "seq": entry.seq}
+        recipients = self._recipients_for_patient(patient_id, staff_only)
+        if not recipients:
+            return
+
+        self._send_encoded(
+            recipients,
+            lambda encoding: encode_message(message, encoding),
+            cache={}
+        )
+
+    async def broadcast_vitals(
+        self,
+        vitals: List[Dict[str, Any]],
+        timestamp: str,
+        relay: bool = True,
+        trace: Optional[BatchTrace] = None
+    ):
+        """
+        Send a vitals_update to each client containing only the rows for the
+        patients it subscribed to. Each distinct frame is encoded once per
+        encoding and shared by every client that receives it.
+
         Args:
-            message: Dictionary to broadcast (will be JSON-encoded)
+            vitals: Vital sign rows (each must contain patient_id)
+            timestamp: ISO timestamp of the broadcast
+            relay: Also forward to sibling workers (False for relayed messages)
+            trace: Timing context from the poller (built from the rows' metadata if None)
         """
+        if relay and self.relay and vitals:
+            self.relay.publish({"kind": "vitals", "rows": vitals, "timestamp": timestamp})
+        if not vitals:
+            return
+        get_summary_cache().on_vitals(vitals)
+        seq = self.replay.append(KIND_VITALS, rows=vitals, timestamp=timestamp).seq
         if not self.active_connections:
             return
-        
-        message_text = json.dumps(message, default=str)  # default=str handles datetime serialization
-        disconnected = []
-        
-        for connection in self.active_connections:
+        if trace is None and VITALS_TRACING:
+            trace = BatchTrace(vitals)
+        broadcast_start = time.perf_counter()
+        WS_BROADCAST_ROWS.inc(len(vitals))
+
+        cache: Dict[Any, Payload] = {}
+
+        # Firehose clients all get the same full batch
+        if self.firehose_connections:
+            self._send_encoded(
+                self.firehose_connections,
+                lambda encoding: encode_vitals(vitals, timestamp, encoding, seq=seq),
+                cache,
+                cache_key="all",
+                rows=vitals,
+                timestamp=timestamp,
+                seq=seq,
+                trace=trace
+            )
+
+        # Route rows to subscribed clients through the patient index
+        per_client: Dict[WebSocket, List[int]] = {}
+        for index, row in enumerate(vitals):
             try:
-                await connection.send_text(message_text)
-            except Exception as e:
-                print(f"Error broadcasting to client: {e}")
-                disconnected.append(connection)
-        
-        # Remove disconnected clients
-        for connection in disconnected:
-            self.disconnect(connection)
-    
+                subscribers = self.patient_subscribers.get(int(row.get("patient_id")))
+            except (TypeError, ValueError):
+                continue
+            if not subscribers:
+                continue
+            for connection in subscribers:
+                per_client.setdefault(connection, []).append(index)
+
+        # Clients with the same subset of rows share one encoded frame
+        by_subset: Dict[tuple, List[WebSocket]] = {}
+        for connection, indexes in per_client.items():
+            by_subset.setdefault(tuple(indexes), []).append(connection)
+
+        for indexes, connections in by_subset.items():
+            rows = [vitals[i] for i in indexes]
+            self._send_encoded(
+                connections,
+                lambda encoding, rows=rows: encode_vitals(rows, timestamp, encoding, seq=seq),
+                cache,
+                cache_key=indexes,
+                rows=rows,
+                timestamp=timestamp,
+                seq=seq,
+                trace=trace
+            )
+        WS_BROADCAST_SECONDS.observe(time.perf_counter() - broadcast_start)
+
     def disconnect_all(self):
         """Disconnect all active WebSocket connections."""
+        for client in self.clients.values():
+            client.close()
+        self.clients.clear()
         self.active_connections.clear()
+        self.patient_subscribers.clear()
+        self.client_subscriptions.clear()
+        self.client_users.clear()
+        self.firehose_connections.clear()
         print("All WebSocket connections closed")
 
+
+def _patient_key(patient_id: Any) -> Optional[int]:
+    """Normalize a patient_id to the int used in subscriptions."""
+    try:
+        return int(patient_id)
+    except (TypeError, ValueError):
+        return None
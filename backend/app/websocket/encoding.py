@@ -0,0 +1,172 @@
+"""
+Wire encodings for WebSocket push frames
+
+Supported encodings (negotiated per client):
+- json: row-oriented JSON text (default, original format)
+- msgpack: row-oriented MessagePack binary, timestamps as epoch milliseconds
+- columnar: JSON text with one array per field and epoch-ms timestamps;
+  patient names are sent once per patient instead of once per row
+- columnar_msgpack: the columnar frame encoded as MessagePack binary
+
+Control frames (auth_ok, subscribed, ping, error) are always JSON text.
+vitals_delta frames (delta stream mode) are always row-oriented, since
+fields missing from a delta row cannot be told apart from nulls in columns.
+"""
+import json
+from datetime import datetime, date
+from decimal import Decimal
+from typing import List, Dict, Any, Union
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+ENCODING_JSON = "json"
+ENCODING_MSGPACK = "msgpack"
+ENCODING_COLUMNAR = "columnar"
+ENCODING_COLUMNAR_MSGPACK = "columnar_msgpack"
+
+ENCODINGS = (ENCODING_JSON, ENCODING_MSGPACK, ENCODING_COLUMNAR, ENCODING_COLUMNAR_MSGPACK)
+BINARY_ENCODINGS = (ENCODING_MSGPACK, ENCODING_COLUMNAR_MSGPACK)
+COLUMNAR_ENCODINGS = (ENCODING_COLUMNAR, ENCODING_COLUMNAR_MSGPACK)
+
+# Per-row fields moved to the columnar "patients" map
+NAME_FIELDS = ("first_name", "last_name")
+
+Payload = Union[str, bytes]
+
+
+def available_encodings() -> List[str]:
+    """
+    Get the encodings supported by this server.
+
+    Returns:
+        List of encoding names (binary ones only if msgpack is installed)
+    """
+    if msgpack is None:
+        return [e for e in ENCODINGS if e not in BINARY_ENCODINGS]
+    return list(ENCODINGS)
+
+
+def to_epoch_ms(value: Any) -> Any:
+    """
+    Convert a datetime to epoch milliseconds (naive values are local time,
+    matching how readings are written). Other values are returned unchanged.
+    """
+    if isinstance(value, datetime):
+        return int(value.timestamp() * 1000)
+    return value
+
+
+def _msgpack_default(value: Any) -> Any:
+    """Fallback serializer for MessagePack."""
+    if isinstance(value, datetime):
+        return to_epoch_ms(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def _json_default(value: Any) -> Any:
+    """Fallback serializer for columnar JSON (values are already mostly primitive)."""
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def columnar_vitals(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Pivot vital rows into one array per field.
+
+    Args:
+        rows: Vital sign rows
+
+    Returns:
+        Dictionary with "columns" (field -> list of values) and
+        "patients" (patient_id -> {first_name, last_name})
+    """
+    fields: List[str] = []
+    seen = set()
+    for row in rows:
+        for key in row:
+            if key not in seen and key not in NAME_FIELDS:
+                seen.add(key)
+                fields.append(key)
+
+    columns: Dict[str, List[Any]] = {field: [] for field in fields}
+    patients: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        for field in fields:
+            value = row.get(field)
+            if isinstance(value, datetime):
+                value = to_epoch_ms(value)
+            elif isinstance(value, Decimal):
+                value = float(value)
+            columns[field].append(value)
+        patient_id = row.get("patient_id")
+        if patient_id is not None and str(patient_id) not in patients:
+            patients[str(patient_id)] = {name: row.get(name) for name in NAME_FIELDS}
+
+    return {"columns": columns, "patients": patients}
+
+
+def encode_message(message: Dict[str, Any], encoding: str) -> Payload:
+    """
+    Encode a generic (non-vitals) message for a client encoding.
+
+    Args:
+        message: Message dictionary
+        encoding: Client encoding
+
+    Returns:
+        JSON text, or MessagePack bytes for binary encodings
+    """
+    if encoding in BINARY_ENCODINGS:
+        return msgpack.packb(message, default=_msgpack_default)
+    return json.dumps(message, default=str)  # default=str handles datetime serialization
+
+
+def encode_vitals(
+    rows: List[Dict[str, Any]],
+    timestamp: str,
+    encoding: str,
+    frame_type: str = "vitals_update",
+    **extra: Any
+) -> Payload:
+    """
+    Encode a vitals frame.
+
+    Args:
+        rows: Vital sign rows
+        timestamp: ISO timestamp of the broadcast
+        encoding: Client encoding
+        frame_type: vitals_update (full rows) or vitals_delta (changed fields only)
+        **extra: Additional top-level frame fields
+
+    Returns:
+        Encoded frame (str for text encodings, bytes for binary ones)
+    """
+    if encoding in COLUMNAR_ENCODINGS and frame_type == "vitals_update":
+        frame = {
+            "type": "vitals_update",
+            "format": "columnar",
+            "count": len(rows),
+            **columnar_vitals(rows),
+            "timestamp": timestamp,
+            **extra
+        }
+        if encoding == ENCODING_COLUMNAR_MSGPACK:
+            return msgpack.packb(frame, default=_msgpack_default)
+        return json.dumps(frame, default=_json_default)
+
+    frame = {
+        "type": frame_type,
+        "count": len(rows),
+        "data": rows,
+        "timestamp": timestamp,
+        **extra
+    }
+    return encode_message(frame, encoding)
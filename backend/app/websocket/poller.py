@@ -2,43 +2,118 @@
 Background poller task for checking database updates and broadcasting via WebSocket
 """
 import asyncio
-from datetime import datetime, timedelta
-from typing import Optional
+import os
+import time
+from datetime import datetime
+from typing import Optional, Dict, Any, List
 from sqlalchemy import text
-from app.db.database import get_engine
+from app.db.database import get_async_engine
 from app.websocket.connection_manager import ConnectionManager
+from app.core.tracing import VITALS_TRACING, BatchTrace, observe
+from app.core.metrics import POLLER_CYCLE_SECONDS, POLLER_CYCLE_ROWS
+
+# Adaptive scheduling: the interval moves between the floor and the ceiling.
+# Trade-off of the ceiling: an idle poller issues one query per
+# POLL_INTERVAL_MAX seconds instead of one per POLL_INTERVAL, but the first
+# reading after a quiet spell can wait up to POLL_INTERVAL_MAX seconds before
+# it is broadcast (later ones tighten the interval again). Set it to
+# POLL_INTERVAL for the old worst-case latency.
+POLL_INTERVAL = float(os.getenv("POLL_INTERVAL", "1.0"))
+POLL_INTERVAL_MIN = float(os.getenv("POLL_INTERVAL_MIN", "0.1"))
+POLL_INTERVAL_MAX = float(os.getenv("POLL_INTERVAL_MAX", "5.0"))
+POLL_BACKOFF_FACTOR = float(os.getenv("POLL_BACKOFF_FACTOR", "2.0"))
+
+# Scheduler decisions
+DECISION_FLOOR = "floor"      # A page came back full: poll again as fast as allowed
+DECISION_TIGHTEN = "tighten"  # Rows arrived: shorten the interval
+DECISION_BACKOFF = "backoff"  # Nothing new: lengthen the interval
 
 
 class VitalsPoller:
     """
     Polls the database for new vital signs and broadcasts updates via WebSocket.
+
+    Uses a monotonic vitals_id cursor (high-water mark) instead of timestamps,
+    and drains the backlog page by page on every tick. Auto-increment IDs can
+    commit out of order, so IDs skipped inside a page are remembered as gaps
+    and re-checked until they appear or expire (rolled-back inserts never do).
+
+    The interval adapts to traffic: it drops to the floor when a page comes
+    back full, halves when rows arrive, and backs off exponentially towards
+    the ceiling while polls come back empty, so idle periods cost few
+    queries. The ceiling bounds how long the first reading after a quiet
+    spell can wait.
+
+    Lag is derived from the pages themselves: every cycle drains until a
+    page comes back short, so afterwards only the pending gaps are known to
+    be unsent.
+
+    Each query is timed, and every broadcast batch carries a BatchTrace so
+    the ingest-to-pickup, serialization and per-client send stages are
+    recorded (see app.core.tracing).
     """
-    
-    def __init__(self, manager: ConnectionManager, poll_interval: float = 1.0):
+
+    VITALS_COLUMNS = """
+        v.vitals_id, v.patient_id, v.device_id, v.ts,
+        v.heart_rate, v.spo2, v.bp_systolic, v.bp_diastolic,
+        v.temperature_c, v.respiration, v.metadata,
+        p.first_name, p.last_name
+    """
+
+    def __init__(
+        self,
+        manager: ConnectionManager,
+        poll_interval: float = POLL_INTERVAL,
+        page_size: int = 500,
+        gap_timeout: float = 10.0,
+        min_interval: float = POLL_INTERVAL_MIN,
+        max_interval: float = POLL_INTERVAL_MAX,
+        backoff_factor: float = POLL_BACKOFF_FACTOR
+    ):
         """
         Initialize the poller.
-        
+
         Args:
             manager: ConnectionManager instance for broadcasting
-            poll_interval: Polling interval in seconds (default: 1.0)
+            poll_interval: Initial polling interval in seconds (default: 1.0)
+            page_size: Maximum rows fetched per query (default: 500)
+            gap_timeout: Seconds to keep waiting for a skipped vitals_id (default: 10.0)
+            min_interval: Shortest interval, used during bursts (default: 0.1)
+            max_interval: Longest interval, reached when idle (default: 5.0)
+            backoff_factor: Multiplier applied per empty poll (default: 2.0)
         """
         self.manager = manager
-        self.poll_interval = poll_interval
-        self.last_check: Optional[datetime] = None
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.backoff_factor = max(1.0, backoff_factor)
+        self.poll_interval = min(max(poll_interval, self.min_interval), self.max_interval)
+        self.page_size = page_size
+        self.gap_timeout = gap_timeout
+        self.last_vitals_id: Optional[int] = None
+        # Skipped vitals_id -> monotonic time it was first noticed
+        self.pending_gaps: Dict[int, float] = {}
+        self.lag_rows = 0
+        self.lag_seconds = 0.0
+        self.last_cycle_rows = 0
+        self.last_cycle_full = False
+        self.polls = 0
+        self.empty_polls = 0
+        self.decisions: Dict[str, int] = {DECISION_FLOOR: 0, DECISION_TIGHTEN: 0, DECISION_BACKOFF: 0}
+        self.last_decision: Optional[str] = None
+        self._interval_total = 0.0
+        self.last_query_seconds: Optional[float] = None
         self.running = False
         self._task: Optional[asyncio.Task] = None
-    
+
     async def start(self):
         """Start the polling task."""
         if self.running:
             return
-        
+
         self.running = True
-        # Initialize last_check to current time minus 1 minute to get recent data on startup
-        self.last_check = datetime.utcnow() - timedelta(minutes=1)
         self._task = asyncio.create_task(self._poll_loop())
         print("🚀 Vitals poller started")
-    
+
     async def stop(self):
         """Stop the polling task."""
         self.running = False
@@ -49,7 +124,30 @@ class VitalsPoller:
             except asyncio.CancelledError:
                 pass
         print("🛑 Vitals poller stopped")
-    
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get the poller's cursor position and lag.
+
+        Returns:
+            Dictionary with last_vitals_id, lag_rows, lag_seconds,
+            last_cycle_rows, pending_gaps and the scheduler's state
+            (current/average interval, poll counts, decisions)
+        """
+        return {
+            "last_vitals_id": self.last_vitals_id,
+            "lag_rows": self.lag_rows,
+            "lag_seconds": self.lag_seconds,
+            "last_cycle_rows": self.last_cycle_rows,
+            "pending_gaps": len(self.pending_gaps),
+            "poll_interval": self.poll_interval,
+            "avg_poll_interval": self._interval_total / self.polls if self.polls else self.poll_interval,
+            "polls": self.polls,
+            "empty_polls": self.empty_polls,
+            "decisions": dict(self.decisions),
+            "last_decision": self.last_decision,
+        }
+
     async def _poll_loop(self):
         """Main polling loop."""
         while self.running:
@@ -57,56 +155,182 @@ class VitalsPoller:
                 await self._check_and_broadcast()
             except Exception as e:
                 print(f"❌ Error in poller loop: {e}")
-            
+
+            self._schedule_next()
             await asyncio.sleep(self.poll_interval)
-    
+
+    def _schedule_next(self):
+        """Pick the next interval from what the last cycle returned."""
+        if self.last_cycle_full:
+            decision = DECISION_FLOOR
+            self.poll_interval = self.min_interval
+        elif self.last_cycle_rows:
+            decision = DECISION_TIGHTEN
+            self.poll_interval = max(self.min_interval, self.poll_interval / self.backoff_factor)
+        else:
+            decision = DECISION_BACKOFF
+            self.empty_polls += 1
+            self.poll_interval = min(self.max_interval, self.poll_interval * self.backoff_factor)
+
+        self.decisions[decision] += 1
+        self.last_decision = decision
+        self.polls += 1
+        self._interval_total += self.poll_interval
+
+    async def _init_cursor(self, conn) -> int:
+        """
+        Place the cursor just before the last minute of data so recent
+        readings are sent on startup.
+        """
+        row = (await conn.execute(text("""
+            SELECT MIN(vitals_id) FROM vitals
+            WHERE ts > NOW(6) - INTERVAL 1 MINUTE
+        """))).fetchone()
+        if row and row[0] is not None:
+            return int(row[0]) - 1
+
+        row = (await conn.execute(text("SELECT COALESCE(MAX(vitals_id), 0) FROM vitals"))).fetchone()
+        return int(row[0])
+
+    def _track_gaps(self, rows: List[Dict[str, Any]]):
+        """Record vitals_ids skipped between the cursor and the rows just read."""
+        now = time.monotonic()
+        expected = self.last_vitals_id + 1
+        for row in rows:
+            vitals_id = row["vitals_id"]
+            # Very wide jumps come from burned IDs (rejected or rolled-back
+            # batches), not from transactions still in flight
+            if vitals_id - expected <= self.page_size:
+                for missing in range(expected, vitals_id):
+                    if len(self.pending_gaps) >= self.page_size:
+                        break
+                    self.pending_gaps.setdefault(missing, now)
+            expected = vitals_id + 1
+
+    async def _fetch_gaps(self, conn) -> List[Dict[str, Any]]:
+        """Fetch rows that filled earlier gaps, and expire gaps that never filled."""
+        if not self.pending_gaps:
+            return []
+
+        params = {f"id{i}": gap_id for i, gap_id in enumerate(self.pending_gaps)}
+        placeholders = ", ".join(f":{name}" for name in params)
+        query_start = time.perf_counter()
+        result = await conn.execute(
+            text(f"""
+                SELECT {self.VITALS_COLUMNS}
+                FROM vitals v
+                LEFT JOIN patients p ON v.patient_id = p.patient_id
+                WHERE v.vitals_id IN ({placeholders})
+                ORDER BY v.vitals_id ASC
+            """),
+            params
+        )
+        rows = [dict(row._mapping) for row in result]
+        self._observe_query(time.perf_counter() - query_start)
+        for row in rows:
+            self.pending_gaps.pop(row["vitals_id"], None)
+
+        deadline = time.monotonic() - self.gap_timeout
+        for gap_id, first_seen in list(self.pending_gaps.items()):
+            if first_seen < deadline:
+                del self.pending_gaps[gap_id]
+        return rows
+
+    async def _fetch_page(self, conn) -> List[Dict[str, Any]]:
+        """Fetch the next page of vitals after the cursor."""
+        query_start = time.perf_counter()
+        result = await conn.execute(
+            text(f"""
+                SELECT {self.VITALS_COLUMNS}
+                FROM vitals v
+                LEFT JOIN patients p ON v.patient_id = p.patient_id
+                WHERE v.vitals_id > :last_vitals_id
+                ORDER BY v.vitals_id ASC
+                LIMIT :page_size
+            """),
+            {"last_vitals_id": self.last_vitals_id, "page_size": self.page_size}
+        )
+        rows = [dict(row._mapping) for row in result]
+        self._observe_query(time.perf_counter() - query_start)
+        return rows
+
+    def _observe_query(self, seconds: float):
+        self.last_query_seconds = seconds
+        observe("query", seconds)
+
+    def _update_lag(self, drained: bool):
+        """
+        Update rows not yet broadcast and how long the oldest has waited.
+
+        No extra query: once a cycle has read a short page, nothing after the
+        cursor was committed at that point, so only the pending gaps (rows
+        that may still commit) are outstanding. A cycle cut short by stop()
+        leaves the previous values.
+        """
+        if not drained:
+            return
+        self.lag_rows = len(self.pending_gaps)
+        oldest = min(self.pending_gaps.values(), default=None)
+        self.lag_seconds = time.monotonic() - oldest if oldest is not None else 0.0
+
+    async def _broadcast(self, rows: List[Dict[str, Any]]):
+        """Broadcast rows (each client only gets its subscribed patients)."""
+        trace = BatchTrace(rows, time.time(), self.last_query_seconds) if VITALS_TRACING else None
+        await self.manager.broadcast_vitals(rows, datetime.utcnow().isoformat(), trace=trace)
+
     async def _check_and_broadcast(self):
         """
-        Check database for new vitals and broadcast if found.
+        Check database for new vitals and broadcast until the backlog is drained.
         """
-        if not self.last_check:
-            self.last_check = datetime.utcnow() - timedelta(minutes=1)
-        
+        cycle_start = time.perf_counter()
         try:
-            engine = get_engine()
-            with engine.connect() as conn:
-                # Query for new vitals since last check
-                # Use the view if available, otherwise query vitals directly
-                query = """
-                    SELECT v.vitals_id, v.patient_id, v.device_id, v.ts,
-                           v.heart_rate, v.spo2, v.bp_systolic, v.bp_diastolic,
-                           v.temperature_c, v.respiration, v.metadata,
-                           p.first_name, p.last_name
-                    FROM vitals v
-                    LEFT JOIN patients p ON v.patient_id = p.patient_id
-                    WHERE v.ts > :last_check
-                    ORDER BY v.ts ASC
-                    LIMIT 100
-                """
-                
-                result = conn.execute(
-                    text(query),
-                    {"last_check": self.last_check}
-                )
-                
-                new_vitals = [dict(row._mapping) for row in result]
-                
-                if new_vitals:
-                    # Update last_check to the most recent timestamp
-                    latest_ts = max(v["ts"] for v in new_vitals if v.get("ts"))
-                    if latest_ts:
-                        self.last_check = latest_ts
-                    
-                    # Broadcast updates
-                    await self.manager.broadcast({
-                        "type": "vitals_update",
-                        "count": len(new_vitals),
-                        "data": new_vitals,
-                        "timestamp": datetime.utcnow().isoformat()
-                    })
-                    print(f"📡 Broadcasted {len(new_vitals)} new vital sign(s)")
-        
+            engine = get_async_engine()
+            async with engine.connect() as conn:
+                if self.last_vitals_id is None:
+                    self.last_vitals_id = await self._init_cursor(conn)
+
+                cycle_rows = 0
+                drained = False
+                self.last_cycle_full = False
+
+                late_rows = await self._fetch_gaps(conn)
+                if late_rows:
+                    await self._broadcast(late_rows)
+                    cycle_rows += len(late_rows)
+
+                while self.running:
+                    new_vitals = await self._fetch_page(conn)
+                    if not new_vitals:
+                        drained = True
+                        break
+
+                    self._track_gaps(new_vitals)
+                    self.last_vitals_id = new_vitals[-1]["vitals_id"]
+                    await self._broadcast(new_vitals)
+                    cycle_rows += len(new_vitals)
+
+                    if len(new_vitals) < self.page_size:
+                        drained = True
+                        break
+                    self.last_cycle_full = True
+                    # End the read snapshot so the next page sees new commits,
+                    # and let other tasks run between pages
+                    await conn.commit()
+                    await asyncio.sleep(0)
+
+                self._update_lag(drained)
+                await conn.commit()
+                self.last_cycle_rows = cycle_rows
+                POLLER_CYCLE_SECONDS.observe(time.perf_counter() - cycle_start)
+                POLLER_CYCLE_ROWS.observe(cycle_rows)
+
+                if cycle_rows:
+                    print(f"📡 Broadcasted {cycle_rows} new vital sign(s)")
+
         except Exception as e:
+            # Back off while the database is unavailable
+            self.last_cycle_rows = 0
+            self.last_cycle_full = False
             print(f"❌ Error checking for new vitals: {e}")
 
 
@@ -130,14 +354,18 @@ def get_poller(manager: ConnectionManager) -> VitalsPoller:
     return _poller
 
 
-async def start_poller(manager: ConnectionManager):
+async def start_poller(manager: ConnectionManager, last_vitals_id: Optional[int] = None):
     """
     Start the vitals poller.
     
     Args:
         manager: ConnectionManager instance
+        last_vitals_id: Cursor to resume from (e.g. after a leader failover);
+                        None starts from the last minute of data
     """
     poller = get_poller(manager)
+    if last_vitals_id is not None:
+        poller.last_vitals_id = last_vitals_id
     await poller.start()
 
 
@@ -148,3 +376,14 @@ async def stop_poller():
         await _poller.stop()
         _poller = None
 
+
+def get_poller_stats() -> Optional[Dict[str, Any]]:
+    """
+    Get statistics of the running poller.
+
+    Returns:
+        Poller statistics, or None if the poller is not running
+    """
+    if _poller is None:
+        return None
+    return _poller.get_stats()
@@ -0,0 +1,107 @@
+"""
+Sequence numbers and a replay buffer for WebSocket push frames
+
+Every broadcast gets the next sequence number and is kept in a bounded
+ring buffer, so a client that reconnects can ask for what it missed
+instead of refetching everything over REST.
+"""
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Any, List, Optional
+
+# Broadcast kinds kept in the buffer
+KIND_VITALS = "vitals"
+KIND_PATIENT = "patient"
+KIND_ALL = "all"
+
+
+@dataclass
+class ReplayEntry:
+    """
+    One broadcast, stored unencoded so it can be filtered and encoded per client.
+
+    Attributes:
+        seq: Sequence number of the broadcast
+        kind: vitals, patient (one patient's subscribers) or all
+        created: Monotonic time the broadcast was made
+        rows: Vital rows (vitals)
+        timestamp: Broadcast timestamp (vitals)
+        patient_id: Target patient (patient)
+        staff_only: Only replay to the patient's staff subscribers (patient)
+        message: Message dictionary, already carrying its seq (patient, all)
+    """
+    seq: int
+    kind: str
+    created: float
+    rows: Optional[List[Dict[str, Any]]] = None
+    timestamp: Optional[str] = None
+    patient_id: Optional[int] = None
+    staff_only: bool = False
+    message: Dict[str, Any] = field(default_factory=dict)
+
+
+class ReplayBuffer:
+    """
+    Ring buffer of recent broadcasts, bounded by count and age.
+
+    Sequence numbers restart with the process, so the buffer has a random
+    epoch; a client resuming with another epoch's seq must resync.
+    """
+
+    def __init__(self, max_events: int, max_age: float):
+        """
+        Initialize the buffer.
+
+        Args:
+            max_events: Maximum number of broadcasts kept
+            max_age: Seconds a broadcast stays replayable
+        """
+        self.max_age = max_age
+        self.epoch = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.entries: Deque[ReplayEntry] = deque(maxlen=max(1, max_events))
+
+    def append(self, kind: str, **payload: Any) -> ReplayEntry:
+        """
+        Assign the next sequence number to a broadcast and keep it.
+
+        Args:
+            kind: vitals, patient or all
+            **payload: rows/timestamp, or patient_id/message, or message
+
+        Returns:
+            The stored entry
+        """
+        self.seq += 1
+        entry = ReplayEntry(seq=self.seq, kind=kind, created=time.monotonic(), **payload)
+        self.entries.append(entry)
+        self._expire()
+        return entry
+
+    def since(self, seq: int) -> Optional[List[ReplayEntry]]:
+        """
+        Get the broadcasts made after a sequence number.
+
+        Args:
+            seq: Last sequence number the client received
+
+        Returns:
+            Entries with a higher seq, or None if some of them are no longer
+            buffered (or seq is not from this buffer) and the client must resync
+        """
+        self._expire()
+        if seq > self.seq or seq < 0:
+            return None
+        if seq == self.seq:
+            return []
+        if not self.entries or self.entries[0].seq > seq + 1:
+            return None
+        return [entry for entry in self.entries if entry.seq > seq]
+
+    def _expire(self):
+        """Drop broadcasts older than max_age."""
+        deadline = time.monotonic() - self.max_age
+        while self.entries and self.entries[0].created < deadline:
+            self.entries.popleft()
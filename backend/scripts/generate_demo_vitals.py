@@ -8,12 +8,24 @@ Ensures each staff member sees the demo phases for their assigned patients:
 
 For each staff member, their assigned patients are distributed across phases
 so every staff sees the demo progression.
+
+Generation and inserts are pipelined: the generator produces one batch per
+tick on an absolute schedule (start + n * DEMO_INTERVAL, with ts set to the
+tick's scheduled time) and hands it to DEMO_WRITERS writer threads, so insert
+latency no longer stretches the cadence. How late each tick was generated is
+reported as drift. Each batch is split by patient_id and every patient always
+goes to the same writer (through its own queue of at most DEMO_QUEUE_SIZE
+batches), so a patient's readings are committed, and get their vitals_id, in
+tick order, and no two writers evaluate alerts for the same patient at once.
 """
+import os
 import sys
 import time
+import queue
 import random
+import threading
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 from sqlalchemy import text
 from sqlalchemy.engine import Engine
 from collections import defaultdict
@@ -24,6 +36,10 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from simulator.db_writer import batch_insert_vitals
 from app.db.database import get_engine
 
+DEMO_INTERVAL = float(os.getenv("DEMO_INTERVAL", "1.0"))  # Seconds between readings per patient
+DEMO_WRITERS = int(os.getenv("DEMO_WRITERS", "2"))
+DEMO_QUEUE_SIZE = int(os.getenv("DEMO_QUEUE_SIZE", "10"))
+
 
 class DemoPatientState:
     """Patient state controller for demo with stable/warning/critical phases"""
@@ -177,6 +193,85 @@ class DemoPatientState:
         }
 
 
+class BatchWriterPool:
+    """Writer threads inserting batches, each owning a fixed shard of the patients."""
+
+    def __init__(self, writers: int = DEMO_WRITERS, queue_size: int = DEMO_QUEUE_SIZE):
+        """
+        Initialize the pool.
+
+        Args:
+            writers: Number of writer threads (patients are sharded by patient_id % writers)
+            queue_size: Batches that may wait per writer before submit() blocks
+        """
+        writers = max(1, writers)
+        self.queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in range(writers)]
+        self.threads = [
+            threading.Thread(target=self._run, args=(self.queues[i],), name=f"vitals-writer-{i}", daemon=True)
+            for i in range(writers)
+        ]
+        self.lock = threading.Lock()
+        self.batches_written = 0
+        self.records_written = 0
+        self.batches_failed = 0
+        self.write_seconds = 0.0
+        self.max_write_seconds = 0.0
+        self.max_queue_depth = 0
+
+    def start(self):
+        """Start the writer threads."""
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, batch: list):
+        """Split a batch by patient and queue each part on its writer (blocks while that queue is full)."""
+        shards = [[] for _ in self.queues]
+        for record in batch:
+            shards[record["patient_id"] % len(shards)].append(record)
+        for shard, writer_queue in zip(shards, self.queues):
+            if shard:
+                writer_queue.put(shard)
+                self.max_queue_depth = max(self.max_queue_depth, writer_queue.qsize())
+
+    def stop(self):
+        """Write everything still queued, then stop the writer threads."""
+        for writer_queue in self.queues:
+            writer_queue.put(None)
+        for thread in self.threads:
+            thread.join()
+
+    def _run(self, writer_queue: queue.Queue):
+        while True:
+            batch = writer_queue.get()
+            if batch is None:
+                return
+            started = time.perf_counter()
+            try:
+                batch_insert_vitals(batch, verbose=False)
+                failed = False
+            except Exception as e:
+                print(f"❌ Error inserting batch: {e}")
+                failed = True
+            took = time.perf_counter() - started
+            with self.lock:
+                if failed:
+                    self.batches_failed += 1
+                else:
+                    self.batches_written += 1
+                    self.records_written += len(batch)
+                self.write_seconds += took
+                self.max_write_seconds = max(self.max_write_seconds, took)
+
+    def queue_depth(self) -> int:
+        """Batches waiting on the busiest writer."""
+        return max(writer_queue.qsize() for writer_queue in self.queues)
+
+    def avg_write_ms(self) -> float:
+        """Average insert time per batch in milliseconds."""
+        done = self.batches_written + self.batches_failed
+        return self.write_seconds / done * 1000 if done else 0.0
+
+
 def get_staff_patient_assignments(engine: Engine) -> dict:
     """
     Get patient assignments for each staff member.
@@ -330,72 +425,92 @@ def main():
     PHASE2_END = 10  # 5-10 seconds: warning phase
     TOTAL_DURATION = 600  # 10 minutes
     
+    phase1_tick = int(PHASE1_END / DEMO_INTERVAL)
+    phase2_tick = int(PHASE2_END / DEMO_INTERVAL)
+    total_ticks = int(TOTAL_DURATION / DEMO_INTERVAL)
+
+    writers = BatchWriterPool()
+    writers.start()
+    print(f"🧵 {len(writers.threads)} writer thread(s) sharded by patient, queue of {DEMO_QUEUE_SIZE} batch(es) each, interval {DEMO_INTERVAL}s\n")
+
     count = 0
+    max_drift = 0.0
+    total_drift = 0.0
     start_time = time.time()
-    
+    start_clock = time.monotonic()
+    start_wall = datetime.now()
+
     try:
-        while True:
-            elapsed = time.time() - start_time
-            current_second = int(elapsed)
-            
-            # Check if demo duration reached
-            if elapsed >= TOTAL_DURATION:
-                print(f"\n✅ Demo completed! Ran for {elapsed:.1f} seconds")
-                break
-            
+        while count < total_ticks:
+            # Absolute schedule: tick n is due at start + n * interval
+            deadline = start_clock + count * DEMO_INTERVAL
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+            drift = time.monotonic() - deadline
+            max_drift = max(max_drift, drift)
+            total_drift += drift
+            current_second = int(count * DEMO_INTERVAL)
+
             # Phase transitions
-            if current_second == PHASE1_END:
+            if count == phase1_tick:
                 print(f"\n📊 [{current_second}s] Phase 2 starting: Transitioning {len(warning_patients)} patient(s) to WARNING state")
                 for pid in warning_patients:
                     patients[pid].set_state('warning')
-            
-            if current_second == PHASE2_END:
+
+            if count == phase2_tick:
                 print(f"\n📊 [{current_second}s] Phase 3 starting: Transitioning {len(critical_patients)} patient(s) to CRITICAL state")
                 for pid in critical_patients:
                     patients[pid].set_state('critical')
-            
-            # Generate vital data for all patients
+
+            # Generate vital data for all patients, stamped with the scheduled time
+            ts = start_wall + timedelta(seconds=count * DEMO_INTERVAL)
             vital_data_list = []
             for patient_id in patient_ids:
-                patient = patients[patient_id]
-                vital_data = patient.next_tick()
-                vital_data['ts'] = datetime.now()
+                vital_data = patients[patient_id].next_tick()
+                vital_data['ts'] = ts
                 vital_data_list.append(vital_data)
-            
-            # Insert all vitals at once
-            batch_insert_vitals(vital_data_list)
+
+            # Hand the batch to the writer threads
+            writers.submit(vital_data_list)
             count += 1
-            
-            # Print progress every 10 iterations or at phase transitions
-            if count % 10 == 0 or current_second in [PHASE1_END, PHASE2_END] or count <= 5:
+
+            # Print progress every 10 ticks or at phase transitions
+            if count % 10 == 0 or count - 1 in [phase1_tick, phase2_tick] or count <= 5:
                 # Count patients in each state
                 state_counts = {'stable': 0, 'warning': 0, 'critical': 0}
                 for pid in patient_ids:
                     state_counts[patients[pid].state] += 1
-                
+
                 print(f"[{current_second:3d}s] Batch {count:4d} | "
                       f"Stable: {state_counts['stable']}, "
                       f"Warning: {state_counts['warning']}, "
                       f"Critical: {state_counts['critical']} | "
                       f"Sample (P{patient_ids[0]}): HR={vital_data_list[0]['heart_rate']:3d}, "
-                      f"SpO2={vital_data_list[0]['spo2']:2d}%")
-            
-            # Wait 1 second before next iteration
-            time.sleep(1)
-        
+                      f"SpO2={vital_data_list[0]['spo2']:2d}% | "
+                      f"Drift: {drift * 1000:.1f}ms (max {max_drift * 1000:.1f}ms) | "
+                      f"Queue: {writers.queue_depth()} | Insert: {writers.avg_write_ms():.1f}ms avg")
+
+        print(f"\n✅ Demo completed! Ran for {time.time() - start_time:.1f} seconds")
+
     except KeyboardInterrupt:
         elapsed = time.time() - start_time
         print(f"\n🛑 Stopped by user after {elapsed:.1f} seconds")
         print(f"   Generated {count} batches ({count * len(patient_ids)} total vital records)")
-    
+
+    print("⏳ Waiting for queued batches to be written...")
+    writers.stop()
+
     # Final statistics
     elapsed = time.time() - start_time
-    total_records = count * len(patient_ids)
     print(f"\n📊 Final Statistics:")
     print(f"   Duration: {elapsed:.1f} seconds ({elapsed/60:.1f} minutes)")
-    print(f"   Batches: {count}")
-    print(f"   Total records: {total_records}")
-    print(f"   Average rate: {total_records/elapsed:.2f} records/second")
+    print(f"   Batches: {count} generated, {writers.batches_written} shard batch(es) written, {writers.batches_failed} failed")
+    print(f"   Total records: {writers.records_written}")
+    print(f"   Average rate: {writers.records_written/elapsed:.2f} records/second")
+    print(f"   Drift: {total_drift / count * 1000 if count else 0:.1f}ms avg, {max_drift * 1000:.1f}ms max")
+    print(f"   Insert: {writers.avg_write_ms():.1f}ms avg, {writers.max_write_seconds * 1000:.1f}ms max per batch")
+    print(f"   Queue depth: {writers.max_queue_depth} max of {DEMO_QUEUE_SIZE} per writer")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,146 @@
+"""
+Benchmark the db_writer write modes (rows/sec)
+
+Inserts the same synthetic batch with each mode and reports throughput.
+Rows are tagged in metadata with a run id and deleted afterwards unless
+--keep is given. Patients must be admitted (see admit_patients.py), since
+readings for anyone else are rejected.
+
+--admission-check both runs every mode twice: with trg_vitals_validate_admission
+(ADMISSION_CHECK=trigger) and with the trigger dropped and the admission cache
+validating batches (ADMISSION_CHECK=app). The trigger is restored afterwards if
+it existed, which needs SUPER or log_bin_trust_function_creators=1 while
+binary logging is on.
+
+Usage:
+    python simulator/benchmark_writer.py --rows 20000 --batch 5000 --patients 5
+    python simulator/benchmark_writer.py --modes multirow --admission-check both
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Dict, Any
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import text
+from app.db.database import get_engine
+from app.db.triggers import VALIDATE_ADMISSION_TRIGGER, trigger_exists, drop_trigger, create_trigger
+from simulator.db_writer import WRITE_MODES, batch_insert_vitals
+
+ADMISSION_CHECKS = ("trigger", "app")
+
+
+def make_rows(count: int, patients: List[int], run_id: str) -> List[Dict[str, Any]]:
+    """Generate synthetic vital rows tagged with the run id."""
+    start = datetime.now()
+    metadata = json.dumps({"benchmark": run_id})
+    return [
+        {
+            "patient_id": patients[i % len(patients)],
+            "device_id": None,
+            "ts": start + timedelta(microseconds=i),
+            "heart_rate": random.randint(60, 100),
+            "spo2": random.randint(95, 100),
+            "bp_systolic": random.randint(110, 130),
+            "bp_diastolic": random.randint(70, 85),
+            "temperature_c": round(random.uniform(36.5, 37.2), 2),
+            "respiration": random.randint(12, 18),
+            "metadata": metadata,
+        }
+        for i in range(count)
+    ]
+
+
+def cleanup(run_id: str) -> int:
+    """Delete the rows written by this run."""
+    engine = get_engine()
+    with engine.begin() as conn:
+        result = conn.execute(
+            text("DELETE FROM vitals WHERE JSON_UNQUOTE(JSON_EXTRACT(metadata, '$.benchmark')) = :run_id"),
+            {"run_id": run_id}
+        )
+        return result.rowcount
+
+
+def run(rows: List[Dict[str, Any]], mode: str, check: str, batch: int, chunk_size: int) -> float:
+    """Insert rows with one configuration and return rows/sec."""
+    started = time.perf_counter()
+    for offset in range(0, len(rows), batch):
+        batch_insert_vitals(rows[offset:offset + batch], mode=mode, chunk_size=chunk_size, admission_check=check)
+    return len(rows) / (time.perf_counter() - started)
+
+
+def set_admission_trigger(enabled: bool):
+    """Create or drop trg_vitals_validate_admission."""
+    with get_engine().begin() as conn:
+        if enabled:
+            create_trigger(conn, VALIDATE_ADMISSION_TRIGGER)
+        else:
+            drop_trigger(conn, VALIDATE_ADMISSION_TRIGGER)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark db_writer write modes")
+    parser.add_argument("--rows", type=int, default=20000, help="Rows per mode. Default: 20000")
+    parser.add_argument("--batch", type=int, default=5000, help="Rows per batch_insert_vitals call. Default: 5000")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Rows per statement in multirow mode. Default: 1000")
+    parser.add_argument("--patients", type=int, default=5, help="Number of patients (IDs from --start-id). Default: 5")
+    parser.add_argument("--start-id", type=int, default=1, help="First patient ID. Default: 1")
+    parser.add_argument("--modes", nargs="+", choices=WRITE_MODES, default=list(WRITE_MODES), help="Modes to run")
+    parser.add_argument(
+        "--admission-check", choices=ADMISSION_CHECKS + ("both",), default="trigger",
+        help="Validate admissions in the trigger, in the app cache, or compare both. Default: trigger"
+    )
+    parser.add_argument("--keep", action="store_true", help="Keep the inserted rows")
+    args = parser.parse_args()
+
+    patients = list(range(args.start_id, args.start_id + args.patients))
+    run_id = uuid.uuid4().hex[:12]
+    checks = ADMISSION_CHECKS if args.admission_check == "both" else (args.admission_check,)
+    results = []
+
+    with get_engine().connect() as conn:
+        had_trigger = trigger_exists(conn, VALIDATE_ADMISSION_TRIGGER)
+
+    print(f"🏁 Benchmarking {args.rows} rows per mode in batches of {args.batch} (run {run_id})")
+    try:
+        for check in checks:
+            if args.admission_check == "both":
+                # The trigger runs in trigger mode only; app mode replaces it
+                set_admission_trigger(check == "trigger")
+            for mode in args.modes:
+                rows = make_rows(args.rows, patients, run_id)
+                try:
+                    results.append((mode, check, run(rows, mode, check, args.batch, args.chunk_size)))
+                except Exception as e:
+                    print(f"❌ {mode} ({check}) failed: {e}")
+                    results.append((mode, check, None))
+    finally:
+        if args.admission_check == "both":
+            set_admission_trigger(had_trigger)
+
+    print("\n📊 Results")
+    print(f"{'mode':<14}{'admission':<12}{'rows/sec':>12}")
+    for mode, check, rate in results:
+        print(f"{mode:<14}{check:<12}{'failed' if rate is None else f'{rate:,.0f}':>12}")
+
+    if args.admission_check == "both":
+        rates = {(mode, check): rate for mode, check, rate in results}
+        for mode in args.modes:
+            before, after = rates.get((mode, "trigger")), rates.get((mode, "app"))
+            if before and after:
+                print(f"⚡ {mode}: {(after / before - 1) * 100:+.1f}% with the admission cache")
+
+    if not args.keep:
+        print(f"\n🧹 Deleted {cleanup(run_id)} benchmark row(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,178 @@
 """
 Database writer for batch inserting vital signs data
+
+Write modes for batch_insert_vitals():
+- executemany: the template run once per record through the driver
+- multirow: INSERT ... VALUES (...),(...) built from the parsed template,
+  one statement per chunk_size records (default)
+- load_data: LOAD DATA LOCAL INFILE from a temporary file, for very large
+  batches (needs local_infile=ON on the server)
+
+All modes write the whole batch in a single transaction. With
+ALERT_ENGINE=app, or when trg_vitals_threshold_alert has been dropped by a
+process running with it, the batch's threshold alerts are written in it too. With ADMISSION_CHECK=app,
+or when trg_vitals_validate_admission has been dropped, records for patients
+without an active admission are skipped up front instead of failing the
+batch in the trigger.
+
+With VITALS_SPOOL_DIR set, batches are appended to a durable on-disk spool
+instead and a background drainer writes them to MySQL in order, so the
+caller neither waits on nor fails with the database (see app/db/spool.py).
 """
 import os
-from typing import List, Dict, Any
+import re
+import tempfile
+import time
+from datetime import datetime, date
+from decimal import Decimal
+from functools import lru_cache
+from typing import List, Dict, Any, Tuple
 from pathlib import Path
-from sqlalchemy import text
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool
 from app.db.database import get_engine
+from app.db.alert_rules import app_alerts_sync, get_rules_engine
+from app.db.admissions import ADMISSION_CHECK, app_admission_check_sync, get_admission_cache
+from app.db.spool import get_spool
+from app.core.tracing import stamp_reading
+
+WRITE_MODES = ("executemany", "multirow", "load_data")
+DEFAULT_WRITE_MODE = os.getenv("WRITER_MODE", "multirow")
+DEFAULT_CHUNK_SIZE = int(os.getenv("WRITER_CHUNK_SIZE", "1000"))
+VITALS_SPOOL_DIR = os.getenv("VITALS_SPOOL_DIR")
+
+# INSERT INTO <table> (<columns>) VALUES (<placeholders>)
+_INSERT_RE = re.compile(
+    r"^\s*INSERT\s+INTO\s+(\w+)\s*\(([^)]*)\)\s*VALUES\s*\(([^)]*)\)\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL
+)
 
+_infile_engine: Engine = None
 
+
+@lru_cache(maxsize=None)
 def load_sql_template(template_name: str) -> str:
     """
-    Load SQL template from sql_templates directory.
-    
+    Load SQL template from sql_templates directory (cached after the first read).
+
     Args:
         template_name: Name of the SQL template file
-        
+
     Returns:
         SQL query string
     """
     # Get the directory where this file is located
     current_dir = Path(__file__).parent
     template_path = current_dir / "sql_templates" / template_name
-    
+
     if not template_path.exists():
         raise FileNotFoundError(f"SQL template not found: {template_path}")
-    
+
     with open(template_path, "r") as f:
         return f.read()
 
 
-def batch_insert_vitals(data_list: List[Dict[str, Any]]) -> None:
+@lru_cache(maxsize=None)
+def parse_insert_template(template_name: str) -> Tuple[str, Tuple[str, ...], Tuple[str, ...]]:
+    """
+    Parse a single-row INSERT template (cached).
+
+    Args:
+        template_name: Name of the SQL template file
+
+    Returns:
+        (table, column names, parameter names in VALUES order)
+    """
+    match = _INSERT_RE.match(load_sql_template(template_name))
+    if not match:
+        raise ValueError(f"Not a single-row INSERT template: {template_name}")
+
+    table = match.group(1)
+    columns = tuple(column.strip() for column in match.group(2).split(","))
+    params = tuple(param.strip().lstrip(":") for param in match.group(3).split(","))
+    if len(columns) != len(params):
+        raise ValueError(f"Column/value count mismatch in template: {template_name}")
+    return table, columns, params
+
+
+def _insert_executemany(conn, data_list: List[Dict[str, Any]], template_name: str):
+    """Run the template through executemany."""
+    conn.execute(text(load_sql_template(template_name)), data_list)
+
+
+def _insert_multirow(conn, data_list: List[Dict[str, Any]], template_name: str, chunk_size: int):
+    """Insert chunk_size records per INSERT ... VALUES (...),(...) statement."""
+    table, columns, params = parse_insert_template(template_name)
+    row_placeholder = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    prefix = f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+
+    for start in range(0, len(data_list), chunk_size):
+        chunk = data_list[start:start + chunk_size]
+        values: List[Any] = []
+        for record in chunk:
+            values.extend(record.get(param) for param in params)
+        conn.exec_driver_sql(prefix + ", ".join([row_placeholder] * len(chunk)), tuple(values))
+
+
+def _infile_value(value: Any) -> str:
+    """Format a value for LOAD DATA (fields enclosed by '"', no escape character)."""
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (int, float, Decimal)):
+        return str(value)
+    if isinstance(value, datetime):
+        value = value.isoformat(sep=" ")
+    elif isinstance(value, date):
+        value = value.isoformat()
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def _get_infile_engine() -> Engine:
+    """Engine whose connections allow LOAD DATA LOCAL INFILE."""
+    global _infile_engine
+    if _infile_engine is None:
+        _infile_engine = create_engine(
+            get_engine().url,
+            poolclass=NullPool,
+            connect_args={"local_infile": True},
+        )
+    return _infile_engine
+
+
+def _insert_load_data(conn, data_list: List[Dict[str, Any]], template_name: str):
+    """Stream the batch through a temporary file and LOAD DATA LOCAL INFILE."""
+    table, columns, params = parse_insert_template(template_name)
+    fd, path = tempfile.mkstemp(prefix="vitals_", suffix=".csv")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            for record in data_list:
+                f.write(",".join(_infile_value(record.get(param)) for param in params))
+                f.write("\n")
+        conn.exec_driver_sql(
+            f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE {table} "
+            "CHARACTER SET utf8mb4 "
+            "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '' "
+            "LINES TERMINATED BY '\\n' "
+            f"({', '.join(columns)})"
+        )
+    finally:
+        os.unlink(path)
+
+
+def batch_insert_vitals(
+    data_list: List[Dict[str, Any]],
+    mode: str = DEFAULT_WRITE_MODE,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    template_name: str = "insert_vital.sql",
+    admission_check: str = ADMISSION_CHECK,
+    verbose: bool = True
+) -> int:
     """
     Insert multiple vital signs records in a single transaction.
-    
+
     Args:
         data_list: List of dictionaries containing vital sign data.
                    Each dict should have keys matching SQL template parameters:
@@ -46,26 +186,67 @@ def batch_insert_vitals(data_list: List[Dict[str, Any]]) -> None:
                    - temperature_c (optional)
                    - respiration (optional)
                    - metadata (optional, JSON)
-    
+        mode: executemany, multirow or load_data (default: WRITER_MODE or multirow)
+        chunk_size: Records per statement in multirow mode (default: WRITER_CHUNK_SIZE or 1000)
+        template_name: Single-row INSERT template to write with
+        admission_check: app to validate admissions against the cached set
+                         (default: ADMISSION_CHECK), trigger to leave it to the
+                         trigger (the cache is still used if the trigger is missing)
+        verbose: Print a line per successful batch
+
+    Returns:
+        Number of records inserted (or spooled)
+
     Raises:
+        ValueError: If mode is unknown
         Exception: If database operation fails (transaction will be rolled back)
     """
     if not data_list:
-        return
-    
-    # Load SQL template
-    sql = load_sql_template("insert_vital.sql")
-    
+        return 0
+    if mode not in WRITE_MODES:
+        raise ValueError(f"Unknown write mode: {mode} (expected one of {WRITE_MODES})")
+
+    # Trace id and ingest time for end-to-end latency tracing (see app.core.tracing)
+    ingest_ts = time.time()
+    for record in data_list:
+        stamp_reading(record, ingest_ts)
+
+    if VITALS_SPOOL_DIR:
+        # The spool's drainer does the insert (and admission / alert checks)
+        get_spool(VITALS_SPOOL_DIR).append(data_list)
+        if verbose:
+            print(f"📥 Spooled {len(data_list)} vital record(s)")
+        return len(data_list)
+
     # Get database engine
-    engine = get_engine()
-    
+    engine = _get_infile_engine() if mode == "load_data" else get_engine()
+
     # Execute in a transaction
+    pending = None
     with engine.begin() as conn:
         try:
-            # Execute batch insert
-            conn.execute(text(sql), data_list)
-            print(f"✅ Successfully inserted {len(data_list)} vital record(s)")
+            if app_admission_check_sync(conn, admission_check):
+                data_list, errors = get_admission_cache().check_sync(conn, data_list)
+                skipped = len(errors) - len(data_list)
+                if skipped:
+                    print(f"⚠️  Skipped {skipped} record(s) for patients without an active admission")
+                if not data_list:
+                    return 0
+            if mode == "multirow":
+                _insert_multirow(conn, data_list, template_name, max(1, chunk_size))
+            elif mode == "load_data":
+                _insert_load_data(conn, data_list, template_name)
+            else:
+                _insert_executemany(conn, data_list, template_name)
+            if app_alerts_sync(conn):
+                pending = get_rules_engine().apply_sync(conn, data_list)
         except Exception as e:
             print(f"❌ Error inserting vital records: {e}")
             raise  # Re-raise to trigger rollback
 
+    # Only now are the batch's alerts in the table
+    if pending is not None:
+        pending.commit()
+    if verbose:
+        print(f"✅ Successfully inserted {len(data_list)} vital record(s)")
+    return len(data_list)
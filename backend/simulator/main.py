@@ -1,6 +1,7 @@
 """
 Simulator main script - integrates with BE2's generator to insert vital signs data
 """
+import os
 import sys
 import time
 import argparse
@@ -12,6 +13,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from simulator.db_writer import batch_insert_vitals
+from simulator.scale import run_scale
 
 # Import BE2's generator (will be created by BE2)
 try:
@@ -94,8 +96,29 @@ def main():
         default=0,
         help="Duration in seconds (0 = run indefinitely). Default: 0"
     )
+    parser.add_argument(
+        "--scale",
+        action="store_true",
+        help="Scale mode: NumPy state, sharded across worker processes (see simulator/scale.py)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Worker processes in scale mode. Default: CPU count"
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Random seed in scale mode. Default: 0"
+    )
     
     args = parser.parse_args()
+
+    if args.scale:
+        run_scale(args.patients, args.start_id, args.rate, args.duration, args.workers, args.seed)
+        return
     
     num_patients = args.patients
     start_patient_id = args.start_id
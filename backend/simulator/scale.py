@@ -0,0 +1,297 @@
+"""
+Scale mode for the simulator - hospital-sized load from one machine
+
+Patients are split into shards, one worker process per shard. Each shard
+keeps its patients' vitals in NumPy arrays and advances them with one
+vectorized random walk (same steps and clamps as the single-process
+simulator), then writes through its own database connection.
+
+Rate control: every shard owns a share of the target rate proportional to
+its patients. On each tick (TICK_HZ per second, on an absolute schedule) it
+emits however many rows are due by now minus those already emitted, so rows
+lost to a slow write are caught up on the next tick instead of the rate
+drifting. Catch-up is capped at MAX_CATCHUP_TICKS ticks worth of rows; the
+rest is counted as a shortfall, as are the rows of a batch the database
+refused (the shard logs the error and keeps going). Patients are visited
+round-robin, so each gets a reading every patients / rate seconds.
+"Inserted" counts what batch_insert_vitals reports, i.e. without readings
+skipped for patients that have no active admission.
+
+All simulated patients must be admitted (see admit_patients.py).
+
+Usage:
+    python simulator/main.py --scale --patients 10000 --rate 10000 --workers 8
+"""
+import os
+import time
+import queue
+import multiprocessing as mp
+from datetime import datetime
+from typing import List, Dict, Any, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TICK_HZ = float(os.getenv("SIM_TICK_HZ", "20"))
+MAX_CATCHUP_TICKS = int(os.getenv("SIM_MAX_CATCHUP_TICKS", "10"))
+REPORT_INTERVAL = 1.0
+
+# Column: (initial value, max step, min, max); temperature steps are uniform floats
+WALKS = {
+    "heart_rate": (80, 2, 60, 120),
+    "spo2": (98, 1, 95, 100),
+    "bp_systolic": (120, 3, 100, 140),
+    "bp_diastolic": (80, 2, 60, 90),
+    "temperature_c": (37.0, 0.1, 36.0, 38.5),
+    "respiration": (16, 1, 12, 20),
+}
+
+
+class ShardState:
+    """Vitals of one shard's patients as NumPy arrays."""
+
+    def __init__(self, patient_ids: List[int], seed: int):
+        """
+        Initialize every patient at the resting values.
+
+        Args:
+            patient_ids: Patients of this shard
+            seed: Random seed
+        """
+        self.patient_ids = np.asarray(patient_ids, dtype=np.int64)
+        self.rng = np.random.default_rng(seed)
+        self.values = {
+            name: np.full(len(patient_ids), initial, dtype=np.float64 if name == "temperature_c" else np.int64)
+            for name, (initial, _, _, _) in WALKS.items()
+        }
+        self.cursor = 0
+
+    def advance(self, count: int) -> Dict[str, Any]:
+        """
+        Step the next count patients (round-robin) and return their readings.
+
+        Args:
+            count: Number of readings to produce
+
+        Returns:
+            Column arrays: patient_id plus one array per vital
+        """
+        n = len(self.patient_ids)
+        index = (self.cursor + np.arange(count)) % n
+        self.cursor = (self.cursor + count) % n
+
+        # A patient appears at most once per chunk, so each chunk is one vectorized step
+        chunks = []
+        for offset in range(0, count, n):
+            part = index[offset:offset + n]
+            chunk = {"patient_id": self.patient_ids[part]}
+            for name, (_, step, low, high) in WALKS.items():
+                current = self.values[name]
+                if name == "temperature_c":
+                    delta = self.rng.uniform(-step, step, size=len(part))
+                else:
+                    delta = self.rng.integers(-step, step, size=len(part), endpoint=True)
+                current[part] = np.clip(current[part] + delta, low, high)
+                chunk[name] = current[part]
+            chunks.append(chunk)
+
+        columns = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+        columns["temperature_c"] = np.round(columns["temperature_c"], 2)
+        return columns
+
+
+def to_rows(columns: Dict[str, Any], ts: datetime) -> List[Dict[str, Any]]:
+    """
+    Convert column arrays to db_writer records.
+
+    Args:
+        columns: Output of ShardState.advance
+        ts: Timestamp for the tick
+
+    Returns:
+        List of vital records
+    """
+    names = list(WALKS)
+    lists = [columns["patient_id"].tolist()] + [columns[name].tolist() for name in names]
+    return [
+        {
+            "patient_id": values[0],
+            "device_id": None,
+            "ts": ts,
+            **dict(zip(names, values[1:])),
+            "metadata": None,
+        }
+        for values in zip(*lists)
+    ]
+
+
+def shard_worker(
+    shard: int,
+    patient_ids: List[int],
+    rate: float,
+    duration: float,
+    seed: int,
+    stop_event,
+    reports
+):
+    """
+    Generate and write one shard's rows at its share of the target rate.
+
+    Args:
+        shard: Shard number
+        patient_ids: Patients of this shard
+        rate: Rows per second for this shard
+        duration: Seconds to run (0 = until stop_event)
+        seed: Base random seed
+        stop_event: multiprocessing.Event set by the parent to stop
+        reports: multiprocessing.Queue receiving
+                 (shard, inserted, shortfall, write_seconds, failed_batches)
+    """
+    # Imported here so each process opens its own engine and connection
+    from simulator.db_writer import batch_insert_vitals
+
+    state = ShardState(patient_ids, seed + shard)
+    tick = 1.0 / TICK_HZ
+    max_rows = max(1, int(rate * tick * MAX_CATCHUP_TICKS))
+    start = time.monotonic()
+    emitted = inserted = shortfall = failed_batches = 0
+    write_seconds = 0.0
+    failing = False
+    next_tick = start
+    next_report = start + REPORT_INTERVAL
+
+    try:
+        while not stop_event.is_set():
+            now = time.monotonic()
+            finished = bool(duration) and now - start >= duration
+            if finished:
+                # Emit what is due up to the end of the run, then stop
+                now = start + duration
+
+            due = int(rate * (now - start)) - emitted - shortfall
+            if due > max_rows:
+                shortfall += due - max_rows
+                due = max_rows
+            if due > 0:
+                rows = to_rows(state.advance(due), datetime.now())
+                write_start = time.perf_counter()
+                try:
+                    inserted += batch_insert_vitals(rows, verbose=False)
+                    emitted += due
+                    if failing:
+                        print(f"✅ Shard {shard}: writes recovered ({failed_batches} batch(es) failed so far)")
+                        failing = False
+                except Exception as e:
+                    shortfall += due
+                    failed_batches += 1
+                    if not failing:
+                        print(f"❌ Shard {shard}: batch of {due} rows failed, counting as shortfall: {e}")
+                        failing = True
+                write_seconds += time.perf_counter() - write_start
+            if finished:
+                break
+
+            if now >= next_report:
+                reports.put((shard, inserted, shortfall, write_seconds, failed_batches))
+                next_report += REPORT_INTERVAL
+
+            # Absolute schedule: skip missed ticks instead of sleeping less each time
+            next_tick += tick
+            remaining = next_tick - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+            else:
+                next_tick = time.monotonic()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reports.put((shard, inserted, shortfall, write_seconds, failed_batches))
+
+
+def split_shards(patient_ids: List[int], workers: int) -> List[List[int]]:
+    """Split patients into contiguous, nearly equal shards."""
+    workers = max(1, min(workers, len(patient_ids)))
+    size, extra = divmod(len(patient_ids), workers)
+    shards, offset = [], 0
+    for i in range(workers):
+        count = size + (1 if i < extra else 0)
+        shards.append(patient_ids[offset:offset + count])
+        offset += count
+    return shards
+
+
+def run_scale(patients: int, start_id: int, rate: float, duration: float, workers: int, seed: int = 0):
+    """
+    Run the sharded simulator and print aggregate throughput.
+
+    Args:
+        patients: Number of patients
+        start_id: First patient ID
+        rate: Total rows per second
+        duration: Seconds to run (0 = until Ctrl+C)
+        workers: Worker processes
+        seed: Base random seed
+    """
+    if np is None:
+        raise RuntimeError("Scale mode requires numpy (pip install numpy)")
+
+    shards = split_shards(list(range(start_id, start_id + patients)), workers)
+    ctx = mp.get_context("spawn")
+    stop_event = ctx.Event()
+    reports = ctx.Queue()
+    totals: Dict[int, Tuple[int, int, float, int]] = {}
+
+    print(f"🚀 Starting scale simulator: {patients} patients, {rate:.0f} rows/sec, {len(shards)} worker(s)")
+    processes = [
+        ctx.Process(
+            target=shard_worker,
+            args=(i, shard, rate * len(shard) / patients, duration, seed, stop_event, reports),
+            daemon=True
+        )
+        for i, shard in enumerate(shards)
+    ]
+    start_time = time.time()
+    for process in processes:
+        process.start()
+
+    try:
+        while any(process.is_alive() for process in processes):
+            try:
+                shard, *report = reports.get(timeout=REPORT_INTERVAL)
+                totals[shard] = tuple(report)
+            except queue.Empty:
+                continue
+            if shard == 0:
+                elapsed = time.time() - start_time
+                written_total = sum(t[0] for t in totals.values())
+                shortfall_total = sum(t[1] for t in totals.values())
+                print(
+                    f"📊 Progress: {written_total} records inserted | "
+                    f"Rate: {written_total / elapsed:.0f} inserts/sec (target: {rate:.0f}) | "
+                    f"Shortfall: {shortfall_total} | Failed batches: {sum(t[3] for t in totals.values())}"
+                )
+    except KeyboardInterrupt:
+        stop_event.set()
+
+    for process in processes:
+        process.join()
+    while True:
+        try:
+            shard, *report = reports.get_nowait()
+            totals[shard] = tuple(report)
+        except queue.Empty:
+            break
+
+    elapsed = time.time() - start_time
+    written_total = sum(t[0] for t in totals.values())
+    shortfall_total = sum(t[1] for t in totals.values())
+    busy = max((t[2] for t in totals.values()), default=0.0)
+    print(f"\n🛑 Scale simulator stopped")
+    print(f"📊 Total: {written_total} records inserted in {elapsed:.2f} seconds")
+    print(f"📊 Average rate: {written_total / elapsed:.0f} inserts/sec (target: {rate:.0f})")
+    print(f"📊 Shortfall: {shortfall_total} rows | Busiest shard spent {busy:.1f}s writing")
+    failed_total = sum(t[3] for t in totals.values())
+    if failed_total:
+        print(f"⚠️  {failed_total} batch(es) failed (counted in the shortfall)")
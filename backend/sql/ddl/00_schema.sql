@@ -31,6 +31,18 @@ CREATE TABLE IF NOT EXISTS simulation_config (
     PRIMARY KEY (config_key)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- ----------------------------------------------------------------------------
+-- Ingest Spool Checkpoints
+-- ----------------------------------------------------------------------------
+-- Last sequence number replayed from each on-disk vitals spool. Updated in
+-- the same transaction as the replayed rows so replay is exactly-once.
+CREATE TABLE IF NOT EXISTS ingest_spool_checkpoints (
+    spool_id VARCHAR(64) NOT NULL,
+    last_seq BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    PRIMARY KEY (spool_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 -- ============================================================================
 -- Core Tables
 -- ============================================================================
@@ -0,0 +1,18 @@
+-- ============================================================================
+-- Migration: Add ingest_spool_checkpoints table
+-- ============================================================================
+-- Description: Stores the last sequence number replayed from each on-disk
+--              vitals spool (VITALS_SPOOL_DIR / INGEST_SPOOL_DIR), written in
+--              the same transaction as the replayed rows.
+-- 
+-- Run this file to enable spooled ingestion on existing databases.
+-- ============================================================================
+
+USE `mymedql`;
+
+CREATE TABLE IF NOT EXISTS ingest_spool_checkpoints (
+    spool_id VARCHAR(64) NOT NULL,
+    last_seq BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    PRIMARY KEY (spool_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,13 @@
+"""
+pytest configuration for the backend unit tests
+
+load_test.py and ws_load_test.py are command-line load generators against a
+running API (their test_* helpers are not pytest tests), so they are not
+collected.
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+collect_ignore = ["load_test.py", "ws_load_test.py"]
@@ -1,10 +1,28 @@
 """
 Load testing script for API endpoints
+
+Two modes:
+- Closed loop (default): --requests requests to one endpoint with at most
+  --concurrency in flight. Each request waits for a free slot, so the time
+  spent queueing behind slow requests never shows up in the latencies.
+- Open loop (--rate): requests arrive at a fixed rate (or Poisson with
+  --arrival poisson) whatever the server does, drawn from a weighted
+  scenario mix over the authenticated routes. Latency is measured from each
+  request's scheduled arrival time, so queueing delay is included
+  (no coordinated omission), and recorded in HDR-style histograms.
+
+Open-loop results can be written as JSON (--output) and compared with an
+earlier run (--compare).
+
+Usage:
+    python tests/load_test.py --rate 200 --duration 60 --mix patients=30,history=30,summary=20,alerts=15,login=5 --output run.json
 """
 import asyncio
+import json
+import random
 import time
 import statistics
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import httpx
 
 
@@ -144,6 +162,353 @@ def print_results(results: Dict[str, Any]):
     print("="*60)
 
 
+class LatencyHistogram:
+    """
+    Log-linear latency histogram in the style of HdrHistogram.
+
+    Values are recorded in microseconds into buckets whose width grows with
+    the value, keeping SIGNIFICANT_DIGITS significant digits (relative error
+    under 1%) at any magnitude with a small, fixed amount of memory.
+    """
+
+    SIGNIFICANT_DIGITS = 2
+    # Smallest power of two holding 2 * 10^digits distinct values
+    SUB_BUCKET_BITS = (2 * 10 ** SIGNIFICANT_DIGITS - 1).bit_length()
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.total = 0
+        self.min_us: Optional[int] = None
+        self.max_us = 0
+        self.sum_us = 0
+
+    @classmethod
+    def _bucket(cls, value: int) -> Tuple[int, int]:
+        """Lowest value and width of the bucket holding a value."""
+        shift = max(0, value.bit_length() - cls.SUB_BUCKET_BITS)
+        return (value >> shift) << shift, 1 << shift
+
+    def record(self, seconds: float):
+        """Record one latency."""
+        value = max(0, int(seconds * 1_000_000))
+        lowest, _ = self._bucket(value)
+        self.counts[lowest] = self.counts.get(lowest, 0) + 1
+        self.total += 1
+        self.sum_us += value
+        self.max_us = max(self.max_us, value)
+        self.min_us = value if self.min_us is None else min(self.min_us, value)
+
+    def merge(self, other: "LatencyHistogram"):
+        """Add another histogram's counts to this one."""
+        for lowest, count in other.counts.items():
+            self.counts[lowest] = self.counts.get(lowest, 0) + count
+        self.total += other.total
+        self.sum_us += other.sum_us
+        self.max_us = max(self.max_us, other.max_us)
+        if other.min_us is not None:
+            self.min_us = other.min_us if self.min_us is None else min(self.min_us, other.min_us)
+
+    def percentile(self, percent: float) -> int:
+        """
+        Get a percentile in microseconds.
+
+        Returns:
+            Highest value equivalent to the bucket holding the percentile
+        """
+        if not self.total:
+            return 0
+        rank = max(1, int(round(percent / 100 * self.total)))
+        seen = 0
+        for lowest in sorted(self.counts):
+            seen += self.counts[lowest]
+            if seen >= rank:
+                _, width = self._bucket(lowest)
+                return min(lowest + width - 1, self.max_us)
+        return self.max_us
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Summarize the histogram for JSON output.
+
+        Returns:
+            Percentiles in milliseconds plus the raw bucket counts
+        """
+        return {
+            "count": self.total,
+            "min_ms": (self.min_us or 0) / 1000,
+            "mean_ms": self.sum_us / self.total / 1000 if self.total else 0,
+            "max_ms": self.max_us / 1000,
+            "percentiles_ms": {
+                f"p{percent:g}": self.percentile(percent) / 1000
+                for percent in (50, 75, 90, 95, 99, 99.9, 99.99)
+            },
+            # Bucket lowest value (microseconds) -> count; merge runs by adding counts
+            "buckets_us": {str(lowest): self.counts[lowest] for lowest in sorted(self.counts)},
+        }
+
+
+# Scenario name -> (method, path); {patient_id} is filled from the patients the token can see
+SCENARIOS = {
+    "patients": ("GET", "/api/patients/"),
+    "history": ("GET", "/api/patients/{patient_id}/history"),
+    "summary": ("GET", "/api/patients/{patient_id}/summary"),
+    "alerts": ("GET", "/api/alerts/unacknowledged"),
+    "login": ("POST", "/api/token"),
+}
+
+DEFAULT_MIX = "patients=30,history=30,summary=20,alerts=15,login=5"
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """
+    Parse a scenario mix like "patients=30,history=70".
+
+    Args:
+        mix: Comma-separated name=weight pairs
+
+    Returns:
+        Scenario name -> weight
+    """
+    weights: Dict[str, float] = {}
+    for part in mix.split(","):
+        name, _, weight = part.strip().partition("=")
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario: {name} (expected one of {list(SCENARIOS)})")
+        weights[name] = float(weight or 1)
+    if not any(weights.values()):
+        raise ValueError("Scenario mix has no positive weight")
+    return weights
+
+
+class ScenarioStats:
+    """Results of one scenario in an open-loop run."""
+
+    def __init__(self):
+        self.latency = LatencyHistogram()  # From the scheduled arrival time
+        self.service = LatencyHistogram()  # From when the request was actually sent
+        self.status_codes: Dict[str, int] = {}
+        self.errors = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        ok = sum(count for code, count in self.status_codes.items() if code.startswith("2"))
+        return {
+            "requests": self.latency.total,
+            "successful": ok,
+            "failed": self.latency.total - ok,
+            "errors": self.errors,
+            "status_codes": dict(sorted(self.status_codes.items())),
+            "latency": self.latency.to_dict(),
+            "service_time": self.service.to_dict(),
+        }
+
+
+async def acquire_token(client: httpx.AsyncClient, email: str, password: str) -> str:
+    """
+    Log in through the OAuth2 password flow.
+
+    Args:
+        client: HTTP client (with base_url set)
+        email: Staff email
+        password: Staff password
+
+    Returns:
+        Bearer access token
+    """
+    response = await client.post("/api/token", data={"username": email, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def run_open_loop(
+    base_url: str,
+    rate: float,
+    duration: float,
+    mix: Dict[str, float],
+    credentials: List[Tuple[str, str]],
+    patient_ids: Optional[List[int]] = None,
+    arrival: str = "constant",
+    max_in_flight: int = 1000,
+    history_limit: int = 100,
+    seed: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Run an open-loop load test over a weighted scenario mix.
+
+    Args:
+        base_url: Base API URL (e.g., "http://localhost:3001")
+        rate: Arrivals per second
+        duration: Seconds of arrivals
+        mix: Scenario name -> weight
+        credentials: (email, password) pairs; tokens are acquired before the run
+        patient_ids: Patients for the per-patient routes (default: those the first token can see)
+        arrival: "constant" (fixed interval) or "poisson" (exponential gaps)
+        max_in_flight: Arrivals beyond this many outstanding requests are dropped and counted
+        history_limit: limit parameter of the history scenario
+        seed: Random seed for the mix and Poisson arrivals
+
+    Returns:
+        Dictionary with the configuration and per-scenario results
+    """
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    stats = {name: ScenarioStats() for name in names}
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+
+    print(f"🚀 Starting open-loop load test...")
+    print(f"   URL: {base_url}")
+    print(f"   Rate: {rate:.0f} req/s ({arrival}) for {duration:.0f}s")
+    print(f"   Mix: {', '.join(f'{name}={mix[name]:g}' for name in names)}")
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=30.0, limits=limits) as client:
+        tokens = [await acquire_token(client, email, password) for email, password in credentials]
+        print(f"🔑 Acquired {len(tokens)} token(s)")
+        if not patient_ids and any(name in mix for name in ("history", "summary")):
+            response = await client.get("/api/patients/", headers={"Authorization": f"Bearer {tokens[0]}"})
+            response.raise_for_status()
+            patient_ids = [patient["patient_id"] for patient in response.json()]
+            if not patient_ids:
+                raise RuntimeError("The first user has no patients; pass --patient-ids")
+
+        in_flight = 0
+        dropped = 0
+        max_lag = 0.0
+        tasks = set()
+
+        async def issue(name: str, scheduled: float, request_number: int):
+            nonlocal in_flight
+            method, path = SCENARIOS[name]
+            result = stats[name]
+            sent = time.perf_counter()
+            try:
+                if name == "login":
+                    email, password = credentials[request_number % len(credentials)]
+                    response = await client.post(path, data={"username": email, "password": password})
+                else:
+                    token = tokens[request_number % len(tokens)]
+                    params = {"limit": history_limit} if name == "history" else None
+                    response = await client.request(
+                        method,
+                        path.format(patient_id=rng.choice(patient_ids or [0])),
+                        params=params,
+                        headers={"Authorization": f"Bearer {token}"}
+                    )
+                code = str(response.status_code)
+            except Exception:
+                code = "error"
+                result.errors += 1
+            done = time.perf_counter()
+            result.latency.record(done - scheduled)
+            result.service.record(done - sent)
+            result.status_codes[code] = result.status_codes.get(code, 0) + 1
+            in_flight -= 1
+
+        start = time.perf_counter()
+        next_arrival = start
+        arrivals = 0
+        while next_arrival - start < duration:
+            now = time.perf_counter()
+            if next_arrival > now:
+                await asyncio.sleep(next_arrival - now)
+            max_lag = max(max_lag, time.perf_counter() - next_arrival)
+
+            if in_flight >= max_in_flight:
+                dropped += 1
+            else:
+                in_flight += 1
+                name = rng.choices(names, weights)[0]
+                task = asyncio.create_task(issue(name, next_arrival, arrivals))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            arrivals += 1
+
+            # Arrivals follow the schedule, not the responses
+            gap = rng.expovariate(rate) if arrival == "poisson" else 1.0 / rate
+            next_arrival += gap
+
+        if tasks:
+            await asyncio.gather(*tasks)
+        total_time = time.perf_counter() - start
+
+    overall = LatencyHistogram()
+    for result in stats.values():
+        overall.merge(result.latency)
+    completed = overall.total
+
+    return {
+        "mode": "open_loop",
+        "config": {
+            "url": base_url,
+            "rate": rate,
+            "duration": duration,
+            "arrival": arrival,
+            "mix": mix,
+            "users": len(credentials),
+            "patients": len(patient_ids or []),
+            "max_in_flight": max_in_flight,
+            "seed": seed,
+        },
+        "arrivals": arrivals,
+        "completed": completed,
+        "dropped": dropped,
+        "total_time": total_time,
+        "achieved_rate": completed / total_time if total_time > 0 else 0,
+        "max_schedule_lag_ms": max_lag * 1000,
+        "latency": overall.to_dict(),
+        "scenarios": {name: stats[name].to_dict() for name in names},
+    }
+
+
+def print_open_loop_results(results: Dict[str, Any]):
+    """Print open-loop results in a readable format."""
+    print("\n" + "="*60)
+    print("OPEN-LOOP LOAD TEST RESULTS")
+    print("="*60)
+    config = results["config"]
+    print(f"URL: {config['url']}")
+    print(f"Target Rate: {config['rate']:.0f} req/s ({config['arrival']}) | Achieved: {results['achieved_rate']:.1f} req/s")
+    print(f"Arrivals: {results['arrivals']} | Completed: {results['completed']} | Dropped: {results['dropped']}")
+    print(f"Max Schedule Lag: {results['max_schedule_lag_ms']:.1f} ms")
+    print("\nLatency from scheduled arrival (ms):")
+    print(f"  {'scenario':<10} {'count':>7} {'fail':>5} {'p50':>9} {'p90':>9} {'p99':>9} {'p99.9':>9} {'max':>9}")
+    rows = list(results["scenarios"].items()) + [("all", {"latency": results["latency"], "failed": sum(
+        s["failed"] for s in results["scenarios"].values())})]
+    for name, scenario in rows:
+        latency = scenario["latency"]
+        p = latency["percentiles_ms"]
+        print(
+            f"  {name:<10} {latency['count']:>7} {scenario['failed']:>5} {p['p50']:>9.2f} {p['p90']:>9.2f} "
+            f"{p['p99']:>9.2f} {p['p99.9']:>9.2f} {latency['max_ms']:>9.2f}"
+        )
+    print("="*60)
+
+
+def print_comparison(baseline: Dict[str, Any], results: Dict[str, Any]):
+    """Print percentile changes of each scenario against an earlier open-loop run."""
+    print("\nChange vs baseline (ms):")
+    print(f"  {'scenario':<10} {'p50':>18} {'p99':>18} {'p99.9':>18}")
+    current = dict(results["scenarios"], all={"latency": results["latency"]})
+    previous = dict(baseline.get("scenarios", {}), all={"latency": baseline.get("latency", {})})
+    for name, scenario in current.items():
+        if name not in previous:
+            continue
+        cells = []
+        for key in ("p50", "p99", "p99.9"):
+            new = scenario["latency"]["percentiles_ms"][key]
+            old = previous[name]["latency"].get("percentiles_ms", {}).get(key, 0)
+            cells.append(f"{old:.1f}->{new:.1f} ({new - old:+.1f})")
+        print(f"  {name:<10} {cells[0]:>18} {cells[1]:>18} {cells[2]:>18}")
+
+
+def parse_patient_ids(value: str) -> List[int]:
+    """Parse patient IDs like "1-50" or "1,4,7"."""
+    ids: List[int] = []
+    for part in value.split(","):
+        first, _, last = part.partition("-")
+        ids.extend(range(int(first), int(last or first) + 1))
+    return ids
+
+
 async def main():
     """Main load test function."""
     import argparse
@@ -173,8 +538,91 @@ async def main():
         default=10,
         help="Number of concurrent requests"
     )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=None,
+        help="Open loop: arrivals per second over the scenario mix (ignores --endpoint/--requests)"
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=30,
+        help="Open loop: seconds of arrivals"
+    )
+    parser.add_argument(
+        "--arrival",
+        choices=["constant", "poisson"],
+        default="constant",
+        help="Open loop: fixed intervals or Poisson arrivals"
+    )
+    parser.add_argument(
+        "--mix",
+        type=str,
+        default=DEFAULT_MIX,
+        help=f"Open loop: weighted scenarios from {list(SCENARIOS)}"
+    )
+    parser.add_argument(
+        "--user",
+        action="append",
+        default=None,
+        help="Open loop: staff credentials as email:password (repeatable; default admin@example.com:password123)"
+    )
+    parser.add_argument(
+        "--patient-ids",
+        type=str,
+        default=None,
+        help="Open loop: patients for history/summary, e.g. 1-50 (default: the first user's patients)"
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=1000,
+        help="Open loop: outstanding requests before arrivals are dropped"
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Open loop: random seed"
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="Open loop: write results as JSON"
+    )
+    parser.add_argument(
+        "--compare",
+        type=str,
+        default=None,
+        help="Open loop: JSON results of an earlier run to compare against"
+    )
     
     args = parser.parse_args()
+
+    if args.rate:
+        credentials = [tuple(user.split(":", 1)) for user in (args.user or ["admin@example.com:password123"])]
+        results = await run_open_loop(
+            base_url=args.url,
+            rate=args.rate,
+            duration=args.duration,
+            mix=parse_mix(args.mix),
+            credentials=credentials,
+            patient_ids=parse_patient_ids(args.patient_ids) if args.patient_ids else None,
+            arrival=args.arrival,
+            max_in_flight=args.max_in_flight,
+            seed=args.seed
+        )
+        print_open_loop_results(results)
+        if args.compare:
+            with open(args.compare) as f:
+                print_comparison(json.load(f), results)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            print(f"💾 Results written to {args.output}")
+        return
     
     results = await run_load_test(
         base_url=args.url,
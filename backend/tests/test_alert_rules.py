@@ -0,0 +1,272 @@
+"""
+Unit tests for the application-side alert rules (app/db/alert_rules.py)
+"""
+import time
+
+import pytest
+from app.db.alert_rules import (
+    AlertRulesEngine,
+    AlertStateIndex,
+    RecentAlertSet,
+    ThresholdCache,
+    evaluate_batch,
+)
+
+WINDOW = 600.0
+T0 = 1_000_000.0
+
+THRESHOLDS = [
+    ("heart_rate", "critical", 40, 150, None),
+    ("heart_rate", "warning", 50, 120, None),
+    ("spo2", "critical", 85, None, None),
+    ("spo2", "warning", 92, None, None),
+    ("temperature_c", "warning", 35.0, 38.0, None),
+    ("heart_rate", "warning", 50, 100, 7),  # Patient 7 override
+]
+
+
+@pytest.fixture
+def cache():
+    cache = ThresholdCache()
+    cache.load(THRESHOLDS, version=(len(THRESHOLDS), 1))
+    return cache
+
+
+def make_index(rearm_readings=3, hysteresis_pct=5.0):
+    return AlertStateIndex(window_seconds=WINDOW, hysteresis_pct=hysteresis_pct, rearm_readings=rearm_readings)
+
+
+def evaluate(rows, cache, index, now):
+    """Evaluate a batch the way the engine does and commit it."""
+    pending = index.begin()
+    alerts, suppressed = evaluate_batch(rows, cache, pending, now)
+    pending.commit()
+    return alerts, suppressed
+
+
+def reading(patient_id=1, **values):
+    return {"patient_id": patient_id, **values}
+
+
+# --- evaluate_batch -------------------------------------------------------
+
+def test_critical_takes_precedence_over_warning(cache):
+    alerts, _ = evaluate_batch([reading(heart_rate=160)], cache, RecentAlertSet(set()), T0)
+    assert [(a["alert_type"], a["threshold"]) for a in alerts] == [("critical", "heart_rate")]
+    assert alerts[0]["message"] == "Critical threshold breach for heart_rate: value=160, min=40, max=150"
+
+
+def test_warning_inside_critical_range(cache):
+    alerts, _ = evaluate_batch([reading(heart_rate=130)], cache, RecentAlertSet(set()), T0)
+    assert [(a["alert_type"], a["threshold"]) for a in alerts] == [("warning", "heart_rate")]
+
+
+def test_patient_override_replaces_global_threshold(cache):
+    rows = [reading(1, heart_rate=110), reading(7, heart_rate=110)]
+    alerts, _ = evaluate_batch(rows, cache, RecentAlertSet(set()), T0)
+    assert [a["patient_id"] for a in alerts] == [7]
+
+
+def test_null_values_are_not_checked(cache):
+    alerts, _ = evaluate_batch([reading(heart_rate=None, spo2=None)], cache, RecentAlertSet(set()), T0)
+    assert alerts == []
+
+
+def test_value_is_checked_as_stored(cache):
+    # temperature_c is DECIMAL(4,2): 38.004 is stored as 38.00, inside the range
+    alerts, _ = evaluate_batch([reading(temperature_c=38.004)], cache, RecentAlertSet(set()), T0)
+    assert alerts == []
+    alerts, _ = evaluate_batch([reading(temperature_c=38.006)], cache, RecentAlertSet(set()), T0)
+    assert alerts[0]["message"] == "Warning threshold breach for temperature_c: value=38.01"
+
+
+def test_alerts_in_row_then_column_order_and_deduped_within_batch(cache):
+    rows = [reading(1, heart_rate=160, spo2=80), reading(1, heart_rate=170), reading(2, spo2=90)]
+    alerts, suppressed = evaluate_batch(rows, cache, RecentAlertSet(set()), T0)
+    assert [(a["patient_id"], a["threshold"], a["alert_type"]) for a in alerts] == [
+        (1, "heart_rate", "critical"),
+        (1, "spo2", "critical"),
+        (2, "spo2", "warning"),
+    ]
+    assert suppressed == 1
+
+
+def test_recent_alert_set_suppresses_open_keys(cache):
+    dedupe = RecentAlertSet({(1, "critical", "heart_rate")})
+    alerts, suppressed = evaluate_batch([reading(heart_rate=160)], cache, dedupe, T0)
+    assert alerts == [] and suppressed == 1
+
+
+# --- ThresholdCache -------------------------------------------------------
+
+def test_threshold_cache_reloads_when_version_changes(cache):
+    assert not cache.is_stale((len(THRESHOLDS), 1))
+    assert cache.is_stale((len(THRESHOLDS), 2))
+    cache.invalidate()
+    assert cache.is_stale()
+
+
+# --- AlertStateIndex ------------------------------------------------------
+
+def test_open_alert_suppresses_until_window_ends(cache):
+    index = make_index()
+    assert len(evaluate([reading(spo2=80)], cache, index, T0)[0]) == 1
+    assert evaluate([reading(spo2=80)], cache, index, T0 + 60)[0] == []
+    assert len(evaluate([reading(spo2=80)], cache, index, T0 + WINDOW + 1)[0]) == 1
+
+
+def test_persistent_breach_alerts_again_after_acknowledgement(cache):
+    index = make_index()
+    evaluate([reading(spo2=80)], cache, index, T0)
+    index.acknowledge((1, "critical", "spo2"), now=T0 + 30)
+
+    raised = 0
+    for minute in range(1, 600):
+        raised += len(evaluate([reading(spo2=80)], cache, index, T0 + 30 + minute * 60)[0])
+    # Disarmed for one window after the acknowledgement, then one alert per window
+    assert raised == 59
+
+
+def test_disarm_lapses_after_window(cache):
+    index = make_index()
+    evaluate([reading(spo2=80)], cache, index, T0)
+    index.acknowledge((1, "critical", "spo2"), now=T0 + 30)
+    assert evaluate([reading(spo2=80)], cache, index, T0 + 31)[0] == []
+    assert evaluate([reading(spo2=80)], cache, index, T0 + 30 + WINDOW - 1)[0] == []
+    assert len(evaluate([reading(spo2=80)], cache, index, T0 + 30 + WINDOW)[0]) == 1
+
+
+def test_oscillation_is_damped_until_recovered_readings_rearm():
+    cache = ThresholdCache()
+    cache.load([("spo2", "critical", 85, None, None)])
+    index = make_index(rearm_readings=3)
+    evaluate([reading(spo2=80)], cache, index, T0)
+    index.acknowledge((1, "critical", "spo2"), now=T0 + 10)
+
+    # Back just above the limit (inside the hysteresis band), then down again
+    alerts, suppressed = evaluate([reading(spo2=86), reading(spo2=84)], cache, index, T0 + 20)
+    assert alerts == [] and suppressed == 1
+
+    # Three readings clear of the band re-arm the key
+    evaluate([reading(spo2=95), reading(spo2=95), reading(spo2=95)], cache, index, T0 + 30)
+    assert len(evaluate([reading(spo2=80)], cache, index, T0 + 40)[0]) == 1
+
+
+def test_rearm_readings_zero_behaves_like_trigger(cache):
+    index = make_index(rearm_readings=0)
+    evaluate([reading(spo2=80)], cache, index, T0)
+    index.acknowledge((1, "critical", "spo2"), now=T0 + 10)
+    assert len(evaluate([reading(spo2=80)], cache, index, T0 + 11)[0]) == 1
+
+
+def test_uncommitted_batch_leaves_index_unchanged(cache):
+    index = make_index()
+    pending = index.begin()
+    alerts, _ = evaluate_batch([reading(heart_rate=160)], cache, pending, T0)
+    assert len(alerts) == 1
+    # The insert failed: pending is dropped, so the next attempt alerts again
+    assert index.states == {}
+    assert len(evaluate([reading(heart_rate=160)], cache, index, T0 + 1)[0]) == 1
+
+
+def test_savepoints_commit_into_enclosing_transaction(cache):
+    index = make_index()
+    transaction = index.begin()
+
+    failed = transaction.begin()
+    evaluate_batch([reading(1, heart_rate=160)], cache, failed, T0)  # Savepoint rolled back
+
+    released = transaction.begin()
+    alerts, _ = evaluate_batch([reading(2, heart_rate=160)], cache, released, T0)
+    assert len(alerts) == 1
+    released.commit()
+
+    # Later rows of the same transaction see the released savepoint's alert
+    assert evaluate_batch([reading(2, heart_rate=160)], cache, transaction.begin(), T0)[0] == []
+    assert index.states == {}
+
+    transaction.commit()
+    assert set(index.states) == {(2, "critical", "heart_rate")}
+
+
+def test_resync_does_not_disarm_alerts_that_were_never_written(cache):
+    index = make_index()
+    evaluate([reading(heart_rate=160)], cache, index, T0)
+    # The alerts table has no row for the key (the insert was lost)
+    index.resync([], T0 + 5)
+    assert index.get_stats(T0 + 5)["disarmed"] == 0
+    assert len(evaluate([reading(heart_rate=160)], cache, index, T0 + 6)[0]) == 1
+
+
+def test_resync_disarms_alerts_acknowledged_elsewhere(cache):
+    index = make_index()
+    evaluate([reading(heart_rate=160)], cache, index, T0)
+    index.resync([(1, "critical", "heart_rate", None, 1)], T0 + 5)
+    assert index.get_stats(T0 + 5)["disarmed"] == 1
+    assert evaluate([reading(heart_rate=160)], cache, index, T0 + 6)[0] == []
+
+
+def test_resync_loads_open_alerts(cache):
+    index = make_index()
+    index.resync([(3, "warning", "spo2", 60_000_000, 0)], T0)
+    assert evaluate([reading(3, spo2=90)], cache, index, T0 + 1)[0] == []
+    assert len(evaluate([reading(3, spo2=90)], cache, index, T0 + WINDOW - 59)[0]) == 1
+
+
+# --- AlertRulesEngine across processes -------------------------------------
+
+class FakeAlertsDatabase:
+    """The thresholds and alerts tables as seen by every writer process."""
+
+    def __init__(self):
+        self.alerts = []  # (alert_id, patient_id, alert_type, threshold, acknowledged)
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        if "FROM thresholds" in sql:
+            return FakeResult([(len(THRESHOLDS), 1)] if "COUNT(*)" in sql else THRESHOLDS)
+        if "MAX(alert_id)" in sql:
+            acknowledged = [a for a in self.alerts if a[4]]
+            return FakeResult([(max((a[0] for a in self.alerts), default=None), len(acknowledged), None)])
+        if "GROUP BY patient_id, alert_type, threshold" in sql:
+            keys = {}
+            for _, patient_id, alert_type, threshold, acknowledged in self.alerts:
+                age_us, was_acknowledged = keys.get((patient_id, alert_type, threshold), (None, 0))
+                keys[(patient_id, alert_type, threshold)] = (
+                    age_us if acknowledged else 1_000_000, max(was_acknowledged, int(acknowledged))
+                )
+            return FakeResult([(*key, age_us, acknowledged) for key, (age_us, acknowledged) in keys.items()])
+        if sql.startswith("INSERT INTO alerts"):
+            for i in range(len(params) // 4):
+                self.alerts.append((
+                    len(self.alerts) + 1, params[f"patient_id_{i}"], params[f"alert_type_{i}"],
+                    params[f"threshold_{i}"], False
+                ))
+        return FakeResult([])
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchone(self):
+        return self.rows[0]
+
+    def fetchall(self):
+        return self.rows
+
+
+def test_memory_dedupe_sees_alerts_of_other_processes():
+    database = FakeAlertsDatabase()
+    api_worker, simulator = AlertRulesEngine(dedupe_mode="memory"), AlertRulesEngine(dedupe_mode="memory")
+
+    api_worker.apply_sync(database, [reading(heart_rate=160)]).commit()
+    simulator.apply_sync(database, [reading(heart_rate=160)]).commit()
+    assert len(database.alerts) == 1
+
+    # Acknowledged through the API worker: the simulator's index follows
+    alert_id, patient_id, alert_type, threshold, _ = database.alerts[0]
+    database.alerts[0] = (alert_id, patient_id, alert_type, threshold, True)
+    simulator.apply_sync(database, [reading(heart_rate=160)]).commit()
+    assert len(database.alerts) == 1
+    assert simulator.index.get_stats(time.time())["disarmed"] == 1
@@ -0,0 +1,78 @@
+"""
+Unit tests for the per-client outbound queue (app/websocket/client_connection.py)
+"""
+import json
+
+from app.websocket.client_connection import (
+    OVERFLOW_COALESCE,
+    OVERFLOW_DROP_OLDEST,
+    STREAM_DELTA,
+    ClientConnection,
+    OutboundMessage,
+)
+
+TIMESTAMP = "2024-01-01T00:00:00"
+
+
+def make_client(policy: str, max_queue: int = 2) -> ClientConnection:
+    client = ClientConnection(None, max_queue, policy, send_timeout=1.0, on_dead=lambda ws: None)
+    client.stream_mode = STREAM_DELTA
+    return client
+
+
+def reading(patient_id: int, vitals_id: int, heart_rate: int) -> dict:
+    return {"patient_id": patient_id, "vitals_id": vitals_id, "ts": None, "heart_rate": heart_rate, "spo2": 98}
+
+
+def render(client: ClientConnection) -> dict:
+    """Rebuild what the dashboard shows from the queued frames (like useWebSocket)."""
+    shown = {}
+    for message in client.queue:
+        frame = json.loads(message.data)
+        if frame["type"] not in ("vitals_update", "vitals_delta"):
+            continue
+        for row in frame["data"]:
+            keyframe = row.pop("keyframe", False)
+            previous = {} if keyframe or frame["type"] == "vitals_update" else shown.get(row["patient_id"], {})
+            shown[row["patient_id"]] = {**previous, **row}
+    return shown
+
+
+def broadcast(client: ClientConnection, rows: list, seq: int):
+    client.enqueue(client.make_delta(rows, TIMESTAMP, seq))
+
+
+def test_drop_oldest_rekeys_queued_deltas():
+    client = make_client(OVERFLOW_DROP_OLDEST)
+    for seq, heart_rate in enumerate([80, 90, 90, 95], start=1):
+        broadcast(client, [reading(1, seq, heart_rate)], seq)
+
+    assert client.dropped == 2
+    first = json.loads(client.queue[0].data)["data"][0]
+    assert first["keyframe"] is True
+    assert render(client)[1]["heart_rate"] == 95
+    # Deltas keep building on what the client actually received
+    broadcast(client, [reading(1, 5, 95)], 5)
+    assert render(client)[1]["heart_rate"] == 95
+
+
+def test_drop_oldest_keyframes_next_broadcast_when_nothing_queued():
+    client = make_client(OVERFLOW_DROP_OLDEST, max_queue=1)
+    broadcast(client, [reading(1, 1, 80)], 1)
+    broadcast(client, [reading(2, 2, 70)], 2)  # Drops patient 1's only frame
+
+    broadcast(client, [reading(1, 3, 80)], 3)
+    last = json.loads(client.queue[-1].data)["data"][0]
+    assert last["keyframe"] is True
+    assert last["heart_rate"] == 80
+
+
+def test_coalesce_keeps_alerts_in_order():
+    client = make_client(OVERFLOW_COALESCE, max_queue=3)
+    broadcast(client, [reading(1, 1, 80)], 1)
+    client.enqueue(OutboundMessage(data=json.dumps({"type": "alert_created", "seq": 2}), seq=2))
+    broadcast(client, [reading(1, 3, 150)], 3)
+    broadcast(client, [reading(1, 4, 160)], 4)
+
+    assert [message.seq for message in client.queue] == [1, 2, 4]
+    assert render(client)[1]["heart_rate"] == 160
@@ -0,0 +1,88 @@
+"""
+Unit tests for the poller cluster relay (app/websocket/cluster.py)
+"""
+import asyncio
+
+from app.websocket import cluster as cluster_module
+from app.websocket.cluster import PollerCluster, decode_ipc
+
+
+class FakeManager:
+    relay = None
+
+
+def make_cluster(tmp_path, publish_buffer: int = 10) -> PollerCluster:
+    return PollerCluster(
+        FakeManager(),
+        lock_path=str(tmp_path / "poller.lock"),
+        socket_path=str(tmp_path / "poller.sock"),
+        retry_interval=0.1,
+        publish_buffer=publish_buffer,
+    )
+
+
+def alert(alert_id: int) -> dict:
+    return {"kind": "all", "message": {"type": "alert_created", "alert": {"alert_id": alert_id}}}
+
+
+async def read_messages(reader: asyncio.StreamReader, count: int) -> list:
+    return [decode_ipc(await asyncio.wait_for(reader.readline(), 2)) for _ in range(count)]
+
+
+def test_follower_flushes_broadcasts_made_before_joining(tmp_path):
+    async def scenario():
+        member = make_cluster(tmp_path)
+        member.publish(alert(1))
+        member.publish(alert(2))
+        assert member.get_stats()["publish_pending"] == 2
+
+        received = asyncio.Queue()
+
+        async def leader(reader, writer):
+            for message in await read_messages(reader, 2):
+                received.put_nowait(message)
+
+        server = await asyncio.start_unix_server(leader, path=member.socket_path)
+        follow = asyncio.create_task(member._follow())
+        messages = [await asyncio.wait_for(received.get(), 2) for _ in range(2)]
+        follow.cancel()
+        server.close()
+        return member, messages
+
+    member, messages = asyncio.run(scenario())
+    assert [message["message"]["alert"]["alert_id"] for message in messages] == [1, 2]
+    assert member.get_stats()["publish_pending"] == 0
+
+
+def test_new_leader_replays_held_broadcasts_to_followers(tmp_path, monkeypatch):
+    async def start_vitals_feed(manager, **cursors):
+        pass
+
+    monkeypatch.setattr(cluster_module, "start_vitals_feed", start_vitals_feed)
+
+    async def scenario():
+        member = make_cluster(tmp_path)
+        member.publish(alert(7))
+        lead = asyncio.create_task(member._lead())
+        while member.role != cluster_module.ROLE_LEADER:
+            await asyncio.sleep(0.01)
+        reader, writer = await asyncio.open_unix_connection(member.socket_path)
+        [message] = await read_messages(reader, 1)
+        writer.close()
+        lead.cancel()
+        member._close_links()
+        return message
+
+    message = asyncio.run(scenario())
+    assert message["message"]["alert"]["alert_id"] == 7
+
+
+def test_overflow_drops_oldest_and_counts(tmp_path):
+    member = make_cluster(tmp_path, publish_buffer=2)
+    for alert_id in (1, 2, 3):
+        member.publish(alert(alert_id))
+
+    stats = member.get_stats()
+    assert stats["publish_pending"] == 2
+    assert stats["publish_dropped"] == 1
+    assert [decode_ipc(line)["message"]["alert"]["alert_id"] for line in member._pending] == [2, 3]
@@ -0,0 +1,54 @@
+"""
+Unit tests for the SQL statement statistics (app/db/query_stats.py)
+"""
+import pytest
+from sqlalchemy import create_engine, text
+from app.db import query_stats
+from app.db.query_stats import QueryStats, instrument_engine, normalize_statement
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    stats = QueryStats()
+    monkeypatch.setattr(query_stats, "_stats", stats)
+    monkeypatch.setattr(query_stats, "QUERY_STATS", True)
+    return stats
+
+
+@pytest.fixture
+def engine(stats):
+    engine = create_engine("sqlite://")
+    instrument_engine(engine, "test")
+    yield engine
+    engine.dispose()
+
+
+def test_normalize_collapses_values_and_in_lists():
+    assert normalize_statement("SELECT * FROM t WHERE a = 5 AND b IN (1, 2, 3)") == \
+        "SELECT * FROM t WHERE a = ? AND b IN (...)"
+    assert normalize_statement("INSERT INTO t VALUES (%s, %s, NOW()), (%s, %s, NOW())") == \
+        "INSERT INTO t VALUES (?, ?, NOW()), ..."
+
+
+def test_records_successful_statement(stats, engine):
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        assert conn.info["query_start"] == []
+
+    [entry] = [entry for entry in stats.top(order_by="count") if entry["statement"] == "SELECT ?"]
+    assert entry["count"] == 1
+    assert entry["errors"] == 0
+
+
+def test_failed_statement_is_recorded_and_start_popped(stats, engine):
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(Exception):
+                conn.execute(text("SELECT * FROM missing_table WHERE id = 7"))
+        # One start time per execution, none left behind by the failures
+        assert conn.info["query_start"] == []
+
+    [entry] = stats.top(order_by="errors", limit=1)
+    assert entry["statement"] == "SELECT * FROM missing_table WHERE id = ?"
+    assert entry["count"] == 3
+    assert entry["errors"] == 3
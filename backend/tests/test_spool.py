@@ -0,0 +1,96 @@
+"""
+Unit tests for the vitals spool drainer (app/db/spool.py)
+"""
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+from sqlalchemy.exc import OperationalError
+from app.db import spool as spool_module
+from app.db.spool import VitalsSpool
+
+
+class FakeResult:
+    def scalar(self):
+        return 0
+
+
+class FakeConnection:
+    """Drain connection that fails inserts as told by `fail(rows)`."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def execute(self, statement, params=None):
+        if "INSERT INTO vitals" in str(statement):
+            error = self.engine.fail(params)
+            if error is not None:
+                raise OperationalError("INSERT INTO vitals", params, Exception(*error))
+            self.engine.inserted.extend(params)
+        elif "ingest_spool_checkpoints" in str(statement) and params.get("last_seq") is not None:
+            self.engine.checkpoints.append(params["last_seq"])
+        return FakeResult()
+
+    @contextmanager
+    def begin_nested(self):
+        yield self
+
+
+class FakeEngine:
+    def __init__(self, fail):
+        self.fail = fail
+        self.inserted = []
+        self.checkpoints = []
+
+    @contextmanager
+    def connect(self):
+        yield FakeConnection(self)
+
+    @contextmanager
+    def begin(self):
+        yield FakeConnection(self)
+
+
+@pytest.fixture
+def make_spool(tmp_path, monkeypatch):
+    monkeypatch.setattr(spool_module, "app_admission_check_sync", lambda conn: False)
+    monkeypatch.setattr(spool_module, "app_alerts_sync", lambda conn: False)
+
+    def make(fail):
+        engine = FakeEngine(fail)
+        monkeypatch.setattr(spool_module, "get_engine", lambda: engine)
+        spool = VitalsSpool(str(tmp_path / "0"), fsync=False)
+        for patient_id in (1, 2, 3):
+            spool.append([{"patient_id": patient_id, "ts": datetime(2024, 1, 1)}])
+        return spool, engine
+
+    return make
+
+
+@pytest.mark.parametrize("code", [1213, 1053, 1205, 1290])
+def test_transient_error_keeps_frames_pending(make_spool, tmp_path, code):
+    spool, engine = make_spool(lambda rows: (code, "transient"))
+    spool.drain()  # Not running: one attempt, then gives up
+
+    assert spool.checkpoint == 0
+    assert engine.checkpoints == []
+    assert spool.rows_rejected == 0
+    assert not (tmp_path / "0" / "rejected.jsonl").exists()
+    assert spool.db_healthy is False
+    assert "transient" in spool.last_error
+
+
+def test_row_rejection_isolates_offending_row(make_spool, tmp_path):
+    def fail(rows):
+        if any(row["patient_id"] == 2 for row in rows):
+            return 1644, "No active admission"
+        return None
+
+    spool, engine = make_spool(fail)
+    spool.drain()
+
+    assert spool.checkpoint == 3
+    assert engine.checkpoints == [3]
+    assert [row["patient_id"] for row in engine.inserted] == [1, 3]
+    assert spool.rows_rejected == 1
+    assert "No active admission" in (tmp_path / "0" / "rejected.jsonl").read_text()
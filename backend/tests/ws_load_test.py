@@ -0,0 +1,517 @@
+"""
+WebSocket fan-out load test for /ws/vitals
+
+Opens clients against /ws/vitals in steps (--ramp-step every --step-seconds
+up to --clients, then holds for --hold seconds) while a paced writer inserts
+vitals at --write-rate rows/sec. Each written reading carries
+{"bench": <run id>, "seq": n, "sent_at": <epoch seconds>} in its metadata.
+Clients decode every vitals frame and record the time from insert to receipt.
+
+Reported per ramp step:
+- insert-to-screen latency percentiles (HDR-style histogram)
+- frames and readings per second per client
+- dropped readings: readings written after a client was ready for its
+  patients that it never received (counted after a settle period). Frame
+  seq gaps are not counted: seqs are shared by every broadcast kind,
+  including staff-only alert events a client is never sent, so a gap does
+  not mean a dropped frame
+- server memory (RSS of --server-pid and its children, Linux only)
+- the tester's own event-loop lag; if it is high, the tester is the
+  bottleneck and the latencies are not the server's
+
+Clients either get every update (firehose, the default) or subscribe to
+--subscribe random patients out of --patient-ids. The writer goes through
+POST /api/vitals (--writer api) or straight to MySQL through the simulator's
+db_writer (--writer db). All patients written must be admitted.
+
+Usage:
+    python tests/ws_load_test.py --clients 2000 --ramp-step 250 --step-seconds 10 \\
+        --write-rate 200 --patient-ids 1-100 --subscribe 5 --server-pid $(pgrep -of "uvicorn app.main")
+"""
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import threading
+import time
+import uuid
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+import httpx
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from load_test import LatencyHistogram, acquire_token, parse_patient_ids
+
+WRITER_TICK_HZ = 10
+SETTLE_SECONDS = 3.0
+LOOP_LAG_INTERVAL = 0.1
+
+
+class BenchClient:
+    """One WebSocket client and what it received."""
+
+    def __init__(self, client_id: int, patient_ids: Optional[List[int]]):
+        """
+        Args:
+            client_id: Client number
+            patient_ids: Patients to subscribe to (None = firehose)
+        """
+        self.client_id = client_id
+        self.patient_ids = patient_ids
+        self.first_seq: Optional[int] = None  # First writer seq the client is expected to see
+        self.frames = 0
+        self.readings = 0
+        self.foreign_readings = 0
+        self.closed: Optional[str] = None
+
+
+def process_rss_mb(pid: Optional[int]) -> Optional[float]:
+    """
+    Get the resident memory of a process and its descendants.
+
+    Args:
+        pid: Process ID (e.g. the uvicorn master)
+
+    Returns:
+        RSS in MB, or None if /proc is not available
+    """
+    if not pid:
+        return None
+    total_kb = 0
+    pending = [pid]
+    try:
+        while pending:
+            current = pending.pop()
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        break
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+    except (OSError, ValueError):
+        return None if total_kb == 0 else total_kb / 1024
+    return total_kb / 1024
+
+
+def frame_rows(frame: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Rows of a vitals_update frame, row-oriented or columnar."""
+    if frame.get("format") == "columnar":
+        columns = frame.get("columns") or {}
+        return [{name: values[i] for name, values in columns.items()} for i in range(frame.get("count", 0))]
+    return frame.get("data") or []
+
+
+def bench_marker(row: Dict[str, Any], run_id: str) -> Optional[Dict[str, Any]]:
+    """The bench metadata of a row written by this run, or None."""
+    metadata = row.get("metadata")
+    if isinstance(metadata, str):
+        try:
+            metadata = json.loads(metadata)
+        except ValueError:
+            return None
+    if isinstance(metadata, dict) and metadata.get("bench") == run_id:
+        return metadata
+    return None
+
+
+class WriterLog:
+    """Writer seq -> patient, to work out what each client should have received."""
+
+    def __init__(self):
+        self.next_seq = 0
+        self.patients: List[int] = []
+        self.by_patient: Dict[int, List[int]] = {}
+        self.lock = threading.Lock()
+
+    def take(self, patient_ids: List[int]) -> int:
+        """Reserve seqs for a batch; returns the first one."""
+        with self.lock:
+            first = self.next_seq
+            for patient_id in patient_ids:
+                self.by_patient.setdefault(patient_id, []).append(self.next_seq)
+                self.patients.append(patient_id)
+                self.next_seq += 1
+            return first
+
+    def expected(self, client: BenchClient, last_seq: int) -> int:
+        """Readings with seq in [client.first_seq, last_seq] for the client's patients."""
+        if client.first_seq is None or last_seq < client.first_seq:
+            return 0
+        if client.patient_ids is None:
+            return last_seq - client.first_seq + 1
+        return sum(
+            bisect_right(seqs, last_seq) - bisect_left(seqs, client.first_seq)
+            for seqs in (self.by_patient.get(patient_id, []) for patient_id in client.patient_ids)
+        )
+
+
+class WsLoadTest:
+    """Ramp WebSocket clients while a paced writer inserts vitals."""
+
+    def __init__(self, args):
+        self.args = args
+        self.run_id = uuid.uuid4().hex[:12]
+        self.patient_ids = parse_patient_ids(args.patient_ids)
+        self.rng = random.Random(args.seed)
+        self.log = WriterLog()
+        self.clients: List[BenchClient] = []
+        self.steps: List[Dict[str, Any]] = []
+        self.step_latency = LatencyHistogram()
+        self.overall_latency = LatencyHistogram()
+        self.loop_lag = 0.0
+        self.connect_failures = 0
+        self.write_errors = 0
+        self.running = True
+        self.token: Optional[str] = None
+
+        base = args.url.replace("http://", "ws://", 1).replace("https://", "wss://", 1)
+        self.ws_url = f"{base}/ws/vitals?encoding={args.encoding}"
+
+    # ------------------------------------------------------------------
+    # Writer
+    # ------------------------------------------------------------------
+
+    def _rows(self, count: int, cursor: int) -> List[Dict[str, Any]]:
+        """Next count readings, patients round-robin, stamped just before the write."""
+        patient_ids = [self.patient_ids[(cursor + i) % len(self.patient_ids)] for i in range(count)]
+        first = self.log.take(patient_ids)
+        sent_at = time.time()
+        return [
+            {
+                "patient_id": patient_id,
+                "device_id": None,
+                "heart_rate": self.rng.randint(60, 120),
+                "spo2": self.rng.randint(95, 100),
+                "bp_systolic": self.rng.randint(100, 140),
+                "bp_diastolic": self.rng.randint(60, 90),
+                "temperature_c": round(self.rng.uniform(36.0, 38.5), 2),
+                "respiration": self.rng.randint(12, 20),
+                "metadata": {"bench": self.run_id, "seq": first + i, "sent_at": sent_at},
+            }
+            for i, patient_id in enumerate(patient_ids)
+        ]
+
+    async def _api_writer(self, client: httpx.AsyncClient):
+        """Write through POST /api/vitals on an absolute schedule."""
+        tick = 1.0 / WRITER_TICK_HZ
+        start = time.perf_counter()
+        written = 0
+        next_tick = start
+        while self.running:
+            due = int(self.args.write_rate * (time.perf_counter() - start)) - written
+            if due > 0:
+                rows = self._rows(due, written)
+                written += due
+                try:
+                    response = await client.post(
+                        "/api/vitals",
+                        json=rows,
+                        headers={"Authorization": f"Bearer {self.token}"}
+                    )
+                    if response.status_code >= 300 or response.json().get("rejected"):
+                        self.write_errors += 1
+                except Exception:
+                    self.write_errors += 1
+            next_tick += tick
+            await asyncio.sleep(max(0.0, next_tick - time.perf_counter()))
+
+    def _db_writer(self):
+        """Write straight to MySQL through the simulator's db_writer (runs in a thread)."""
+        sys.path.insert(0, str(Path(__file__).parent.parent))
+        from simulator.db_writer import batch_insert_vitals
+
+        tick = 1.0 / WRITER_TICK_HZ
+        start = time.perf_counter()
+        written = 0
+        next_tick = start
+        while self.running:
+            due = int(self.args.write_rate * (time.perf_counter() - start)) - written
+            if due > 0:
+                rows = self._rows(due, written)
+                written += due
+                now = datetime.now()
+                for row in rows:
+                    row["ts"] = now
+                    row["metadata"] = json.dumps(row["metadata"])
+                try:
+                    batch_insert_vitals(rows, verbose=False)
+                except Exception:
+                    self.write_errors += 1
+            next_tick += tick
+            time.sleep(max(0.0, next_tick - time.perf_counter()))
+
+    # ------------------------------------------------------------------
+    # Clients
+    # ------------------------------------------------------------------
+
+    def _decode(self, message: Any) -> Optional[Dict[str, Any]]:
+        if isinstance(message, bytes):
+            return msgpack.unpackb(message) if msgpack is not None else None
+        try:
+            return json.loads(message)
+        except ValueError:
+            return None
+
+    def _on_vitals(self, client: BenchClient, frame: Dict[str, Any]):
+        received_at = time.time()
+        client.frames += 1
+        for row in frame_rows(frame):
+            marker = bench_marker(row, self.run_id)
+            if marker is None:
+                client.foreign_readings += 1
+                continue
+            if client.first_seq is None or marker["seq"] < client.first_seq:
+                continue
+            client.readings += 1
+            latency = received_at - marker["sent_at"]
+            self.step_latency.record(latency)
+            self.overall_latency.record(latency)
+
+    async def _run_client(self, client: BenchClient):
+        """Connect, subscribe and consume frames until the test ends."""
+        url = f"{self.ws_url}&token={self.token}"
+        try:
+            async with websockets.connect(url, max_size=None, open_timeout=30, ping_interval=None) as ws:
+                if client.patient_ids is not None:
+                    await ws.send(json.dumps({"action": "subscribe", "patient_ids": client.patient_ids}))
+                async for message in ws:
+                    frame = self._decode(message)
+                    if not isinstance(frame, dict):
+                        continue
+                    frame_type = frame.get("type")
+                    if frame_type in ("vitals_update", "vitals_delta"):
+                        self._on_vitals(client, frame)
+                    elif frame_type == "ping":
+                        await ws.send(json.dumps({"action": "pong"}))
+                    elif frame_type == "auth_ok" and client.patient_ids is None:
+                        client.first_seq = self.log.next_seq
+                    elif frame_type == "subscribed":
+                        client.first_seq = self.log.next_seq
+                    elif frame_type == "error":
+                        client.closed = frame.get("detail")
+                    if not self.running:
+                        break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if client.first_seq is None:
+                self.connect_failures += 1
+            client.closed = client.closed or str(e)
+
+    async def _monitor_loop_lag(self):
+        """Track how late this process's event loop wakes up."""
+        while self.running:
+            before = time.perf_counter()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            self.loop_lag = max(self.loop_lag, time.perf_counter() - before - LOOP_LAG_INTERVAL)
+
+    # ------------------------------------------------------------------
+    # Run
+    # ------------------------------------------------------------------
+
+    def _step_report(self, started: float, frames_before: Dict[int, int], readings_before: Dict[int, int]) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - started
+        ready = [c for c in self.clients if c.first_seq is not None and c.closed is None]
+        frame_rates = [(c.frames - frames_before.get(c.client_id, 0)) / elapsed for c in ready]
+        reading_rates = [(c.readings - readings_before.get(c.client_id, 0)) / elapsed for c in ready]
+        report = {
+            "clients": len(self.clients),
+            "clients_ready": len(ready),
+            "clients_closed": sum(1 for c in self.clients if c.closed is not None),
+            "seconds": elapsed,
+            "server_rss_mb": process_rss_mb(self.args.server_pid),
+            "frames_per_sec_per_client": {
+                "min": min(frame_rates, default=0),
+                "mean": sum(frame_rates) / len(frame_rates) if frame_rates else 0,
+                "max": max(frame_rates, default=0),
+            },
+            "readings_per_sec_per_client": {
+                "min": min(reading_rates, default=0),
+                "mean": sum(reading_rates) / len(reading_rates) if reading_rates else 0,
+                "max": max(reading_rates, default=0),
+            },
+            "latency": self.step_latency.to_dict(),
+            "tester_loop_lag_ms": self.loop_lag * 1000,
+        }
+        p = report["latency"]["percentiles_ms"]
+        rss = report["server_rss_mb"]
+        print(
+            f"📊 {len(ready):>6} clients | RSS {f'{rss:.0f} MB' if rss is not None else 'n/a':>8} | "
+            f"p50 {p['p50']:.1f} ms p99 {p['p99']:.1f} ms max {report['latency']['max_ms']:.1f} ms | "
+            f"{report['frames_per_sec_per_client']['mean']:.1f} frames/s/client | "
+            f"loop lag {report['tester_loop_lag_ms']:.0f} ms"
+        )
+        self.step_latency = LatencyHistogram()
+        self.loop_lag = 0.0
+        return report
+
+    def _choose_patients(self) -> Optional[List[int]]:
+        if not self.args.subscribe:
+            return None
+        return self.rng.sample(self.patient_ids, min(self.args.subscribe, len(self.patient_ids)))
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        Run the ramp and collect results.
+
+        Returns:
+            Dictionary with the configuration, per-step reports and totals
+        """
+        args = self.args
+        print(f"🚀 Starting WebSocket load test (run {self.run_id})")
+        print(f"   URL: {self.ws_url}")
+        print(f"   Clients: {args.clients} in steps of {args.ramp_step} every {args.step_seconds:.0f}s, hold {args.hold:.0f}s")
+        print(f"   Writer: {args.write_rate:.0f} rows/sec via {args.writer} over {len(self.patient_ids)} patient(s)")
+        print(f"   Subscription: {f'{args.subscribe} patient(s) per client' if args.subscribe else 'firehose'}")
+
+        async with httpx.AsyncClient(base_url=args.url, timeout=30.0) as http:
+            email, password = args.user.split(":", 1)
+            self.token = await acquire_token(http, email, password)
+
+            tasks: List[asyncio.Task] = [asyncio.create_task(self._monitor_loop_lag())]
+            writer_thread = None
+            if args.writer == "db":
+                writer_thread = threading.Thread(target=self._db_writer, daemon=True)
+                writer_thread.start()
+            else:
+                tasks.append(asyncio.create_task(self._api_writer(http)))
+
+            client_tasks: List[asyncio.Task] = []
+            while len(self.clients) < args.clients or args.hold > 0:
+                holding = len(self.clients) >= args.clients
+                if not holding:
+                    for _ in range(min(args.ramp_step, args.clients - len(self.clients))):
+                        client = BenchClient(len(self.clients), self._choose_patients())
+                        self.clients.append(client)
+                        client_tasks.append(asyncio.create_task(self._run_client(client)))
+                started = time.perf_counter()
+                frames_before = {c.client_id: c.frames for c in self.clients}
+                readings_before = {c.client_id: c.readings for c in self.clients}
+                await asyncio.sleep(args.hold if holding else args.step_seconds)
+                self.steps.append(self._step_report(started, frames_before, readings_before))
+                if holding:
+                    break
+
+            # Stop writing, then give in-flight readings time to arrive
+            last_seq = self.log.next_seq - 1
+            self.running = False
+            if writer_thread:
+                writer_thread.join()
+            await asyncio.sleep(SETTLE_SECONDS)
+            for task in client_tasks + tasks:
+                task.cancel()
+            await asyncio.gather(*client_tasks, *tasks, return_exceptions=True)
+
+        expected = sum(self.log.expected(c, last_seq) for c in self.clients)
+        received = sum(c.readings for c in self.clients)
+        results = {
+            "config": {
+                "url": args.url,
+                "clients": args.clients,
+                "ramp_step": args.ramp_step,
+                "step_seconds": args.step_seconds,
+                "hold": args.hold,
+                "write_rate": args.write_rate,
+                "writer": args.writer,
+                "patients": len(self.patient_ids),
+                "subscribe": args.subscribe,
+                "encoding": args.encoding,
+            },
+            "rows_written": self.log.next_seq,
+            "write_errors": self.write_errors,
+            "connect_failures": self.connect_failures,
+            "clients_closed": sum(1 for c in self.clients if c.closed is not None),
+            "readings_expected": expected,
+            "readings_received": received,
+            "readings_dropped": max(0, expected - received),
+            "latency": self.overall_latency.to_dict(),
+            "steps": self.steps,
+        }
+        return results
+
+
+def print_results(results: Dict[str, Any]):
+    """Print WebSocket load test totals."""
+    print("\n" + "="*60)
+    print("WEBSOCKET LOAD TEST RESULTS")
+    print("="*60)
+    print(f"Rows Written: {results['rows_written']} (write errors: {results['write_errors']})")
+    print(f"Connect Failures: {results['connect_failures']} | Clients Closed: {results['clients_closed']}")
+    print(f"Readings: {results['readings_received']} received / {results['readings_expected']} expected "
+          f"({results['readings_dropped']} dropped)")
+    latency = results["latency"]
+    print("\nInsert-to-screen latency (ms):")
+    for key, value in latency["percentiles_ms"].items():
+        print(f"  {key:<7} {value:.2f}")
+    print(f"  max     {latency['max_ms']:.2f}")
+    print("\nRamp:")
+    print(f"  {'clients':>8} {'rss MB':>8} {'p50':>8} {'p99':>8} {'frames/s':>9} {'loop lag':>9}")
+    for step in results["steps"]:
+        rss = step["server_rss_mb"]
+        p = step["latency"]["percentiles_ms"]
+        print(
+            f"  {step['clients_ready']:>8} {f'{rss:.0f}' if rss is not None else 'n/a':>8} {p['p50']:>8.1f} "
+            f"{p['p99']:>8.1f} {step['frames_per_sec_per_client']['mean']:>9.1f} {step['tester_loop_lag_ms']:>9.0f}"
+        )
+    print("="*60)
+
+
+def raise_fd_limit():
+    """Raise the open-file limit to the hard limit (one socket per client)."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+async def main():
+    """Main WebSocket load test function."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load test the /ws/vitals fan-out")
+    parser.add_argument("--url", type=str, default="http://localhost:3001", help="Base API URL")
+    parser.add_argument("--clients", type=int, default=500, help="Total WebSocket clients")
+    parser.add_argument("--ramp-step", type=int, default=100, help="Clients added per step")
+    parser.add_argument("--step-seconds", type=float, default=10, help="Seconds per ramp step")
+    parser.add_argument("--hold", type=float, default=30, help="Seconds to hold at full client count")
+    parser.add_argument("--write-rate", type=float, default=100, help="Vitals rows written per second")
+    parser.add_argument("--writer", choices=["api", "db"], default="api", help="Write through POST /api/vitals or db_writer")
+    parser.add_argument("--patient-ids", type=str, default="1-50", help="Admitted patients to write for, e.g. 1-50")
+    parser.add_argument("--subscribe", type=int, default=0, help="Patients each client subscribes to (0 = firehose)")
+    parser.add_argument("--encoding", type=str, default="json", help="Frame encoding (json, msgpack, columnar, columnar_msgpack)")
+    parser.add_argument("--user", type=str, default="admin@example.com:password123", help="Staff credentials as email:password")
+    parser.add_argument("--server-pid", type=int, default=None, help="API server PID for memory sampling")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed")
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON")
+    args = parser.parse_args()
+
+    if websockets is None:
+        raise RuntimeError("The WebSocket load test requires websockets (pip install websockets)")
+    if args.encoding in ("msgpack", "columnar_msgpack") and msgpack is None:
+        raise RuntimeError(f"Encoding {args.encoding} requires msgpack (pip install msgpack)")
+
+    raise_fd_limit()
+    results = await WsLoadTest(args).run()
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
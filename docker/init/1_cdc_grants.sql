@@ -0,0 +1,4 @@
+-- Replication privileges for the optional binlog CDC feed (VITALS_SOURCE=binlog)
+-- The backend tails the binlog as a replica to push new vitals and alerts
+GRANT REPLICATION SLAVE, REPLICATION CLIENT ON *.* TO 'medql_user'@'%';
+FLUSH PRIVILEGES;
@@ -1,4 +1,5 @@
 import { useState, useEffect, useRef, useCallback } from 'react';
+import { getToken } from '../services/auth';
 
 // Use environment variable if available, otherwise default to localhost:3001
 // For Docker, use the API URL and convert to WebSocket URL
@@ -13,19 +14,98 @@ const getWebSocketUrl = () => {
 
 const WS_URL = getWebSocketUrl();
 
-export function useWebSocket() {
+// Delivered through onAlertEvent as well as lastMessage
+const ALERT_EVENT_TYPES = new Set(['alert_created', 'alert_acknowledged', 'emergency_alert']);
+
+/**
+ * Connect to /ws/vitals.
+ * @param {Object} [options]
+ * @param {'assigned'|Array<number>} [options.subscribe] - Patients to receive updates for.
+ *   'assigned' resolves to the logged-in staff member's patients. When omitted the
+ *   socket receives updates for every patient.
+ * @param {boolean} [options.delta] - Ask the server for delta-encoded vitals. Frames are
+ *   rebuilt into full rows here, so consumers still receive normal vitals_update messages.
+ * @param {Function} [options.onAlertEvent] - Called with every alert_created,
+ *   alert_acknowledged and emergency_alert message as it arrives. Use it instead of
+ *   lastMessage for events that must not be missed: React batches state updates, so a
+ *   message followed closely by another one can be replaced before an effect sees it.
+ * @param {Function} [options.onResync] - Called when the server cannot replay what was
+ *   missed while disconnected; the consumer should reload its data over REST.
+ *
+ * After a reconnect the hook resumes from the last frame seq it saw, so the server replays
+ * what was missed. If the gap is too old, a { type: 'resync' } message is emitted (and
+ * onResync is called). Frames whose seq is not newer than the last one seen are dropped.
+ * Subscribing sockets connect with ?firehose=0 and send the resume position on their
+ * subscribe message, so they never receive other patients' frames in between.
+ */
+export function useWebSocket(options = {}) {
     const [isConnected, setIsConnected] = useState(false);
     const [lastMessage, setLastMessage] = useState(null);
     const wsRef = useRef(null);
     const reconnectTimeoutRef = useRef(null);
+    const subscribeRef = useRef(options.subscribe);
+    subscribeRef.current = options.subscribe;
+    const subscribeKey = JSON.stringify(options.subscribe ?? null);
+    const deltaRef = useRef(Boolean(options.delta));
+    const onAlertEventRef = useRef(options.onAlertEvent);
+    onAlertEventRef.current = options.onAlertEvent;
+    const onResyncRef = useRef(options.onResync);
+    onResyncRef.current = options.onResync;
+    // patient_id -> last full row, used to rebuild delta frames
+    const patientRowsRef = useRef(new Map());
+    // Replay position: server epoch and last seq received
+    const epochRef = useRef(null);
+    const lastSeqRef = useRef(null);
+
+    // Merge a vitals_delta frame into full rows
+    const applyDelta = useCallback((frame) => {
+        const rows = frame.data.map((row) => {
+            const previous = row.keyframe ? {} : (patientRowsRef.current.get(row.patient_id) || {});
+            const { keyframe, ...fields } = row;
+            const merged = { ...previous, ...fields };
+            patientRowsRef.current.set(row.patient_id, merged);
+            return merged;
+        });
+        return { type: 'vitals_update', count: rows.length, data: rows, timestamp: frame.timestamp };
+    }, []);
+
+    // Authenticate and (re)subscribe on an open socket; with resume, also ask for the
+    // frames missed while disconnected (replayed right after subscribing)
+    const sendSubscription = useCallback((ws, resume = false) => {
+        const subscribe = subscribeRef.current;
+        if (!subscribe || ws.readyState !== WebSocket.OPEN) return;
+        const token = getToken();
+        if (!token) return;
+        ws.send(JSON.stringify({ action: 'auth', token }));
+        ws.send(JSON.stringify({ action: 'unsubscribe' }));
+        const request = subscribe === 'assigned'
+            ? { action: 'subscribe', scope: 'assigned' }
+            : { action: 'subscribe', patient_ids: subscribe.map(Number) };
+        if (resume && epochRef.current && lastSeqRef.current !== null) {
+            request.resume_from = lastSeqRef.current;
+            request.epoch = epochRef.current;
+        }
+        ws.send(JSON.stringify(request));
+    }, []);
 
     const connect = useCallback(() => {
         try {
-            const ws = new WebSocket(WS_URL);
+            // Announce a subscription so the server does not send the firehose meanwhile
+            const ws = new WebSocket(subscribeRef.current ? `${WS_URL}?firehose=0` : WS_URL);
 
             ws.onopen = () => {
                 console.log('WebSocket Connected');
                 setIsConnected(true);
+                if (deltaRef.current) {
+                    patientRowsRef.current = new Map();
+                    ws.send(JSON.stringify({ action: 'set_stream', mode: 'delta' }));
+                }
+                if (subscribeRef.current) {
+                    sendSubscription(ws, true);
+                } else if (epochRef.current && lastSeqRef.current !== null) {
+                    // Ask for the frames missed while disconnected
+                    ws.send(JSON.stringify({ action: 'resume', resume_from: lastSeqRef.current, epoch: epochRef.current }));
+                }
                 // Clear any reconnect timeout
                 if (reconnectTimeoutRef.current) {
                     clearTimeout(reconnectTimeoutRef.current);
@@ -36,7 +116,44 @@ export function useWebSocket() {
             ws.onmessage = (event) => {
                 try {
                     const data = JSON.parse(event.data);
+                    // Answer server heartbeats so the connection is not reaped
+                    if (data.type === 'ping') {
+                        ws.send(JSON.stringify({ action: 'pong' }));
+                        return;
+                    }
+                    if (data.type === 'hello') {
+                        // A new epoch means the server restarted; seqs start over
+                        if (data.epoch !== epochRef.current) {
+                            epochRef.current = data.epoch;
+                            lastSeqRef.current = data.seq;
+                        }
+                        return;
+                    }
+                    if (data.type === 'resync') {
+                        lastSeqRef.current = data.seq;
+                    } else if (data.type === 'resumed') {
+                        // Replay done: the position is the server's latest seq
+                        lastSeqRef.current = Math.max(lastSeqRef.current ?? data.seq, data.seq);
+                    } else if (typeof data.seq === 'number') {
+                        // Already seen (e.g. replayed twice): applying it again would go back in time
+                        if (lastSeqRef.current !== null && data.seq <= lastSeqRef.current) return;
+                        lastSeqRef.current = data.seq;
+                    }
                     console.log('WebSocket message received:', data);
+                    if (ALERT_EVENT_TYPES.has(data.type) && onAlertEventRef.current) {
+                        onAlertEventRef.current(data);
+                    }
+                    if (data.type === 'resync' && onResyncRef.current) {
+                        onResyncRef.current(data);
+                    }
+                    if (data.type === 'vitals_delta') {
+                        setLastMessage(applyDelta(data));
+                        return;
+                    }
+                    // Full rows (e.g. coalesced frames) also refresh the delta base
+                    if (data.type === 'vitals_update' && Array.isArray(data.data)) {
+                        data.data.forEach((row) => patientRowsRef.current.set(row.patient_id, row));
+                    }
                     setLastMessage(data);
                 } catch (e) {
                     console.error('Error parsing WebSocket message:', e);
@@ -62,7 +179,7 @@ export function useWebSocket() {
         } catch (error) {
             console.error('WebSocket Connection Error:', error);
         }
-    }, []);
+    }, [sendSubscription, applyDelta]);
 
     useEffect(() => {
         connect();
@@ -77,6 +194,13 @@ export function useWebSocket() {
         };
     }, [connect]);
 
+    // Re-subscribe when the requested patients change
+    useEffect(() => {
+        if (wsRef.current) {
+            sendSubscription(wsRef.current);
+        }
+    }, [subscribeKey, sendSubscription]);
+
     const sendMessage = useCallback((message) => {
         if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
             wsRef.current.send(JSON.stringify(message));
@@ -1,6 +1,6 @@
 "use client";
 import Link from "next/link";
-import { useState, useEffect, useMemo } from "react";
+import { useState, useEffect, useMemo, useCallback } from "react";
 import ProtectedRoute from "../../../components/ProtectedRoute";
 import { getPatients, getPatientHistory, getThresholds, updateThreshold, deletePatient, getAllUnacknowledgedAlerts, acknowledgeAlert, getPatientSummary, getPatientDailyStats } from "../../services/api";
 import { useWebSocket } from "../../hooks/useWebSocket";
@@ -61,6 +61,66 @@ function determineStatus(heartRate, spo2, thresholds = []) {
   return { status: "Stable", priority: 3 };
 }
 
+// Convert a database alert (REST or WebSocket alert_created) to frontend format
+function formatDatabaseAlert(alert) {
+  // Extract time from created_at - database stores time in GMT+7 (Vietnam timezone)
+  // Display time directly from database (already in GMT+7)
+  let timeStr = '';
+  if (alert.created_at) {
+    const created_at_str = String(alert.created_at);
+    // Handle both ISO format (2025-12-21T07:28:30.970555) and space-separated format
+    if (created_at_str.includes('T')) {
+      // ISO format: extract time part after 'T'
+      timeStr = created_at_str.split('T')[1].substring(0, 8); // Get HH:MM:SS
+    } else if (created_at_str.includes(' ')) {
+      // Space-separated format: extract time part after space
+      timeStr = created_at_str.split(' ')[1].substring(0, 8); // Get HH:MM:SS
+    } else {
+      // Fallback: try to extract time pattern
+      const timeMatch = created_at_str.match(/(\d{2}):(\d{2}):(\d{2})/);
+      if (timeMatch) {
+        timeStr = timeMatch[0];
+      } else {
+        timeStr = created_at_str.substring(11, 19); // Try substring method
+      }
+    }
+  }
+
+  // Map alert_type to severity
+  const severityMap = {
+    'warning': 'Warning',
+    'critical': 'Critical',
+    'emergency': 'Critical'
+  };
+
+  // Map threshold to alert type
+  const typeMap = {
+    'heart_rate': 'Tachycardia/Bradycardia',
+    'spo2': 'Low SpO2',
+    'bp_systolic': 'High/Low Systolic BP',
+    'bp_diastolic': 'High/Low Diastolic BP',
+    'temperature_c': 'Temperature Alert',
+    'respiration': 'Respiration Alert'
+  };
+
+  const alertType = alert.threshold ? typeMap[alert.threshold] || alert.threshold : 'Emergency Help Request';
+
+  return {
+    id: `db-${alert.alert_id}`,
+    alert_id: alert.alert_id, // Store database alert_id for acknowledgment
+    type: alertType,
+    patient: alert.patient_name || `Patient ${alert.patient_id}`,
+    severity: severityMap[alert.alert_type] || 'Critical',
+    time: timeStr,
+    timestamp: alert.created_at,
+    desc: alert.message,
+    patient_id: alert.patient_id,
+    threshold: alert.threshold,
+    acknowledged_at: alert.acknowledged_at, // Store acknowledged_at to check if acknowledged
+    fromDatabase: true // Flag to identify database alerts
+  };
+}
+
 export default function StaffPage() {
   const [patients, setPatients] = useState([]);
   const [alerts, setAlerts] = useState([]);
@@ -70,7 +130,38 @@ export default function StaffPage() {
   const [editFormData, setEditFormData] = useState({ min_value: null, max_value: null });
   const [loading, setLoading] = useState(true);
   const [saving, setSaving] = useState(false);
-  const { lastMessage } = useWebSocket();
+  const [resyncKey, setResyncKey] = useState(0); // Bumped when missed live updates cannot be replayed
+
+  // Apply live alert events as they arrive (not through lastMessage, where a
+  // vitals frame right behind an alert would replace it before an effect runs)
+  const handleAlertEvent = useCallback((message) => {
+    if (!message.alert) return;
+
+    if (message.type === "alert_created") {
+      const created = formatDatabaseAlert(message.alert);
+      setAlerts(prev => prev.some(a => a.alert_id === created.alert_id) ? prev : [created, ...prev]);
+    } else if (message.type === "alert_acknowledged") {
+      const { alert_id, acknowledged_at } = message.alert;
+      setAlerts(prev => prev.map(a => a.alert_id === alert_id ? { ...a, acknowledged_at } : a));
+    } else if (message.type === "emergency_alert") {
+      // Already formatted by the server; the same row may also arrive as alert_created
+      const { alert_id } = message.alert;
+      const emergency = alert_id
+        ? { ...message.alert, id: `db-${alert_id}`, fromDatabase: true, acknowledged_at: null }
+        : message.alert;
+      setAlerts(prev => prev.some(a => a.id === emergency.id) ? prev : [emergency, ...prev]);
+    }
+  }, []);
+
+  // The server could not replay what was missed while disconnected: reload
+  const handleResync = useCallback(() => setResyncKey(key => key + 1), []);
+
+  const { lastMessage } = useWebSocket({
+    subscribe: 'assigned',
+    delta: true,
+    onAlertEvent: handleAlertEvent,
+    onResync: handleResync,
+  });
   const [acknowledgedAlerts, setAcknowledgedAlerts] = useState(new Set()); // Track acknowledged alert IDs
   const [viewAllAlertsOpen, setViewAllAlertsOpen] = useState(false); // Modal state for viewing all alerts
   const [warningPatientsCount, setWarningPatientsCount] = useState(0); // Count of patients in warning state (updated every 1 minute)
@@ -112,86 +203,23 @@ export default function StaffPage() {
     fetchThresholdsData();
   }, []);
 
-  // Fetch alerts from database - ONLY source for live alerts
+  // Load alerts from the database once (and again after a WebSocket resync);
+  // new alerts and acknowledgements then arrive as alert_created / alert_acknowledged
   useEffect(() => {
     async function fetchDatabaseAlerts() {
       try {
         const dbAlerts = await getAllUnacknowledgedAlerts();
         console.log("📋 Fetched alerts from database:", dbAlerts.length);
         
-        // Convert database alerts to frontend format
-        const formattedAlerts = dbAlerts.map(alert => {
-          // Extract time from created_at - database stores time in GMT+7 (Vietnam timezone)
-          // Display time directly from database (already in GMT+7)
-          let timeStr = '';
-          if (alert.created_at) {
-            const created_at_str = String(alert.created_at);
-            // Handle both ISO format (2025-12-21T07:28:30.970555) and space-separated format
-            if (created_at_str.includes('T')) {
-              // ISO format: extract time part after 'T'
-              timeStr = created_at_str.split('T')[1].substring(0, 8); // Get HH:MM:SS
-            } else if (created_at_str.includes(' ')) {
-              // Space-separated format: extract time part after space
-              timeStr = created_at_str.split(' ')[1].substring(0, 8); // Get HH:MM:SS
-            } else {
-              // Fallback: try to extract time pattern
-              const timeMatch = created_at_str.match(/(\d{2}):(\d{2}):(\d{2})/);
-              if (timeMatch) {
-                timeStr = timeMatch[0];
-              } else {
-                timeStr = created_at_str.substring(11, 19); // Try substring method
-              }
-            }
-          }
-          
-          // Map alert_type to severity
-          const severityMap = {
-            'warning': 'Warning',
-            'critical': 'Critical',
-            'emergency': 'Critical'
-          };
-          
-          // Map threshold to alert type
-          const typeMap = {
-            'heart_rate': 'Tachycardia/Bradycardia',
-            'spo2': 'Low SpO2',
-            'bp_systolic': 'High/Low Systolic BP',
-            'bp_diastolic': 'High/Low Diastolic BP',
-            'temperature_c': 'Temperature Alert',
-            'respiration': 'Respiration Alert'
-          };
-          
-          const alertType = alert.threshold ? typeMap[alert.threshold] || alert.threshold : 'Emergency Help Request';
-          
-          return {
-            id: `db-${alert.alert_id}`,
-            alert_id: alert.alert_id, // Store database alert_id for acknowledgment
-            type: alertType,
-            patient: alert.patient_name || `Patient ${alert.patient_id}`,
-            severity: severityMap[alert.alert_type] || 'Critical',
-            time: timeStr,
-            timestamp: alert.created_at,
-            desc: alert.message,
-            patient_id: alert.patient_id,
-            threshold: alert.threshold,
-            acknowledged_at: alert.acknowledged_at, // Store acknowledged_at to check if acknowledged
-            fromDatabase: true // Flag to identify database alerts
-          };
-        });
-        
         // Replace all alerts with database alerts (including acknowledged ones)
-        setAlerts(formattedAlerts);
+        setAlerts(dbAlerts.map(formatDatabaseAlert));
       } catch (error) {
         console.error("Error fetching database alerts:", error);
       }
     }
     
     fetchDatabaseAlerts();
-    
-    // Refresh alerts from database every 1 second
-    const interval = setInterval(fetchDatabaseAlerts, 1000);
-    return () => clearInterval(interval);
-  }, []);
+  }, [resyncKey]);
 
   // Fetch patients and their latest vitals
   useEffect(() => {
@@ -301,7 +329,7 @@ export default function StaffPage() {
     return () => {
       isMounted = false;
     };
-  }, [thresholds, acknowledgedAlerts]);
+  }, [thresholds, acknowledgedAlerts, resyncKey]);
 
   // Handle WebSocket updates for real-time vitals
   // Note: Alerts are now ONLY fetched from database, not generated from WebSocket messages
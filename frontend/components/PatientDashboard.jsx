@@ -496,7 +496,7 @@ export default function PatientDashboard({ patientId, isStaffView, onStatusChang
     const [thresholds, setThresholds] = useState([]);
     const [alerts, setAlerts] = useState([]);
     const [device, setDevice] = useState({ device_type: null, serial_number: null, manufacturer: null });
-    const { lastMessage } = useWebSocket();
+    const { lastMessage } = useWebSocket({ subscribe: [patientId], delta: true });
 
     // Fetch thresholds
     useEffect(() => {